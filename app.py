@@ -1,13 +1,24 @@
 import datetime
-from flask import Flask, request, render_template, jsonify, send_file, redirect, url_for, session, flash
+from flask import Flask, Response, request, render_template, jsonify, send_file, redirect, url_for, session, flash
 import os
 import glob
 import json
 import uuid
+from collections import Counter, deque
+from contextlib import closing
+from itertools import islice
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from analyzer import LogAnalyzer
+from checkpoints import CheckpointStore
+from jobs import CANCELLED, COMPLETED, FAILED, FINISH_EVENTS, FINISHED, JobQueue, JobQueueFull
+from log_parsers import LogParser
+from log_sources import list_logs, log_exists, logical_logs, open_log, rotation_members, stored_size
+from network_stats import NetworkStats
 from report_generator import generate_report
+from timestamps import TimestampParser, isoformat
+from upload_store import UploadNotFound, UploadOutOfOrder, UploadStore
 from dotenv import load_dotenv
+from werkzeug.http import parse_content_range_header
 from alert import send_discord_notification
 
 # Make sure the template folder is correctly set
@@ -15,7 +26,7 @@ app = Flask(__name__,
             template_folder=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates'),
             static_folder=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static'))
 app.secret_key = os.environ.get("SECRET_KEY", "dev_key_replace_in_production")
-# Set maximum upload file size to 16 MB
+# Set maximum upload file size to 16 MB; larger files are uploaded in chunks (see /uploads)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 
 # Debug information to help troubleshoot
@@ -41,6 +52,22 @@ if not os.path.exists(UPLOAD_FOLDER):
 if not os.path.exists(REPORTS_FOLDER):
     os.makedirs(REPORTS_FOLDER)
 
+# How far each log file has been analyzed, for incremental analysis
+checkpoints = CheckpointStore()
+
+# Uploads are stored once per content, with the findings of their analyses
+uploads = UploadStore(UPLOAD_FOLDER)
+
+# Analyses run in the background on a bounded pool of workers
+analysis_jobs = JobQueue()
+# Seconds between keepalive comments on idle job event streams
+SSE_KEEPALIVE_SECONDS = 15
+
+# Lines of a log read by one search, context lines shown around a match, and bytes of a log previewed
+MAX_SEARCH_LINES = int(os.environ.get("MAX_SEARCH_LINES", 1000000))
+MAX_CONTEXT_LINES = 50
+PREVIEW_BYTES = 1024 * 1024
+
 # Simple user class for demonstration
 class User(UserMixin):
     def __init__(self, id, username, email, password, is_admin=False):
@@ -410,6 +437,10 @@ def analyze():
         log_filename = request.form.get('log_files')  # For when a filename is passed instead of a file
         format_type = request.form.get('format', 'html')
         search_query = request.form.get('search', '')
+        # Only analyze what was appended to the files since their last analysis
+        incremental = request.form.get('incremental', '').lower() in ('1', 'true', 'on', 'yes')
+        # Collapse repetitive lines into templates before they are sent to the model
+        mine_templates = request.form.get('mine_templates', '').lower() in ('1', 'true', 'on', 'yes')
         
         # Get API key from form or environment
         api_key = request.form.get('api_key') or os.environ.get("API_KEY", "")
@@ -436,122 +467,352 @@ def analyze():
             flash(f"No write permission to the upload directory", "danger")
             return jsonify({"error": f"No write permission to the upload directory: {UPLOAD_FOLDER}"}), 500
         
-        results = []
         uploaded_files = []
         
-        # Initialize the analyzer
-        try:
-            analyzer = LogAnalyzer(api_key)
-        except Exception as e:
-            app.logger.error(f"Failed to initialize log analyzer: {str(e)}")
-            flash(f"Failed to initialize log analyzer: {str(e)}", "danger")
-            return jsonify({"error": f"Failed to initialize log analyzer: {str(e)}"}), 500
-        
         # Handle when log files are uploaded directly
         if log_files and log_files[0].filename:
             for log_file in log_files:
                 if log_file.filename:
                     try:
-                        # Sanitize filename to prevent path traversal
-                        filename = os.path.basename(log_file.filename)
-                        log_file_path = os.path.join(UPLOAD_FOLDER, filename)
-                        
-                        # Save the file
-                        app.logger.info(f"Saving uploaded file to: {log_file_path}")
-                        log_file.save(log_file_path)
-                        uploaded_files.append(log_file_path)
-                        
-                        # Analyze the file
-                        app.logger.info(f"Analyzing file: {log_file_path}")
-                        file_results = analyzer.analyze_file(log_file_path)
-                        results.extend(file_results)
+                        # Stored by content hash and linked in under its base name
+                        saved = uploads.save(log_file.filename, log_file.stream)
+                        app.logger.info(f"Saved uploaded file to: {saved['path']} ({saved['hash']})")
+                        uploaded_files.append(saved['path'])
                     except Exception as e:
                         app.logger.error(f"Error processing file {log_file.filename}: {str(e)}")
                         flash(f"Error processing file {log_file.filename}: {str(e)}", "danger")
                         return jsonify({"error": f"Error processing file {log_file.filename}: {str(e)}"}), 500
+            # Members of a rotated series are analyzed as one log
+            uploaded_files = logical_logs(uploaded_files)
         # Handle when log filename is provided instead of file upload
         elif log_filename:
             log_file_path = os.path.join(UPLOAD_FOLDER, os.path.basename(log_filename))
-            if os.path.exists(log_file_path):
-                try:
-                    uploaded_files.append(log_file_path)
-                    app.logger.info(f"Analyzing file: {log_file_path}")
-                    file_results = analyzer.analyze_file(log_file_path)
-                    results.extend(file_results)
-                except Exception as e:
-                    app.logger.error(f"Error analyzing file {log_filename}: {str(e)}")
-                    flash(f"Error analyzing file {log_filename}: {str(e)}", "danger")
-                    return jsonify({"error": f"Error analyzing file {log_filename}: {str(e)}"}), 500
-            else:
+            if not log_exists(log_file_path):
                 flash(f"Log file not found: {log_filename}", "danger")
                 return jsonify({"error": f"Log file not found: {log_filename}"}), 404
+            uploaded_files.append(log_file_path)
         else:
             flash("No log files uploaded or specified", "danger")
             return jsonify({"error": "No log files uploaded or specified"}), 400
-
-        # Generate timestamp for unique report name
-        from datetime import datetime
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_file = f'{REPORTS_FOLDER}/report_{timestamp}.{format_type}'
         
-        # Ensure reports directory exists
-        if not os.path.exists(REPORTS_FOLDER):
-            try:
-                os.makedirs(REPORTS_FOLDER)
-            except Exception as e:
-                app.logger.error(f"Failed to create reports directory: {str(e)}")
-                flash(f"Failed to create reports directory: {str(e)}", "danger")
-                return jsonify({"error": f"Failed to create reports directory: {str(e)}"}), 500
+        server_name = request.host_url.rstrip('/')
         
-        # Generate report
-        try:
-            generate_report(results, output_file, format_type)
-        except Exception as e:
-            app.logger.error(f"Failed to generate report: {str(e)}")
-            flash(f"Failed to generate report: {str(e)}", "danger")
-            return jsonify({"error": f"Failed to generate report: {str(e)}"}), 500
-        
-        # Return summary stats along with the report path
-        severity_count = {"critical": 0, "high": 0, "medium": 0, "low": 0, "info": 0}
-        for threat in results:
-            severity = threat.get('severity', 'low')
-            severity_count[severity] = severity_count.get(severity, 0) + 1
-        
-        result_data = {
-            "message": "Analysis complete", 
-            "output_file": output_file,
-            "total_threats": len(results),
-            "severity_count": severity_count,
-            "analyzed_files": len(uploaded_files)
-        }
+        # The analysis runs on the job queue, also for content analyzed before, as hashing the
+        # files and writing its report read them in full; the response only carries its id
+        def run(job):
+            return _run_analysis(job, api_key, uploaded_files, format_type, incremental, discord_webhook,
+                                 server_name, mine_templates)
         
-        # Send Discord notification if webhook URL is provided
-        if discord_webhook:
-            try:
-                # Create a URL that can be used to access the report
-                server_name = request.host_url.rstrip('/')
-                report_url = f"{server_name}/{output_file}"
-                dashboard_url = f"{server_name}/"
-                
-                # Send the notification
-                send_discord_notification(
-                    discord_webhook, 
-                    result_data, 
-                    report_url,
-                    dashboard_url
-                )
-            except Exception as e:
-                app.logger.error(f"Error sending Discord notification: {str(e)}")
-                # Don't fail the entire request if notification fails
+        try:
+            job = analysis_jobs.submit(run, f"Analyze {', '.join(os.path.basename(f) for f in uploaded_files)}")
+        except JobQueueFull as e:
+            return jsonify({"error": f"Too many analyses waiting, try again later: {str(e)}"}), 503
+        job.update(files_total=len(uploaded_files))
+        app.logger.info(f"Queued analysis job {job.id} for {len(uploaded_files)} file(s)")
         
-        flash(f"Analysis complete. Found {len(results)} potential issues.", "success")
-        return jsonify(result_data)
+        return jsonify({
+            "message": "Analysis queued",
+            "job_id": job.id,
+            "status": job.status,
+            "status_url": url_for('job_status', job_id=job.id),
+            "result_url": url_for('job_result', job_id=job.id)
+        }), 202
         
     except Exception as e:
         app.logger.error(f"Unexpected error in analyze route: {str(e)}")
         flash(f"An unexpected error occurred: {str(e)}", "danger")
         return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
 
+def _run_analysis(job, api_key, log_files, format_type, incremental, discord_webhook, server_name,
+                  mine_templates=False):
+    """Analyze ``log_files`` for an analysis job and write their report.
+    
+    Returns the summary that the job's result endpoint serves.
+    """
+    # Filled during the analysis pass and written into JSON reports
+    network_stats = NetworkStats()
+    
+    def on_progress(event, details):
+        if event == 'chunk':
+            progress = job.advance(chunks_done=1)
+        else:
+            progress = job.advance(files_done=1, threats=details['threats'])
+        job.publish(event, {**details, 'progress': progress})
+    
+    def on_threat(threat):
+        job.publish('threat', threat)
+    
+    # Uploads are often many small per-service logs, pack them into shared requests
+    analyzer = LogAnalyzer(api_key, batch_files=True, mine_templates=mine_templates, on_progress=on_progress)
+    
+    # Analyze all files concurrently
+    app.logger.info(f"Analyzing {len(log_files)} file(s) for job {job.id}")
+    results = []
+    new_results = []
+    if incremental:
+        new_results.extend(job.run_coroutine(analyzer.service, analyzer.analyze_files_async(
+            log_files, checkpoints=checkpoints, on_threat=on_threat, network_stats=network_stats)))
+        # Incremental reports cover everything found in the files so far
+        for log_file_path in log_files:
+            results.extend(checkpoints.load_findings(log_file_path))
+        # Analysis errors are not stored with the findings
+        results.extend(threat for threat in new_results if threat.get('rule_id') == 'ERROR')
+    else:
+        # Files analyzed before with the same settings are not sent again
+        version = analyzer.results_version()
+        hashes, stored = _stored_findings(log_files, version)
+        for log_file, threats in stored.items():
+            for threat in threats:
+                on_threat(threat)
+            if format_type == 'json':
+                network_stats.scan_file(log_file)
+            on_progress('file', {'file': log_file, 'threats': len(threats)})
+        
+        pending = [log_file for log_file in log_files if log_file not in stored]
+        analyzed = {log_file: [] for log_file in pending}
+        if pending:
+            for threat in job.run_coroutine(analyzer.service, analyzer.analyze_files_async(
+                    pending, on_threat=on_threat, network_stats=network_stats)):
+                analyzed.setdefault(threat.get('file'), []).append(threat)
+        for log_file in pending:
+            # Failed analyses are tried again next time
+            if log_file in hashes and not any(threat.get('rule_id') == 'ERROR' for threat in analyzed[log_file]):
+                uploads.save_findings(hashes[log_file], version, analyzed[log_file])
+        
+        for log_file in log_files:
+            results.extend(stored.get(log_file) or analyzed.pop(log_file, []))
+        # Findings attributed to no analyzed file
+        for threats in analyzed.values():
+            results.extend(threats)
+    job.check_cancelled()
+    
+    return _write_analysis_report(job.id[:8], log_files, results, new_results, network_stats, format_type,
+                                  incremental, discord_webhook, server_name)
+
+def _stored_findings(log_files, version):
+    """Content hashes of ``log_files``, and the stored findings of those analyzed before with ``version``."""
+    hashes = {}
+    stored = {}
+    for log_file in log_files:
+        try:
+            hashes[log_file] = uploads.log_hash(log_file)
+        except OSError as e:
+            app.logger.error(f"Error hashing {log_file}: {str(e)}")
+            continue
+        threats = uploads.get_findings(hashes[log_file], version)
+        if threats is not None:
+            # The content may have been uploaded under another name
+            stored[log_file] = [dict(threat, file=log_file) for threat in threats]
+    return hashes, stored
+
+def _write_analysis_report(report_id, log_files, results, new_results, network_stats, format_type, incremental,
+                           discord_webhook, server_name):
+    """Write the report of an analysis and return its summary."""
+    # Timestamp and report id make the report name unique
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_file = f'{REPORTS_FOLDER}/report_{timestamp}_{report_id}.{format_type}'
+    os.makedirs(REPORTS_FOLDER, exist_ok=True)
+    generate_report(results, output_file, format_type, network_stats.to_dict())
+    
+    # Return summary stats along with the report path
+    severity_count = {"critical": 0, "high": 0, "medium": 0, "low": 0, "info": 0}
+    for threat in results:
+        severity = threat.get('severity', 'low')
+        severity_count[severity] = severity_count.get(severity, 0) + 1
+    
+    result_data = {
+        "message": "Analysis complete", 
+        "output_file": output_file,
+        "total_threats": len(results),
+        "severity_count": severity_count,
+        "analyzed_files": len(log_files)
+    }
+    if incremental:
+        result_data["new_threats"] = len(new_results)
+    
+    # Send Discord notification if webhook URL is provided
+    if discord_webhook:
+        try:
+            # Create a URL that can be used to access the report
+            report_url = f"{server_name}/{output_file}"
+            dashboard_url = f"{server_name}/"
+            
+            # Send the notification
+            send_discord_notification(
+                discord_webhook, 
+                result_data, 
+                report_url,
+                dashboard_url
+            )
+        except Exception as e:
+            app.logger.error(f"Error sending Discord notification: {str(e)}")
+            # Don't fail the analysis if notification fails
+    
+    return result_data
+
+@app.route('/jobs')
+@login_required
+def list_jobs():
+    """Recent analysis jobs with their status and progress."""
+    return jsonify({"jobs": [job.to_dict() for job in analysis_jobs.list()]})
+
+@app.route('/jobs/<job_id>')
+@login_required
+def job_status(job_id):
+    """Status and progress (files and chunks done) of an analysis job."""
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job: {job_id}"}), 404
+    return jsonify(job.to_dict())
+
+def _sse(event, data, event_id=None):
+    """One Server-Sent Event with JSON data."""
+    message = f"id: {event_id}\n" if event_id is not None else ""
+    return message + f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@app.route('/jobs/<job_id>/events')
+@login_required
+def job_events(job_id):
+    """Server-Sent Events of an analysis job as it runs.
+    
+    The stream starts with a ``status`` snapshot, then sends ``chunk`` and
+    ``file`` events with the progress, a ``threat`` event for every threat
+    as it is found, and ends with ``done`` carrying the summary (or
+    ``failed``/``cancelled``). Reconnecting clients resume after their
+    Last-Event-ID.
+    """
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job: {job_id}"}), 404
+    try:
+        last_event = int(request.headers.get('Last-Event-ID') or request.args.get('after', 0))
+    except ValueError:
+        last_event = 0
+    final_events = set(FINISH_EVENTS.values())
+    
+    def stream():
+        yield _sse('status', job.to_dict())
+        after = last_event
+        while True:
+            events = job.wait_events(after, timeout=SSE_KEEPALIVE_SECONDS)
+            if not events:
+                status = job.to_dict()
+                if status['status'] in FINISHED:
+                    # Clients that reconnect after the end still need to hear it, or they keep reconnecting
+                    final = job.result if status['status'] == COMPLETED else {'job_id': job.id, 'error': status['error']}
+                    yield _sse(FINISH_EVENTS[status['status']], final)
+                    return
+                yield ": keepalive\n\n"
+                continue
+            for event_id, event, data in events:
+                yield _sse(event, data, event_id)
+                after = event_id
+                if event in final_events:
+                    return
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_job(job_id):
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job: {job_id}"}), 404
+    if not job.cancel():
+        return jsonify({"error": f"Job {job_id} has already finished", **job.to_dict()}), 409
+    log_activity('cancel_analysis', {'job_id': job_id})
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/result')
+@login_required
+def job_result(job_id):
+    """The summary ``/analyze`` used to return, once the job has completed."""
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job: {job_id}"}), 404
+    status = job.to_dict()
+    if status['status'] == COMPLETED:
+        return jsonify(job.result)
+    if status['status'] == FAILED:
+        return jsonify({"error": f"Analysis failed: {status['error']}", **status}), 500
+    if status['status'] == CANCELLED:
+        return jsonify({"error": "Analysis was cancelled", **status}), 409
+    # Still queued or running
+    return jsonify(status), 202
+
+def _log_search_filters(form):
+    """Structured filters of a log search form.
+    
+    Returns the column filters for ``RecordBatch.where`` (ip, method, path,
+    user, status) and the ``since``/``until`` epoch seconds of the
+    ``date_from``/``date_to`` dates (YYYY-MM-DD, whole days in UTC).
+    """
+    filters = {}
+    for field in ('ip', 'method', 'path', 'user', 'status'):
+        value = form.get(field, '').strip()
+        if value:
+            filters[field] = value
+    if 'method' in filters:
+        filters['method'] = filters['method'].upper()
+    if 'status' in filters:
+        try:
+            filters['status'] = int(filters['status'])
+        except ValueError:
+            # Matches no line
+            filters['status'] = -1
+    
+    since = until = None
+    try:
+        if form.get('date_from'):
+            since = int(datetime.datetime.strptime(form['date_from'], '%Y-%m-%d')
+                        .replace(tzinfo=datetime.timezone.utc).timestamp())
+        if form.get('date_to'):
+            until = int(datetime.datetime.strptime(form['date_to'], '%Y-%m-%d')
+                        .replace(tzinfo=datetime.timezone.utc).timestamp()) + 86399
+    except ValueError:
+        pass
+    return filters, since, until
+
+def _search_lines(log_file, filters, since=None, until=None, context=0):
+    """Lines of a log that pass structured filters, with up to ``context`` lines around each.
+    
+    The log is read once, as a stream, and at most ``MAX_SEARCH_LINES`` of
+    its lines. With filters it is parsed into columnar batches and the
+    filters are applied to the columns. Yields ``(index, line, before,
+    after)`` with indexes from 0 and the lines decoded.
+    """
+    context = max(0, min(context, MAX_CONTEXT_LINES))
+    
+    def lines():
+        if not filters and since is None and until is None:
+            with open_log(log_file) as f:
+                for line in f:
+                    yield line, True
+            return
+        for batch in LogParser().parse_file(log_file):
+            allowed = set(batch.where(since=since, until=until, **filters))
+            for row, line in enumerate(batch.lines):
+                yield line, row in allowed
+    
+    before = deque(maxlen=context)
+    # Selected lines still waiting for the lines after them
+    waiting = deque()
+    for index, (raw, allowed) in enumerate(islice(lines(), MAX_SEARCH_LINES)):
+        line = raw.decode('utf-8', errors='ignore')
+        for item in waiting:
+            item[3].append(line)
+        while waiting and len(waiting[0][3]) >= context:
+            yield waiting.popleft()
+        if allowed:
+            item = (index, line, list(before), [])
+            if context:
+                waiting.append(item)
+            else:
+                yield item
+        before.append(line)
+    yield from waiting
+
 @app.route('/search_logs', methods=['POST'])
 @login_required
 def search_logs():
@@ -610,7 +871,7 @@ def search_logs():
         
         # Now search directly through log files
         import re
-        log_files = glob.glob(f'{UPLOAD_FOLDER}/*.log')
+        log_files = list_logs(UPLOAD_FOLDER)
         log_search_options = {
             'keywords': search_query,
             'case_sensitive': request.form.get('case_sensitive', 'false').lower() == 'true',
@@ -620,6 +881,9 @@ def search_logs():
             'context_lines': int(request.form.get('context_lines', 0)),
             'max_results': int(request.form.get('max_results', 1000))
         }
+        # ip, method, path, user, status and date range, matched on parsed fields
+        field_filters, since, until = _log_search_filters(request.form)
+        has_field_filters = bool(field_filters) or since is not None or until is not None
         
         for log_file in log_files:
             try:
@@ -631,13 +895,15 @@ def search_logs():
                 if file_requested and file_requested.lower() != file_basename.lower():
                     continue
                     
-                with open(log_file, 'r', encoding='utf-8', errors='ignore') as f:
-                    log_content = f.readlines()
-                    
+                # Lines are streamed with their context; closing stops reading the log
+                with closing(_search_lines(log_file, field_filters, since, until,
+                                           log_search_options['context_lines'])) as log_lines:
                     # Skip if no search query for log files and no other filters
-                    if not log_search_options['keywords'] and not log_search_options['log_level']:
+                    if not log_search_options['keywords'] and not log_search_options['log_level'] and not has_field_filters:
                         continue
                     
+                    timestamps = TimestampParser()
+                    
                     # Prepare regex pattern if needed
                     pattern = None
                     if log_search_options['keywords']:
@@ -650,11 +916,8 @@ def search_logs():
                                 # If regex is invalid, fall back to normal search
                                 pattern = None
                         
-                    # Track context lines
-                    context_lines = log_search_options['context_lines']
-                    
                     # Search each line for matching terms
-                    for i, line in enumerate(log_content):
+                    for i, line, before_context, after_context in log_lines:
                         matched = False
                         match_text = None
                         
@@ -684,28 +947,17 @@ def search_logs():
                                 else:
                                     matched = search_terms.lower() in line.lower()
                                 match_text = line.strip()
+                        elif has_field_filters:
+                            # The structured filters alone select the line
+                            matched = True
+                            match_text = line.strip()
                         
                         # If we have a match (both on keywords and log level if specified)
                         if matched and level_matched:
                             match_count += 1
                             
-                            # Get context lines before
-                            before_context = []
-                            if context_lines > 0:
-                                start_idx = max(0, i - context_lines)
-                                before_context = log_content[start_idx:i]
-                            
-                            # Get context lines after
-                            after_context = []
-                            if context_lines > 0:
-                                end_idx = min(len(log_content), i + context_lines + 1)
-                                after_context = log_content[i+1:end_idx]
-                            
-                            # Extract timestamp if present in the line
-                            timestamp = None
-                            timestamp_match = re.search(r'\d{4}-\d{2}-\d{2}[T\s]\d{2}:\d{2}:\d{2}', line)
-                            if timestamp_match:
-                                timestamp = timestamp_match.group(0)
+                            # Timestamp by the layout learned for this file
+                            ts = timestamps.parse(line)
                             
                             # Create a "log entry" result
                             results.append({
@@ -716,7 +968,8 @@ def search_logs():
                                 'line_num': i + 1,
                                 'file': log_file,
                                 'matched': match_text or line.strip(),
-                                'timestamp': timestamp or datetime.datetime.now().isoformat(),
+                                'timestamp': isoformat(ts) if ts is not None else datetime.datetime.now().isoformat(),
+                                'ts': ts,
                                 'description': f'Found matching log entry in file {file_basename}',
                                 'remediation': 'Review the log entry for potential issues',
                                 'report_file': None,
@@ -738,32 +991,24 @@ def search_logs():
         # Sort results by severity and then by detection time (newest first)
         severity_order = {'critical': 0, 'high': 1, 'medium': 2, 'low': 3, 'info': 4}
         
-        # Safe sorting function that handles invalid timestamps
+        # Report detection times share one layout, so they are parsed from cached prefixes
+        result_times = TimestampParser()
+        oldest = 946684800  # 2000-01-01, for results without a valid time
+        
         def sort_key(x):
             severity = severity_order.get(x.get('severity', 'low'), 5)
             
-            # Default timestamp if not found or invalid
-            timestamp_value = '2000-01-01T00:00:00'
-            
-            # Try detection_time first, then timestamp
-            for key in ['detection_time', 'timestamp']:
-                if key in x and x[key]:
-                    try:
-                        # Try to parse the timestamp - use the raw value if it works
-                        timestamp_value = x[key]
-                        # Just validate it parses correctly
-                        datetime.datetime.fromisoformat(timestamp_value)
-                        break
-                    except (ValueError, TypeError):
-                        # If parsing fails, continue to next timestamp field or use default
-                        continue
+            # Log matches carry epoch seconds; try detection_time, then timestamp for the rest
+            ts = x.get('ts')
+            if ts is None:
+                for key in ['detection_time', 'timestamp']:
+                    if isinstance(x.get(key), str):
+                        ts = result_times.parse(x[key])
+                        if ts is not None:
+                            break
             
-            # Return tuple for sorting (severity first, then negative timestamp for descending order)
-            try:
-                return (severity, -float(datetime.datetime.fromisoformat(timestamp_value).timestamp()))
-            except (ValueError, TypeError):
-                # If all fails, use a very old timestamp value
-                return (severity, float(datetime.datetime(2000, 1, 1).timestamp()))
+            # Severity first, then newest first
+            return (severity, -(ts if ts is not None else oldest))
         
         # Sort using the safe sort key function
         results.sort(key=sort_key)
@@ -797,8 +1042,12 @@ def search_logs_only():
             "error": "API key is missing. Please provide an API key or set it in the .env file."
         }), 400
     
+    # ip, method, path, user, status and date range, matched on parsed fields
+    field_filters, since, until = _log_search_filters(request.form)
+    has_field_filters = bool(field_filters) or since is not None or until is not None
+    
     # Return early if no search query provided
-    if not search_query:
+    if not search_query and not has_field_filters:
         return jsonify({
             "results": [],
             "total": 0,
@@ -819,8 +1068,8 @@ def search_logs_only():
     
     results = []
     
-    # Get all log files in the uploads directory
-    log_files = glob.glob(f'{UPLOAD_FOLDER}/*.log')
+    # Get all log files in the uploads directory, a rotated series counting as one
+    log_files = list_logs(UPLOAD_FOLDER)
     if not log_files:
         return jsonify({
             "results": [],
@@ -845,11 +1094,14 @@ def search_logs_only():
             searched_files += 1
             match_count = 0
             
-            with open(log_file, 'r', encoding='utf-8', errors='ignore') as f:
-                log_content = f.readlines()
+            # Lines are streamed with their context; closing stops reading the log
+            with closing(_search_lines(log_file, field_filters, since, until,
+                                       log_search_options['context_lines'])) as log_lines:
+                timestamps = TimestampParser()
                 
-                # Prepare regex pattern if needed
+                # Prepare regex pattern if needed; without keywords every filtered line matches
                 pattern = None
+                search_terms = ''
                 if log_search_options['keywords']:
                     search_terms = log_search_options['keywords']
                     
@@ -861,7 +1113,7 @@ def search_logs_only():
                             pattern = None
                 
                 # Search each line for matching terms
-                for i, line in enumerate(log_content):
+                for i, line, before_context, after_context in log_lines:
                     matched = False
                     match_text = None
                     
@@ -896,23 +1148,8 @@ def search_logs_only():
                         match_count += 1
                         total_matches += 1
                         
-                        # Get context lines before
-                        before_context = []
-                        if log_search_options['context_lines'] > 0:
-                            start_idx = max(0, i - log_search_options['context_lines'])
-                            before_context = log_content[start_idx:i]
-                        
-                        # Get context lines after
-                        after_context = []
-                        if log_search_options['context_lines'] > 0:
-                            end_idx = min(len(log_content), i + log_search_options['context_lines'] + 1)
-                            after_context = log_content[i+1:end_idx]
-                        
-                        # Extract timestamp if present in the line
-                        timestamp = None
-                        timestamp_match = re.search(r'\d{4}-\d{2}-\d{2}[T\s]\d{2}:\d{2}:\d{2}', line)
-                        if timestamp_match:
-                            timestamp = timestamp_match.group(0)
+                        # Timestamp by the layout learned for this file
+                        ts = timestamps.parse(line)
                         
                         # Create a "log entry" result
                         results.append({
@@ -923,7 +1160,8 @@ def search_logs_only():
                             'line_num': i + 1,
                             'file': log_file,
                             'matched': match_text or line.strip(),
-                            'timestamp': timestamp or datetime.now().isoformat(),
+                            'timestamp': isoformat(ts) if ts is not None else datetime.now().isoformat(),
+                            'ts': ts,
                             'description': f'Found matching log entry in file {file_basename}',
                             'source_type': 'log',
                             'context_before': [l.strip() for l in before_context],
@@ -953,14 +1191,17 @@ def search_logs_only():
 def list_log_files():
     """List all available log files in the uploads directory"""
     log_files = []
-    for log_file in glob.glob(f'{UPLOAD_FOLDER}/*.log'):
-        file_stats = os.stat(log_file)
+    for log_file in list_logs(UPLOAD_FOLDER):
+        # A rotated series is listed once, with the files it is made of
+        members = rotation_members(log_file)
+        member_stats = [os.stat(member) for member in members]
         log_files.append({
             'filename': os.path.basename(log_file),
             'path': log_file,
-            'size': file_stats.st_size,
-            'created': datetime.datetime.fromtimestamp(file_stats.st_ctime).isoformat(),
-            'modified': datetime.datetime.fromtimestamp(file_stats.st_mtime).isoformat(),
+            'size': sum(stats.st_size for stats in member_stats),
+            'created': datetime.datetime.fromtimestamp(min(stats.st_ctime for stats in member_stats)).isoformat(),
+            'modified': datetime.datetime.fromtimestamp(max(stats.st_mtime for stats in member_stats)).isoformat(),
+            'members': [os.path.basename(member) for member in members],
         })
     
     # Sort by creation time (newest first)
@@ -983,7 +1224,7 @@ def dashboard_data():
     severity_counts = {"critical": 0, "high": 0, "medium": 0, "low": 0, "info": 0}
     
     # Count the number of log files
-    log_files = glob.glob(f'{UPLOAD_FOLDER}/*.log')
+    log_files = list_logs(UPLOAD_FOLDER)
     log_count = len(log_files)
     
     # Count the total number of lines across all log files
@@ -992,10 +1233,10 @@ def dashboard_data():
     try:
         for log_file in log_files:
             # Add to total file size
-            total_size += os.path.getsize(log_file)
+            total_size += stored_size(log_file)
             
-            # Count lines in the file
-            with open(log_file, 'r', encoding='utf-8', errors='ignore') as f:
+            # Count lines in the file, decompressing it on the fly
+            with open_log(log_file) as f:
                 total_line_count += sum(1 for _ in f)
     except Exception as e:
         app.logger.error(f"Error counting lines in log files: {str(e)}")
@@ -1029,6 +1270,8 @@ def dashboard_data():
             "source_ips": [],
             "dest_ips": [],
             "protocols": [],
+            "unique_source_ips": None,
+            "unique_dest_ips": None,
             "total_line_count": total_line_count,
             "total_log_size": total_size
         })
@@ -1063,51 +1306,25 @@ def dashboard_data():
                     "low": random.randint(5, 15)
                 })
             
-            # Extract or generate sample data for IP charts
-            source_ips = []
-            dest_ips = []
-            protocols = []
-            
-            if 'network_stats' in report_data:
-                source_ips = report_data['network_stats'].get('source_ips', [])
-                dest_ips = report_data['network_stats'].get('dest_ips', [])
-                protocols = report_data['network_stats'].get('protocols', [])
-            else:
-                # Generate sample data if not available
-                sample_ips = ['192.168.1.1', '10.0.0.1', '172.16.0.1', '8.8.8.8', '1.1.1.1']
-                source_ips = [{"ip": ip, "count": random.randint(10, 100)} for ip in sample_ips[:5]]
-                dest_ips = [{"ip": ip, "volume": random.randint(1024, 10240)} for ip in sample_ips[:5]]
-                protocols = [
-                    {"protocol": "HTTP", "count": random.randint(50, 200)},
-                    {"protocol": "HTTPS", "count": random.randint(100, 300)},
-                    {"protocol": "DNS", "count": random.randint(20, 100)},
-                    {"protocol": "SSH", "count": random.randint(5, 50)},
-                    {"protocol": "SMTP", "count": random.randint(10, 80)}
-                ]
+            # Network statistics gathered during the analysis; older reports have none
+            network_stats = report_data.get('network_stats', {})
+            source_ips = network_stats.get('source_ips', [])
+            dest_ips = network_stats.get('dest_ips', [])
+            protocols = network_stats.get('protocols', [])
             
             # Get attack paths data - this analyzes which endpoints or paths
-            # are most frequently targeted in the detected threats
-            attack_paths = {}
-            for threat in report_data.get('threats', []):
-                # Try to extract paths from lines or matched content
-                path = None
-                if 'line' in threat:
-                    # Look for common URI patterns
-                    import re
-                    uri_match = re.search(r'(\/[\w\-\/\.]+\.\w+)', threat['line'])
-                    if uri_match:
-                        path = uri_match.group(1)
-                
-                # If we found a path, count it
-                if path:
-                    if path in attack_paths:
-                        attack_paths[path] += 1
-                    else:
-                        attack_paths[path] = 1
+            # are most frequently targeted in the detected threats. The threat
+            # lines are parsed into columns and the path column is counted.
+            threat_lines = [threat['line'].encode('utf-8', errors='replace')
+                            for threat in report_data.get('threats', []) if threat.get('line')]
+            attack_paths = Counter()
+            for batch in LogParser().parse_lines(threat_lines):
+                for path, count in batch.path.counts().items():
+                    # Count the endpoint, whatever its query string
+                    attack_paths[path.split('?', 1)[0]] += count
             
             # Convert to sorted list
-            paths_data = [{"path": k, "count": v} for k, v in attack_paths.items()]
-            paths_data = sorted(paths_data, key=lambda x: x["count"], reverse=True)[:5]
+            paths_data = [{"path": k, "count": v} for k, v in attack_paths.most_common(5)]
             
             return jsonify({
                 "threat_counts": severity_counts,
@@ -1120,6 +1337,8 @@ def dashboard_data():
                 "source_ips": source_ips,
                 "dest_ips": dest_ips,
                 "protocols": protocols,
+                "unique_source_ips": network_stats.get('unique_source_ips'),
+                "unique_dest_ips": network_stats.get('unique_dest_ips'),
                 "total_line_count": total_line_count,
                 "total_log_size": total_size
             })
@@ -1201,13 +1420,21 @@ def preview_report(filename):
 def preview_log(filename):
     file_path = os.path.join(UPLOAD_FOLDER, filename)
     
-    if not os.path.exists(file_path):
+    if not log_exists(file_path):
         return jsonify({"error": "Log file not found"}), 404
     
     try:
-        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            content = f.read()
-        return content, 200, {'Content-Type': 'text/plain'}
+        # Only the start of large logs, cut at a line end
+        with open_log(file_path) as f:
+            content = f.read(PREVIEW_BYTES + 1)
+        truncated = len(content) > PREVIEW_BYTES
+        if truncated:
+            content = content[:PREVIEW_BYTES]
+            content = content[:content.rfind(b'\n') + 1] or content
+        return content.decode('utf-8', errors='ignore'), 200, {
+            'Content-Type': 'text/plain',
+            'X-Preview-Truncated': 'true' if truncated else 'false'
+        }
     except Exception as e:
         return jsonify({"error": f"Error reading log file: {str(e)}"}), 500
 
@@ -1395,29 +1622,20 @@ def upload_logs():
         for log_file in log_files:
             if log_file and log_file.filename:
                 try:
-                    # Sanitize filename to prevent path traversal
-                    filename = os.path.basename(log_file.filename)
-                    log_file_path = os.path.join(UPLOAD_FOLDER, filename)
-                    
-                    # Save the file
-                    app.logger.info(f"Saving uploaded file to: {log_file_path}")
-                    log_file.save(log_file_path)
-                    
-                    # Get file stats
-                    file_stats = os.stat(log_file_path)
+                    # Stored by content hash and linked in under its base name
+                    saved = uploads.save(log_file.filename, log_file.stream)
+                    app.logger.info(f"Saved uploaded file to: {saved['path']} ({saved['hash']})")
+                    if saved['previous_hash']:
+                        app.logger.info(f"{saved['filename']} replaced earlier content {saved['previous_hash']}")
                     
                     # Add to the list of uploaded files
-                    uploaded_files.append({
-                        'filename': filename,
-                        'path': log_file_path,
-                        'size': file_stats.st_size,
-                        'created': datetime.datetime.fromtimestamp(file_stats.st_ctime).isoformat()
-                    })
+                    uploaded_files.append(dict(saved, created=datetime.datetime.now().isoformat()))
                     
                     # Log the activity
                     log_activity('file_upload', {
-                        'filename': filename,
-                        'size': file_stats.st_size
+                        'filename': saved['filename'],
+                        'size': saved['size'],
+                        'hash': saved['hash']
                     })
                 except Exception as e:
                     app.logger.error(f"Error processing file {log_file.filename}: {str(e)}")
@@ -1435,6 +1653,96 @@ def upload_logs():
         flash(f"An unexpected error occurred: {str(e)}", "danger")
         return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
 
+# Chunked uploads: files of any size are sent in byte ranges and can resume after a dropped connection
+@app.route('/uploads', methods=['POST'])
+@login_required
+def begin_upload():
+    """Start a chunked upload of ``filename`` with ``size`` bytes.
+    
+    The bytes are then sent with ``PUT /uploads/<id>`` in ranges of at most
+    ``chunk_size`` bytes, each with a ``Content-Range`` header, and stored
+    with ``POST /uploads/<id>/finalize``. ``GET /uploads/<id>`` tells how
+    many bytes were received, to resume an interrupted upload.
+    """
+    data = request.get_json(silent=True) or {}
+    filename = os.path.basename(str(data.get('filename') or ''))
+    if not filename:
+        return jsonify({"error": "No file name given"}), 400
+    try:
+        size = int(data.get('size'))
+        upload = uploads.begin_upload(filename, size)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid upload size: {str(e)}"}), 400
+    except OSError as e:
+        app.logger.error(f"Failed to start upload of {filename}: {str(e)}")
+        return jsonify({"error": f"Failed to start upload: {str(e)}"}), 500
+    app.logger.info(f"Started chunked upload {upload['upload_id']} of {filename} ({size} bytes)")
+    return jsonify(dict(upload, upload_url=url_for('upload_status', upload_id=upload['upload_id']))), 201
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+@login_required
+def upload_status(upload_id):
+    try:
+        return jsonify(uploads.upload_status(upload_id))
+    except UploadNotFound:
+        return jsonify({"error": f"Unknown upload: {upload_id}"}), 404
+
+@app.route('/uploads/<upload_id>', methods=['PUT'])
+@login_required
+def upload_range(upload_id):
+    """Append a byte range, given by the ``Content-Range`` header, to a chunked upload."""
+    content_range = parse_content_range_header(request.headers.get('Content-Range'))
+    if content_range is None or content_range.units != 'bytes' or content_range.start is None:
+        return jsonify({"error": "A Content-Range header such as 'bytes 0-1023/4096' is required"}), 400
+    try:
+        # The body is streamed to disk in blocks, whatever the size of the range
+        received = uploads.write_range(upload_id, content_range.start, request.stream)
+    except UploadNotFound:
+        return jsonify({"error": f"Unknown upload: {upload_id}"}), 404
+    except UploadOutOfOrder as e:
+        return jsonify({"error": str(e), "received": e.received}), 409
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except OSError as e:
+        app.logger.error(f"Failed to write upload {upload_id}: {str(e)}")
+        return jsonify({"error": f"Failed to write upload: {str(e)}"}), 500
+    return jsonify({"upload_id": upload_id, "received": received})
+
+@app.route('/uploads/<upload_id>', methods=['DELETE'])
+@login_required
+def abort_upload(upload_id):
+    try:
+        uploads.abort_upload(upload_id)
+    except UploadNotFound:
+        return jsonify({"error": f"Unknown upload: {upload_id}"}), 404
+    return jsonify({"message": "Upload discarded", "upload_id": upload_id})
+
+@app.route('/uploads/<upload_id>/finalize', methods=['POST'])
+@login_required
+def finalize_upload(upload_id):
+    """Store a completely received chunked upload like ``/upload_logs`` stores a file.
+    
+    An optional ``sha256`` in the JSON body is checked against the content.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        saved = uploads.finish_upload(upload_id, data.get('sha256'))
+    except UploadNotFound:
+        return jsonify({"error": f"Unknown upload: {upload_id}"}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except OSError as e:
+        app.logger.error(f"Failed to store upload {upload_id}: {str(e)}")
+        return jsonify({"error": f"Failed to store upload: {str(e)}"}), 500
+    
+    app.logger.info(f"Saved uploaded file to: {saved['path']} ({saved['hash']})")
+    log_activity('file_upload', {
+        'filename': saved['filename'],
+        'size': saved['size'],
+        'hash': saved['hash']
+    })
+    return jsonify(dict(saved, success=True, created=datetime.datetime.now().isoformat()))
+
 @app.route('/report_preview/<path:filename>')
 @login_required
 def report_preview_page(filename):
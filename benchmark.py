@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+import os
+import json
+import asyncio
+import time
+import random
+import argparse
+import tempfile
+from typing import Dict, Any, List
+from analyzer import LogAnalyzer
+from fake_inference import FakeChatServer
+from inference import AdaptiveRateLimiter, HuggingFaceTransport, InferenceService, RetryBudget
+
+# Lines mixed into the synthetic logs so the pre-filter has something to keep
+_ATTACK_REQUESTS = [
+    "GET /products.php?id=1%20UNION%20SELECT%20username,password%20FROM%20users HTTP/1.1",
+    "GET /search?q=<script>alert(document.cookie)</script> HTTP/1.1",
+    "GET /../../../../etc/passwd HTTP/1.1",
+    "POST /wp-login.php HTTP/1.1",
+    "GET /admin/config.php HTTP/1.1",
+]
+_NORMAL_REQUESTS = [
+    "GET /index.html HTTP/1.1",
+    "GET /static/css/main.css HTTP/1.1",
+    "GET /api/v1/items?page=2 HTTP/1.1",
+    "POST /api/v1/cart HTTP/1.1",
+    "GET /images/logo.png HTTP/1.1",
+]
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Benchmark LogAnalyzer against a local fake inference server')
+    parser.add_argument('log_files', nargs='*', help='Log files to analyze (default: generate synthetic logs)')
+    parser.add_argument('--files', type=int, default=50, help='Number of synthetic log files')
+    parser.add_argument('--lines', type=int, default=2000, help='Lines per synthetic log file')
+    parser.add_argument('--attack-ratio', type=float, default=0.01, help='Fraction of synthetic attack lines')
+    parser.add_argument('--concurrency', default='1,4,16,64', help='Comma-separated concurrency levels')
+    parser.add_argument('--latency', default='lognormal:0.2,0.5', help='Fake server latency distribution')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='Fraction of requests answered with 429')
+    parser.add_argument('--rate-500', type=float, default=0.0, help='Fraction of requests answered with 500')
+    parser.add_argument('--rate-timeout', type=float, default=0.0, help='Fraction of requests that time out')
+    parser.add_argument('--request-timeout', type=float, default=10.0, help='Client request timeout in seconds')
+    parser.add_argument('--json-ratio', type=float, default=0.9, help='Fraction of responses containing JSON')
+    parser.add_argument('--rate-limit', type=float, default=1000.0, help='Client request rate limit (requests/second)')
+    parser.add_argument('--context-tokens', type=int, default=8192, help='Model context window in tokens')
+    parser.add_argument('--batch', action='store_true', help='Pack small files into shared requests')
+    parser.add_argument('--stream', action='store_true', help='Stream responses and parse threats as they arrive')
+    parser.add_argument('--token-delay', type=float, default=0.0, help='Fake server delay between streamed tokens')
+    parser.add_argument('--tail-tokens', type=int, default=0, help='Fake server filler tokens after each response')
+    parser.add_argument('--no-prefilter', action='store_true', help='Send whole files to the model')
+    parser.add_argument('--no-signatures', action='store_true', help='Skip the local signature engine')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for logs and server')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    return parser.parse_args()
+
+
+def generate_logs(directory: str, files: int, lines: int, attack_ratio: float, seed: int) -> List[str]:
+    """Write synthetic Apache access logs and return their paths."""
+    rng = random.Random(seed)
+    paths = []
+    for file_index in range(files):
+        path = os.path.join(directory, f"access_{file_index:04d}.log")
+        with open(path, 'w') as f:
+            for line_index in range(lines):
+                request = rng.choice(_ATTACK_REQUESTS if rng.random() < attack_ratio else _NORMAL_REQUESTS)
+                ip = f"10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+                status = rng.choice([200, 200, 200, 304, 404, 500])
+                f.write(f'{ip} - - [10/Oct/2023:13:{line_index // 60 % 60:02d}:{line_index % 60:02d} +0000] '
+                        f'"{request}" {status} {rng.randint(200, 5000)} "-" "Mozilla/5.0"\n')
+        paths.append(path)
+    return paths
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of ``values`` (``q`` between 0 and 100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), int(round(q / 100 * len(ordered) + 0.5))))
+    return ordered[rank - 1]
+
+
+def run_level(log_files: List[str], server: FakeChatServer, concurrency: int, args) -> Dict[str, Any]:
+    """Analyze every file with ``concurrency`` requests in flight and measure it."""
+    transport = HuggingFaceTransport('fake', base_url=server.url, timeout=args.request_timeout)
+    service = InferenceService(
+        transport,
+        max_concurrency=concurrency,
+        rate_limiter=AdaptiveRateLimiter(rate=args.rate_limit, max_rate=args.rate_limit),
+        backoff_base=0.1,
+        backoff_cap=2.0,
+    )
+    analyzer = LogAnalyzer('fake', context_tokens=args.context_tokens, max_workers=concurrency,
+                           prefilter=not args.no_prefilter, signatures=not args.no_signatures,
+                           use_cache=False, service=service, stream=args.stream,
+                           batch_files=args.batch)
+    local_ids = {rule['id'] for rule in analyzer.signature_engine.rules} if analyzer.signature_engine else set()
+    local_ids.update(detector['id'] for detector in analyzer.window_engine.detectors)
+    latencies = []
+    first_threats = []
+    threat_count = 0
+
+    async def analyze(log_file, budget):
+        nonlocal threat_count
+        started = time.perf_counter()
+        first = []
+
+        def on_threat(threat):
+            # Local findings are known before any request, only time the model
+            if not first and threat.get('rule_id') not in local_ids:
+                first.append(time.perf_counter() - started)
+
+        threats = await analyzer.analyze_file_async(log_file, budget=budget, on_threat=on_threat)
+        latencies.append(time.perf_counter() - started)
+        first_threats.extend(first)
+        threat_count += len(threats)
+
+    async def analyze_batched(budget):
+        # Files finish together, so every file counts with the whole duration
+        nonlocal threat_count
+        started = time.perf_counter()
+        threats = await analyzer.analyze_files_batched_async(log_files, budget=budget)
+        latencies.extend([time.perf_counter() - started] * len(log_files))
+        threat_count += len(threats)
+
+    async def analyze_all():
+        budget = RetryBudget(len(log_files) * 10)
+        if args.batch:
+            await analyze_batched(budget)
+        else:
+            await asyncio.gather(*(analyze(log_file, budget) for log_file in log_files))
+
+    server.reset_stats()
+    started = time.perf_counter()
+    try:
+        service.run(analyze_all())
+    finally:
+        elapsed = time.perf_counter() - started
+        service_stats = service.stats()
+        service.close()
+
+    server_stats = server.stats()
+    tokens = server_stats['prompt_tokens'] + server_stats['completion_tokens']
+    failed = sum(count for status, count in server_stats['statuses'].items() if status != '200')
+    return {
+        'concurrency': concurrency,
+        'files': len(log_files),
+        'seconds': round(elapsed, 3),
+        'files_per_sec': round(len(log_files) / elapsed, 2),
+        'tokens_per_sec': round(tokens / elapsed, 1),
+        'p50_latency': round(percentile(latencies, 50), 3),
+        'p99_latency': round(percentile(latencies, 99), 3),
+        'p50_first_threat': round(percentile(first_threats, 50), 3),
+        'requests': server_stats['requests'],
+        'failed_requests': failed + server_stats['timeouts'],
+        'retries': service_stats['retries'],
+        'threats': threat_count,
+    }
+
+
+def main():
+    args = parse_arguments()
+    levels = [int(level) for level in args.concurrency.split(',') if level.strip()]
+
+    with tempfile.TemporaryDirectory() as directory:
+        log_files = args.log_files
+        if not log_files:
+            print(f"Generating {args.files} log files of {args.lines} lines...")
+            log_files = generate_logs(directory, args.files, args.lines, args.attack_ratio, args.seed)
+
+        server = FakeChatServer(latency=args.latency, rate_429=args.rate_429, rate_500=args.rate_500,
+                                rate_timeout=args.rate_timeout, timeout_delay=args.request_timeout * 2,
+                                json_ratio=args.json_ratio, seed=args.seed, token_delay=args.token_delay,
+                                tail_tokens=args.tail_tokens)
+        results = []
+        with server:
+            print(f"Fake inference server at {server.url} (latency {args.latency})\n")
+            print(f"{'conc':>5} {'files/s':>9} {'tokens/s':>10} {'p50 s':>8} {'p99 s':>8} "
+                  f"{'first s':>8} {'requests':>9} {'failed':>7} {'retries':>8}")
+            for concurrency in levels:
+                result = run_level(log_files, server, concurrency, args)
+                results.append(result)
+                print(f"{result['concurrency']:>5} {result['files_per_sec']:>9} {result['tokens_per_sec']:>10} "
+                      f"{result['p50_latency']:>8} {result['p99_latency']:>8} {result['p50_first_threat']:>8} "
+                      f"{result['requests']:>9} "
+                      f"{result['failed_requests']:>7} {result['retries']:>8}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'settings': vars(args), 'results': results}, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+from log_sources import log_stat, member_size, open_log, open_member, rotation_members
+
+DEFAULT_CHECKPOINT_DIR = os.environ.get("CHECKPOINT_DIR", ".checkpoints")
+
+# Size of the block before the checkpoint offset whose hash detects rewritten files
+TAIL_BLOCK_SIZE = 4096
+
+# Leading bytes whose hash identifies a file of a log across renames and compression
+HEAD_BLOCK_SIZE = 4096
+
+# Block size used when scanning a file for line ends
+SCAN_BLOCK_SIZE = 1024 * 1024
+
+
+def _tail_hash(f, offset: int) -> str:
+    """Hash of the ``TAIL_BLOCK_SIZE`` bytes that end at ``offset``."""
+    start = max(0, offset - TAIL_BLOCK_SIZE)
+    f.seek(start)
+    return hashlib.sha256(f.read(offset - start)).hexdigest()
+
+
+def _head_hash(path: str, length: int) -> str:
+    """Hash of the first ``length`` decompressed bytes of one file of a log."""
+    with open_member(path) as f:
+        return hashlib.sha256(f.read(length)).hexdigest()
+
+
+def _member_lines(path: str) -> int:
+    with open_member(path) as f:
+        return _count_lines(f, 0, member_size(path))
+
+
+def _complete_end(f, start: int, size: int) -> int:
+    """Offset just past the last newline in ``[start, size)``, or ``start``.
+
+    A line that is still being written is left for the next run.
+    """
+    end = size
+    while end > start:
+        block_start = max(start, end - SCAN_BLOCK_SIZE)
+        f.seek(block_start)
+        newline = f.read(end - block_start).rfind(b'\n')
+        if newline != -1:
+            return block_start + newline + 1
+        end = block_start
+    return start
+
+
+def _count_lines(f, start: int, end: int) -> int:
+    f.seek(start)
+    count = 0
+    remaining = end - start
+    while remaining > 0:
+        block = f.read(min(SCAN_BLOCK_SIZE, remaining))
+        if not block:
+            break
+        count += block.count(b'\n')
+        remaining -= len(block)
+    return count
+
+
+class CheckpointStore:
+    def __init__(self, checkpoint_dir: str = DEFAULT_CHECKPOINT_DIR):
+        """Per-file checkpoints for incremental analysis.
+
+        A checkpoint records how far a log file has been analyzed: the byte
+        offset, the number of lines before it, the file's inode and a hash of
+        the block just before the offset. For rotated series it also records
+        the member file holding the offset, by a hash of its first bytes, and
+        the sizes and line counts of the members before it, so the offset is
+        found again after the members were renamed, compressed or the oldest
+        one was dropped. Findings of earlier runs are kept next to the
+        checkpoints so new ones can be merged into them, and so is the state
+        of the sliding window detectors so the next run continues it.
+
+        Args:
+            checkpoint_dir: Directory holding the checkpoints and findings
+        """
+        self.checkpoint_dir = checkpoint_dir
+        self.path = os.path.join(checkpoint_dir, 'checkpoints.json')
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(checkpoint_dir, 'findings'), exist_ok=True)
+        os.makedirs(os.path.join(checkpoint_dir, 'windows'), exist_ok=True)
+        self._checkpoints: Dict[str, Dict[str, Any]] = self._load()
+        # Window states read or written so far, so followed logs are not read back every window
+        self._window_states: Dict[str, Optional[Dict[str, Any]]] = {}
+
+    def get(self, log_file: str) -> Optional[Dict[str, Any]]:
+        """Return the checkpoint of a file or None."""
+        with self._lock:
+            checkpoint = self._checkpoints.get(self._key(log_file))
+            return dict(checkpoint) if checkpoint else None
+
+    def plan(self, log_file: str) -> Dict[str, Any]:
+        """Work out which byte range of a file still needs to be analyzed.
+
+        Returns:
+            dict: ``start`` and ``end`` byte offsets, ``start_line`` (lines
+            before ``start``), the file's ``inode`` and a ``status`` of
+            ``new``, ``appended``, ``unchanged``, ``rotated`` or ``truncated``.
+            Rotated and truncated files are analyzed again from the start.
+            Offsets are positions in the decompressed stream of the log (see
+            ``log_sources.open_log``); a rotated series stays ``appended``
+            across rotations for as long as the member holding the
+            checkpoint is kept.
+        """
+        checkpoint = self.get(log_file)
+        size, inode = log_stat(log_file)
+        members = []
+
+        with open_log(log_file) as f:
+            status = 'new'
+            start = start_line = 0
+            if checkpoint and 'member' not in checkpoint:
+                # Written before members were recorded
+                if checkpoint['inode'] != inode:
+                    status = 'rotated'
+                elif size < checkpoint['offset']:
+                    status = 'truncated'
+                elif _tail_hash(f, checkpoint['offset']) != checkpoint['tail_hash']:
+                    # Same inode and long enough, but rewritten in place
+                    status = 'truncated'
+                else:
+                    start = checkpoint['offset']
+                    start_line = checkpoint['line_num']
+                    status = 'appended' if size > start else 'unchanged'
+            elif checkpoint:
+                position = self._locate(log_file, checkpoint)
+                if position is None:
+                    status = 'rotated' if checkpoint['inode'] != inode else 'truncated'
+                else:
+                    start, start_line, members = position
+                    status = 'appended' if size > start else 'unchanged'
+
+            end = _complete_end(f, start, size)
+            if status == 'appended' and end == start:
+                status = 'unchanged'
+
+        return {
+            'start': start,
+            'end': end,
+            'start_line': start_line,
+            'inode': inode,
+            'status': status,
+            'members': members,
+        }
+
+    def commit(self, log_file: str, plan: Dict[str, Any],
+               window_state: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Record that the range of ``plan`` has been analyzed.
+
+        ``window_state`` is the state of the sliding window detectors at the
+        end of the range (see ``WindowScan.state``); without it the stored
+        state is dropped.
+        """
+        self._save_window_state(log_file, window_state)
+        end = plan['end']
+        with open_log(log_file) as f:
+            line_num = plan['start_line'] + _count_lines(f, plan['start'], end)
+
+        # Members before the one holding the offset, with their line counts
+        known = {(member['head_hash'], member['size']): member['lines'] for member in plan.get('members', [])}
+        members = []
+        member_start = lines_before = 0
+        holder = None
+        paths = rotation_members(log_file) or [log_file]
+        for number, path in enumerate(paths):
+            size = member_size(path)
+            if end <= member_start + size or number == len(paths) - 1:
+                holder = path
+                break
+            head_hash = _head_hash(path, min(HEAD_BLOCK_SIZE, size))
+            lines = known.get((head_hash, size))
+            if lines is None:
+                lines = _member_lines(path)
+            members.append({'head_hash': head_hash, 'size': size, 'lines': lines})
+            member_start += size
+            lines_before += lines
+
+        offset = end - member_start
+        with open_member(holder) as f:
+            tail_hash = _tail_hash(f, offset)
+        checkpoint = {
+            'offset': end,
+            'line_num': line_num,
+            'inode': plan['inode'],
+            'tail_hash': tail_hash,
+            'member': {
+                'head_length': min(HEAD_BLOCK_SIZE, offset),
+                'head_hash': _head_hash(holder, min(HEAD_BLOCK_SIZE, offset)),
+                'offset': offset,
+                'line_num': line_num - lines_before,
+            },
+            'members': members,
+            'updated': datetime.now().isoformat(),
+        }
+        with self._lock:
+            self._checkpoints[self._key(log_file)] = checkpoint
+            self._save()
+        return dict(checkpoint)
+
+    def _locate(self, log_file: str, checkpoint: Dict[str, Any]):
+        """Find the checkpoint in the current members of a log.
+
+        Returns the stream offset and line number of the checkpoint with the
+        members before it (as recorded by ``commit``), or None when the
+        member that held it is gone or was rewritten.
+        """
+        position = checkpoint['member']
+        if checkpoint['offset'] == 0:
+            return 0, 0, []
+        known = {(member['head_hash'], member['size']): member['lines'] for member in checkpoint['members']}
+        before = []
+        member_start = 0
+        for path in rotation_members(log_file) or [log_file]:
+            size = member_size(path)
+            if size >= position['offset'] and _head_hash(path, position['head_length']) == position['head_hash']:
+                with open_member(path) as f:
+                    found = _tail_hash(f, position['offset']) == checkpoint['tail_hash']
+                if found:
+                    # Members that were not there at the last commit are counted once
+                    members = []
+                    for before_path, head_hash, before_size in before:
+                        lines = known.get((head_hash, before_size))
+                        if lines is None:
+                            lines = _member_lines(before_path)
+                        members.append({'head_hash': head_hash, 'size': before_size, 'lines': lines})
+                    lines_before = sum(member['lines'] for member in members)
+                    return member_start + position['offset'], lines_before + position['line_num'], members
+            before.append((path, _head_hash(path, min(HEAD_BLOCK_SIZE, size)), size))
+            member_start += size
+        return None
+
+    def reset(self, log_file: str) -> None:
+        """Forget the checkpoint, findings and window state of a file."""
+        with self._lock:
+            self._checkpoints.pop(self._key(log_file), None)
+            self._save()
+        try:
+            os.remove(self._findings_path(log_file))
+        except OSError:
+            pass
+        self._save_window_state(log_file, None)
+
+    def load_window_state(self, log_file: str) -> Optional[Dict[str, Any]]:
+        """Return the window detector state committed with the checkpoint of a file, or None."""
+        key = self._key(log_file)
+        with self._lock:
+            if key in self._window_states:
+                return self._window_states[key]
+        try:
+            with open(self._window_state_path(log_file), 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = None
+        with self._lock:
+            return self._window_states.setdefault(key, state)
+
+    def load_findings(self, log_file: str) -> List[Dict[str, Any]]:
+        """Return the findings stored for a file by earlier runs."""
+        try:
+            with open(self._findings_path(log_file), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def save_findings(self, log_file: str, threats: List[Dict[str, Any]]) -> None:
+        """Replace the findings stored for a file."""
+        path = self._findings_path(log_file)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(threats, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error saving findings for {log_file}: {e}")
+
+    def _save_window_state(self, log_file: str, state: Optional[Dict[str, Any]]) -> None:
+        path = self._window_state_path(log_file)
+        with self._lock:
+            self._window_states[self._key(log_file)] = state
+        if state is None:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error saving window state for {log_file}: {e}")
+
+    def _key(self, log_file: str) -> str:
+        return os.path.abspath(log_file)
+
+    def _findings_path(self, log_file: str) -> str:
+        name = hashlib.sha256(self._key(log_file).encode('utf-8')).hexdigest()
+        return os.path.join(self.checkpoint_dir, 'findings', f"{name}.json")
+
+    def _window_state_path(self, log_file: str) -> str:
+        name = hashlib.sha256(self._key(log_file).encode('utf-8')).hexdigest()
+        return os.path.join(self.checkpoint_dir, 'windows', f"{name}.json")
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self) -> None:
+        tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._checkpoints, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Error saving checkpoints: {e}")
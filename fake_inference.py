@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+import re
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Any, List, Optional
+
+# Rough size of a token, used for the usage numbers reported back
+CHARS_PER_TOKEN = 4
+
+_EXCERPT_LINE_RE = re.compile(r'^\s*(\d+): (.*)$')
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """Turn a latency spec into a sampler returning seconds.
+
+    Supported specs are ``fixed:S``, ``uniform:LOW,HIGH``, ``exponential:MEAN``
+    and ``lognormal:MEDIAN,SIGMA`` (all in seconds).
+    """
+    kind, _, args = spec.partition(':')
+    values = [float(value) for value in args.split(',') if value]
+    if kind == 'fixed' and len(values) == 1:
+        return lambda rng: values[0]
+    if kind == 'uniform' and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == 'exponential' and len(values) == 1:
+        return lambda rng: rng.expovariate(1 / values[0]) if values[0] > 0 else 0.0
+    if kind == 'lognormal' and len(values) == 2:
+        mu = math.log(values[0])
+        return lambda rng: rng.lognormvariate(mu, values[1])
+    raise ValueError(f"Invalid latency spec: {spec}")
+
+
+class FakeChatServer:
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: str = 'fixed:0.05',
+                 rate_429: float = 0.0, rate_500: float = 0.0, rate_timeout: float = 0.0,
+                 timeout_delay: float = 30.0, json_ratio: float = 1.0, think: bool = True,
+                 canned: Optional[List[str]] = None, seed: int = 0, token_delay: float = 0.0,
+                 tail_tokens: int = 0):
+        """Local stand-in for an OpenAI-compatible chat completions endpoint.
+
+        Serves ``POST /v1/chat/completions`` with configurable latency, injected
+        errors and canned responses, so ``LogAnalyzer(base_url=server.url)``
+        can be exercised without API quota. Outcomes are derived from the seed,
+        the request body and how often that body was seen, so a run is
+        reproducible regardless of request ordering.
+
+        Args:
+            host: Interface to listen on
+            port: Port to listen on; 0 picks a free one
+            latency: Latency distribution spec (see ``parse_latency``)
+            rate_429: Fraction of requests answered with 429 and Retry-After
+            rate_500: Fraction of requests answered with 500
+            rate_timeout: Fraction of requests that hang for ``timeout_delay``
+                seconds and then drop the connection
+            timeout_delay: How long a timed out request hangs, in seconds
+            json_ratio: Fraction of successful responses that contain JSON
+            think: Prefix responses with a <think> block like reasoning models
+            canned: Fixed response bodies to pick from instead of generated ones
+            seed: Seed for every random choice
+            token_delay: Delay between streamed tokens, in seconds
+            tail_tokens: Filler tokens streamed after the response, like a
+                generation that does not stop
+        """
+        self.latency_spec = latency
+        self._latency = parse_latency(latency)
+        self.rate_429 = rate_429
+        self.rate_500 = rate_500
+        self.rate_timeout = rate_timeout
+        self.timeout_delay = timeout_delay
+        self.json_ratio = json_ratio
+        self.think = think
+        self.canned = canned
+        self.seed = seed
+        self.token_delay = token_delay
+        self.tail_tokens = tail_tokens
+        self._lock = threading.Lock()
+        self._attempts: Dict[str, int] = {}
+        self._stats: Dict[str, Any] = {}
+        self.reset_stats()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                server._handle(self)
+
+            def do_GET(self):
+                if self.path.rstrip('/') == '/stats':
+                    self._send(200, server.stats())
+                else:
+                    self._send(404, {'error': 'Not found'})
+
+            def _send(self, status, payload, headers=None):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'FakeChatServer':
+        """Serve requests from a background thread."""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-inference", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> 'FakeChatServer':
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return request, status and token counters."""
+        with self._lock:
+            return dict(self._stats, statuses=dict(self._stats['statuses']))
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._stats = {
+                'requests': 0,
+                'statuses': {},
+                'timeouts': 0,
+                'prompt_tokens': 0,
+                'completion_tokens': 0,
+                'abandoned_streams': 0,
+            }
+
+    def _count(self, status: Optional[int], prompt_tokens: int = 0, completion_tokens: int = 0) -> None:
+        with self._lock:
+            self._stats['requests'] += 1
+            if status is None:
+                self._stats['timeouts'] += 1
+            else:
+                statuses = self._stats['statuses']
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+            self._stats['prompt_tokens'] += prompt_tokens
+            self._stats['completion_tokens'] += completion_tokens
+
+    def _rng(self, body: bytes) -> random.Random:
+        digest = hashlib.sha256(body).hexdigest()
+        with self._lock:
+            attempt = self._attempts.get(digest, 0)
+            self._attempts[digest] = attempt + 1
+            if len(self._attempts) > 100000:
+                self._attempts.clear()
+        return random.Random(f"{self.seed}:{digest}:{attempt}")
+
+    def _handle(self, handler: BaseHTTPRequestHandler) -> None:
+        if not handler.path.rstrip('/').endswith('/chat/completions'):
+            handler._send(404, {'error': 'Not found'})
+            return
+
+        body = handler.rfile.read(int(handler.headers.get('Content-Length', 0)))
+        try:
+            request = json.loads(body)
+        except ValueError:
+            self._count(400)
+            handler._send(400, {'error': 'Invalid JSON body'})
+            return
+
+        rng = self._rng(body)
+        time.sleep(max(0.0, self._latency(rng)))
+
+        outcome = rng.random()
+        if outcome < self.rate_timeout:
+            self._count(None)
+            time.sleep(self.timeout_delay)
+            handler.close_connection = True
+            return
+        outcome -= self.rate_timeout
+        if outcome < self.rate_429:
+            self._count(429)
+            handler._send(429, {'error': 'Rate limit exceeded'}, {'Retry-After': '1'})
+            return
+        outcome -= self.rate_429
+        if outcome < self.rate_500:
+            self._count(500)
+            handler._send(500, {'error': 'Internal server error'})
+            return
+
+        messages = request.get('messages', [])
+        prompt = ''.join(str(message.get('content', '')) for message in messages)
+        content = self._response(rng, str(messages[-1].get('content', '')) if messages else '')
+        prompt_tokens = len(prompt) // CHARS_PER_TOKEN
+        completion_tokens = len(content) // CHARS_PER_TOKEN
+        self._count(200, prompt_tokens, completion_tokens)
+        if request.get('stream'):
+            self._stream(handler, request, rng, content)
+            return
+        handler._send(200, {
+            'id': f"chatcmpl-{rng.getrandbits(64):016x}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model', ''),
+            'choices': [{
+                'index': 0,
+                'finish_reason': 'stop',
+                'message': {'role': 'assistant', 'content': content},
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens,
+            },
+        })
+
+    def _stream(self, handler: BaseHTTPRequestHandler, request: Dict[str, Any], rng: random.Random,
+                content: str) -> None:
+        """Send ``content`` as server-sent events, a few characters per event."""
+        completion_id = f"chatcmpl-{rng.getrandbits(64):016x}"
+        pieces = [content[i:i + CHARS_PER_TOKEN] for i in range(0, len(content), CHARS_PER_TOKEN)]
+        pieces += [' ...'] * self.tail_tokens
+
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'text/event-stream')
+        handler.send_header('Cache-Control', 'no-cache')
+        handler.send_header('Connection', 'close')
+        handler.end_headers()
+        handler.close_connection = True
+        try:
+            for piece in pieces + [None]:
+                event = {
+                    'id': completion_id,
+                    'object': 'chat.completion.chunk',
+                    'created': int(time.time()),
+                    'model': request.get('model', ''),
+                    'choices': [{
+                        'index': 0,
+                        'delta': {'role': 'assistant', 'content': piece} if piece is not None else {},
+                        'finish_reason': None if piece is not None else 'stop',
+                    }],
+                }
+                handler.wfile.write(f"data: {json.dumps(event)}\n\n".encode('utf-8'))
+                handler.wfile.flush()
+                if piece is not None and self.token_delay:
+                    time.sleep(self.token_delay)
+            handler.wfile.write(b"data: [DONE]\n\n")
+            handler.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading, e.g. after the JSON was complete
+            with self._lock:
+                self._stats['abandoned_streams'] += 1
+
+    def _response(self, rng: random.Random, content: str) -> str:
+        """Build a response to the analyzer prompt in ``content``."""
+        if self.canned:
+            return rng.choice(self.canned)
+
+        prefix = "<think>\nLooking for suspicious entries in the log.\n</think>\n\n" if self.think else ""
+        if rng.random() >= self.json_ratio:
+            return prefix + ("The log shows repeated failed logins from a single address, which could "
+                             "indicate a brute force attempt. Review the authentication logs.")
+
+        # Report one of the lines that was sent, as a model would
+        lines = [line for line in content.splitlines()[2:] if line.strip() and line.strip() != '--']
+        threats = []
+        if lines:
+            line = rng.choice(lines)
+            line_num = 0
+            match = _EXCERPT_LINE_RE.match(line)
+            if match:
+                line_num, line = int(match.group(1)), match.group(2)
+            threats.append({
+                'id': f"AI-{rng.randint(1, 999):03d}",
+                'name': 'Suspicious activity',
+                'severity': rng.choice(['low', 'medium', 'high', 'critical']),
+                'description': 'Synthetic finding returned by the fake inference server',
+                'remediation': 'None; this is test data',
+                'line': line.strip(),
+                'line_num': line_num,
+            })
+        return prefix + "```json\n" + json.dumps({'threats': threats}, indent=2) + "\n```"
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Serve a fake OpenAI-compatible chat completions endpoint')
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on')
+    parser.add_argument('--latency', default='fixed:0.05',
+                        help='fixed:S, uniform:LOW,HIGH, exponential:MEAN or lognormal:MEDIAN,SIGMA')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='Fraction of requests answered with 429')
+    parser.add_argument('--rate-500', type=float, default=0.0, help='Fraction of requests answered with 500')
+    parser.add_argument('--rate-timeout', type=float, default=0.0, help='Fraction of requests that time out')
+    parser.add_argument('--timeout-delay', type=float, default=30.0, help='Seconds a timed out request hangs')
+    parser.add_argument('--json-ratio', type=float, default=1.0, help='Fraction of responses containing JSON')
+    parser.add_argument('--no-think', action='store_true', help='Leave out the <think> block')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--token-delay', type=float, default=0.0, help='Seconds between streamed tokens')
+    parser.add_argument('--tail-tokens', type=int, default=0, help='Filler tokens streamed after each response')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    server = FakeChatServer(args.host, args.port, args.latency, args.rate_429, args.rate_500,
+                            args.rate_timeout, args.timeout_delay, args.json_ratio,
+                            not args.no_think, seed=args.seed, token_delay=args.token_delay,
+                            tail_tokens=args.tail_tokens)
+    print(f"Fake inference server listening on {server.url}")
+    print(f"Point the analyzer at it with INFERENCE_BASE_URL={server.url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
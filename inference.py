@@ -0,0 +1,580 @@
+import os
+import time
+import random
+import asyncio
+import threading
+import contextvars
+import concurrent.futures
+from contextlib import aclosing
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from huggingface_hub import AsyncInferenceClient
+
+DEFAULT_PROVIDER = "nebius"
+# Requests in flight per service; the provider's rate limit is the real bound
+DEFAULT_MAX_CONCURRENCY = int(os.environ.get("INFERENCE_MAX_CONCURRENCY", 32))
+# Starting request rate (requests/second); adapted to what the provider accepts
+DEFAULT_RATE_LIMIT = float(os.environ.get("INFERENCE_RATE_LIMIT", 5))
+# Retries allowed for one analysis across all of its requests
+DEFAULT_RETRY_BUDGET = int(os.environ.get("INFERENCE_RETRY_BUDGET", 50))
+
+# HTTP statuses worth retrying; everything else fails immediately
+RETRYABLE_STATUSES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+# Rate limit reset headers above this are absolute epoch times, not seconds from now
+RESET_EPOCH_THRESHOLD = 1e9
+
+# Headers of the HTTP response to the request the current task is making
+_response_headers: contextvars.ContextVar[Optional[Dict[str, str]]] = contextvars.ContextVar(
+    'response_headers', default=None)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider that keeps failing."""
+
+
+class RetryBudgetExceeded(Exception):
+    """Raised when an analysis has used up its retries."""
+
+
+class ChatResponse(str):
+    """Text of a model response that also carries the headers of the HTTP response."""
+
+    def __new__(cls, text: str, headers: Optional[Dict[str, str]] = None) -> 'ChatResponse':
+        response = super().__new__(cls, text)
+        response.headers = dict(headers or {})
+        return response
+
+
+class AdaptiveRateLimiter:
+    def __init__(self, rate: float = DEFAULT_RATE_LIMIT, burst: Optional[float] = None,
+                 min_rate: float = 0.2, max_rate: float = 100.0, increase: float = 0.25,
+                 decrease: float = 0.75, max_pause: float = 300.0):
+        """Token bucket whose refill rate follows the provider's limit (AIMD).
+
+        The rate is multiplied by ``decrease`` on every throttling response and
+        grows by ``increase`` requests/second for every success, so it settles
+        just below the rate the provider accepts.
+
+        Args:
+            rate: Initial rate in requests per second
+            burst: Bucket capacity; defaults to one second worth of requests
+            min_rate: Lower bound for the rate
+            max_rate: Upper bound for the rate
+            increase: Additive increase applied per successful request
+            decrease: Multiplicative decrease applied per throttling response
+            max_pause: Longest pause taken for an advertised rate limit reset, in seconds
+        """
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.max_pause = max_pause
+        self._tokens = self._capacity()
+        self._updated = time.monotonic()
+        # Monotonic time before which no request may be sent (Retry-After)
+        self._paused_until = 0.0
+
+    def _capacity(self) -> float:
+        return self.burst if self.burst is not None else max(1.0, self.rate)
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self._capacity(), self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        """Wait until a request may be sent."""
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._refill(now)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def on_success(self, headers: Optional[Dict[str, str]] = None) -> None:
+        """Grow the rate after a successful request."""
+        self.rate = min(self.max_rate, self.rate + self.increase)
+        self._apply_headers(headers)
+
+    def on_throttle(self, retry_after: Optional[float] = None,
+                    headers: Optional[Dict[str, str]] = None) -> None:
+        """Back off after the provider rejected a request for rate reasons."""
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        self._tokens = min(self._tokens, 0.0)
+        if retry_after:
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        self._apply_headers(headers)
+
+    def _apply_headers(self, headers: Optional[Dict[str, str]]) -> None:
+        """Use advertised remaining requests and reset time when present."""
+        if not headers:
+            return
+        headers = {name.lower(): value for name, value in headers.items()}
+        remaining = _header_number(headers, 'x-ratelimit-remaining-requests', 'x-ratelimit-remaining', 'ratelimit-remaining')
+        reset = _header_number(headers, 'x-ratelimit-reset-requests', 'x-ratelimit-reset', 'ratelimit-reset')
+        if remaining is None or not reset or reset <= 0:
+            return
+        if reset > RESET_EPOCH_THRESHOLD:
+            # An absolute time rather than seconds from now
+            reset -= time.time()
+            if reset <= 0:
+                return
+        reset = min(reset, self.max_pause)
+        # Spread what is left of the window evenly until it resets
+        self.rate = min(self.max_rate, max(self.min_rate, remaining / reset))
+        if remaining < 1:
+            self._paused_until = max(self._paused_until, time.monotonic() + reset)
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """Stop sending requests to a provider after repeated failures.
+
+        After ``failure_threshold`` consecutive failures the circuit opens and
+        requests fail fast for ``reset_timeout`` seconds; then a single trial
+        request is let through, which closes the circuit again on success.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.state = 'closed'
+        self._opened_at = 0.0
+        # Set once the current trial request has ended
+        self._trial_ended: Optional[asyncio.Event] = None
+
+    def before_request(self) -> bool:
+        """Raise CircuitOpenError if requests should not be sent right now.
+
+        Returns True when the request is the trial of a half-open circuit; it
+        must end in ``record_success``, ``record_failure`` or ``release_trial``.
+        """
+        if self.state == 'open':
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                raise CircuitOpenError("Model provider is failing, requests are paused")
+            self.state = 'half-open'
+            self._trial_ended = asyncio.Event()
+            return True
+        elif self.state == 'half-open':
+            # Only one trial request at a time
+            raise CircuitOpenError("Model provider is being probed, requests are paused")
+        return False
+
+    def retry_in(self) -> float:
+        """Seconds until a request could be let through again."""
+        if self.state == 'open':
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+        return 1.0 if self.state == 'half-open' else 0.0
+
+    async def wait_for_trial(self) -> None:
+        """Wait until the trial request of a half-open circuit has ended."""
+        if self.state == 'half-open' and self._trial_ended is not None:
+            await self._trial_ended.wait()
+
+    def record_success(self) -> None:
+        """Record that the provider answered (even if it refused the request)."""
+        self.failures = 0
+        self._end_trial()
+        self.state = 'closed'
+
+    def release_trial(self) -> None:
+        """Give up a trial request that ended without an answer, e.g. because it was cancelled."""
+        if self.state == 'half-open':
+            # The reset timeout has passed already, so the next request becomes the trial
+            self._end_trial()
+            self.state = 'open'
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == 'half-open' or self.failures >= self.failure_threshold:
+            self._end_trial()
+            self.state = 'open'
+            self._opened_at = time.monotonic()
+
+    def _end_trial(self) -> None:
+        """Wake the requests waiting for the trial."""
+        if self._trial_ended is not None:
+            self._trial_ended.set()
+            self._trial_ended = None
+
+
+class RetryBudget:
+    def __init__(self, retries: int = DEFAULT_RETRY_BUDGET):
+        """Number of retries one analysis may spend across all of its requests."""
+        self.remaining = retries
+        self.spent = 0
+
+    def spend(self) -> bool:
+        """Take one retry from the budget; False when none are left."""
+        if self.remaining <= 0:
+            return False
+        self.remaining -= 1
+        self.spent += 1
+        return True
+
+
+def _header_number(headers: Dict[str, str], *names: str) -> Optional[float]:
+    for name in names:
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            return float(str(value).rstrip('s'))
+        except ValueError:
+            continue
+    return None
+
+
+def _error_details(error: Exception) -> Tuple[Optional[int], Dict[str, str]]:
+    """Return the HTTP status and response headers attached to a provider error."""
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None)
+    headers = dict(getattr(response, 'headers', None) or {})
+    return status, headers
+
+
+async def _record_headers(response) -> None:
+    """HTTP client response hook keeping the headers for the request of the current task."""
+    headers = _response_headers.get()
+    if headers is not None:
+        headers.update(response.headers)
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether a failed request is worth retrying."""
+    status, _ = _error_details(error)
+    if status is not None:
+        return status in RETRYABLE_STATUSES
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    # HTTP client libraries raise their own timeout/connection error types
+    name = type(error).__name__
+    return 'Timeout' in name or 'Connect' in name
+
+
+class ChatTransport:
+    """Sends chat completion requests to a model provider.
+
+    Subclasses implement ``complete``; pass an instance to ``InferenceService``
+    (or ``LogAnalyzer``) to route requests somewhere else, e.g. a local fake.
+    """
+
+    async def complete(self, messages: List[Dict[str, str]], model: str, max_tokens: int) -> str:
+        """Return the text of the model response for ``messages``.
+
+        Return it as a ``ChatResponse`` to pass on the HTTP response headers,
+        which the rate limiter adapts to.
+        """
+        raise NotImplementedError
+
+    async def stream(self, messages: List[Dict[str, str]], model: str, max_tokens: int) -> AsyncIterator[str]:
+        """Yield the text of the model response piece by piece as it is generated.
+
+        Transports without streaming support yield the whole response at once.
+        The first piece may be a ``ChatResponse`` with the HTTP response headers.
+        """
+        yield await self.complete(messages, model, max_tokens)
+
+    async def close(self) -> None:
+        """Release connections held by the transport."""
+
+
+class HuggingFaceTransport(ChatTransport):
+    def __init__(self, api_key: str, provider: str = DEFAULT_PROVIDER,
+                 base_url: Optional[str] = None, timeout: Optional[float] = None):
+        """Transport backed by huggingface_hub's AsyncInferenceClient.
+
+        Args:
+            api_key: HuggingFace API key
+            provider: Inference provider used when no base_url is given
+            base_url: URL of an OpenAI-compatible server to use instead
+            timeout: Request timeout in seconds
+        """
+        if base_url:
+            self.client = AsyncInferenceClient(base_url=base_url, api_key=api_key, timeout=timeout)
+        else:
+            self.client = AsyncInferenceClient(provider=provider, api_key=api_key, timeout=timeout)
+        self._hooked = False
+
+    async def complete(self, messages: List[Dict[str, str]], model: str, max_tokens: int) -> str:
+        headers = await self._collect_headers()
+        completion = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+        )
+        return ChatResponse(completion.choices[0].message.content, headers)
+
+    async def stream(self, messages: List[Dict[str, str]], model: str, max_tokens: int) -> AsyncIterator[str]:
+        headers = await self._collect_headers()
+        chunks = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            stream=True,
+        )
+        first = True
+        # Closing the stream early drops the connection and with it the generation
+        async with aclosing(chunks):
+            async for chunk in chunks:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    piece = chunk.choices[0].delta.content
+                    yield ChatResponse(piece, headers) if first else piece
+                    first = False
+
+    async def _collect_headers(self) -> Dict[str, str]:
+        """Dict that the headers of the next response in the current task are put into.
+
+        The client does not return headers, so they are taken by a response
+        hook of its HTTP client (httpx, used by huggingface_hub 1.0 and later);
+        with older versions the dict stays empty.
+        """
+        if not self._hooked:
+            self._hooked = True
+            get_client = getattr(self.client, '_get_async_client', None)
+            hooks = getattr(await get_client(), 'event_hooks', None) if get_client is not None else None
+            if hooks is not None:
+                hooks['response'].append(_record_headers)
+        headers: Dict[str, str] = {}
+        _response_headers.set(headers)
+        return headers
+
+    async def close(self) -> None:
+        await self.client.close()
+
+
+class InferenceService:
+    def __init__(self, transport: ChatTransport, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 rate_limiter: Optional[AdaptiveRateLimiter] = None,
+                 circuit_breaker: Optional[CircuitBreaker] = None,
+                 max_attempts: int = 6, backoff_base: float = 0.5, backoff_cap: float = 30.0):
+        """Long-lived event loop that runs model requests with bounded concurrency.
+
+        The loop lives in a daemon thread so that synchronous callers (Flask
+        request handlers, the CLI) can share one transport, and with it one
+        connection pool, across requests. Requests are paced by an adaptive
+        rate limiter and retried with jittered exponential backoff.
+
+        Args:
+            transport: Transport used to reach the model
+            max_concurrency: Maximum number of requests in flight at once
+            rate_limiter: Limiter shared by all requests of the service
+            circuit_breaker: Breaker shared by all requests of the service
+            max_attempts: Attempts per request, including the first one
+            backoff_base: Backoff ceiling for the first retry, in seconds
+            backoff_cap: Upper bound for a single backoff, in seconds
+        """
+        self.transport = transport
+        self.max_concurrency = max_concurrency
+        self.rate_limiter = rate_limiter or AdaptiveRateLimiter()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.retries = 0
+        self.throttled = 0
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="inference-loop", daemon=True)
+        self._thread.start()
+        self._semaphore = self.run(self._make_semaphore())
+
+    async def _make_semaphore(self) -> asyncio.Semaphore:
+        return asyncio.Semaphore(self.max_concurrency)
+
+    async def complete(self, messages: List[Dict[str, str]], model: str, max_tokens: int,
+                       budget: Optional[RetryBudget] = None) -> str:
+        """Send one request through the transport, retrying transient failures.
+
+        Args:
+            messages: Chat messages to send
+            model: Model name
+            max_tokens: Completion token limit
+            budget: Retry budget of the analysis this request belongs to
+
+        Raises:
+            CircuitOpenError: The provider keeps failing and is not being called
+            RetryBudgetExceeded: The analysis has no retries left
+        """
+        attempt = 1
+        while True:
+            trial = await self._admit()
+            try:
+                async with self._semaphore:
+                    response = await self.transport.complete(messages, model, max_tokens)
+            except Exception as e:
+                await self._recover(e, attempt, budget)
+                attempt += 1
+                continue
+            else:
+                self.circuit_breaker.record_success()
+                self.rate_limiter.on_success(getattr(response, 'headers', None))
+                return response
+            finally:
+                # A cancelled or unrecorded trial must not leave the breaker half-open
+                if trial:
+                    self.circuit_breaker.release_trial()
+
+    async def stream(self, messages: List[Dict[str, str]], model: str, max_tokens: int,
+                     budget: Optional[RetryBudget] = None) -> AsyncIterator[str]:
+        """Stream one response through the transport, piece by piece.
+
+        Failures before the first piece are retried like in ``complete``; once
+        text has been yielded a failure is raised to the caller. The first
+        piece counts as the provider's answer for the circuit breaker and the
+        rate limiter, so closing the generator early abandons the generation
+        without being taken for a failure.
+        """
+        attempt = 1
+        while True:
+            trial = await self._admit()
+            started = False
+            try:
+                async with self._semaphore:
+                    async with aclosing(self.transport.stream(messages, model, max_tokens)) as pieces:
+                        async for piece in pieces:
+                            if not started:
+                                # The provider answered; the caller may close the generator early
+                                started = True
+                                self.circuit_breaker.record_success()
+                                self.rate_limiter.on_success(getattr(piece, 'headers', None))
+                            yield piece
+            except Exception as e:
+                if started:
+                    raise
+                await self._recover(e, attempt, budget)
+                attempt += 1
+                continue
+            else:
+                if not started:
+                    # An empty answer is an answer too
+                    self.circuit_breaker.record_success()
+                    self.rate_limiter.on_success()
+                return
+            finally:
+                # Closed or cancelled before the first piece: the trial was not answered
+                if trial:
+                    self.circuit_breaker.release_trial()
+
+    async def _admit(self) -> bool:
+        """Wait for the breaker and the rate limiter.
+
+        Returns whether the request is the breaker's trial (see
+        ``CircuitBreaker.before_request``). Requests queue behind an open
+        breaker and its trial request without spending attempts or retries;
+        when the trial they waited for fails, CircuitOpenError is raised.
+        """
+        breaker = self.circuit_breaker
+        waited_for_trial = False
+        while True:
+            try:
+                trial = breaker.before_request()
+                break
+            except CircuitOpenError:
+                if breaker.state == 'half-open':
+                    await breaker.wait_for_trial()
+                    waited_for_trial = True
+                elif waited_for_trial:
+                    # The trial failed and opened the circuit again
+                    raise
+                else:
+                    await asyncio.sleep(breaker.retry_in())
+        
+        try:
+            await self.rate_limiter.acquire()
+        except BaseException:
+            # Cancelled while waiting for the rate limiter
+            if trial:
+                self.circuit_breaker.release_trial()
+            raise
+        return trial
+
+    async def _recover(self, error: Exception, attempt: int, budget: Optional[RetryBudget]) -> None:
+        """Record a failed attempt and back off, or raise when it should not be retried."""
+        status, headers = _error_details(error)
+        if status is not None and status < 500:
+            # The provider answered, so it is reachable
+            self.circuit_breaker.record_success()
+        if not is_retryable(error):
+            raise error
+        
+        retry_after = _header_number({k.lower(): v for k, v in headers.items()}, 'retry-after')
+        if status == 429:
+            # Slow down instead of tripping the breaker
+            self.throttled += 1
+            self.rate_limiter.on_throttle(retry_after, headers)
+        elif status is None or status >= 500:
+            self.circuit_breaker.record_failure()
+        
+        if attempt >= self.max_attempts:
+            raise error
+        if budget is not None and not budget.spend():
+            raise RetryBudgetExceeded(f"Retry budget exhausted: {error}") from error
+        
+        # Full jitter keeps concurrent retries from arriving together
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** (attempt - 1)))
+        self.retries += 1
+        await asyncio.sleep(max(delay, retry_after or 0))
+
+    def stats(self) -> Dict[str, object]:
+        """Return retry/throttling counters and the current limiter state."""
+        return {
+            'rate_limit': round(self.rate_limiter.rate, 3),
+            'retries': self.retries,
+            'throttled': self.throttled,
+            'circuit': self.circuit_breaker.state,
+        }
+
+    def run(self, coro, timeout: Optional[float] = None):
+        """Run a coroutine on the service loop and block until it finishes."""
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("InferenceService.run() cannot be called from the service loop")
+        return self.submit(coro).result(timeout)
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        """Schedule a coroutine on the service loop and return its future.
+
+        Cancelling the future cancels the coroutine, along with the requests
+        it is waiting for.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def close(self) -> None:
+        """Close the transport and stop the loop."""
+        try:
+            self.run(self.transport.close())
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+
+
+_services: Dict[Tuple[str, Optional[str], str], InferenceService] = {}
+_services_lock = threading.Lock()
+
+
+def get_inference_service(api_key: str, base_url: Optional[str] = None,
+                          provider: str = DEFAULT_PROVIDER,
+                          max_concurrency: int = DEFAULT_MAX_CONCURRENCY) -> InferenceService:
+    """Return the shared service for these credentials, creating it on first use.
+
+    Args:
+        api_key: HuggingFace API key
+        base_url: Optional URL of an OpenAI-compatible server
+        provider: Inference provider used when no base_url is given
+        max_concurrency: Request limit used when the service is created
+
+    Returns:
+        InferenceService: Service shared by every caller with the same arguments
+    """
+    key = (api_key, base_url, provider)
+    with _services_lock:
+        service = _services.get(key)
+        if service is None:
+            transport = HuggingFaceTransport(api_key, provider=provider, base_url=base_url)
+            service = InferenceService(transport, max_concurrency=max_concurrency)
+            _services[key] = service
+        return service
@@ -0,0 +1,262 @@
+import os
+import uuid
+import threading
+import concurrent.futures
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Jobs analyzed at once, and jobs allowed to wait for a worker
+DEFAULT_JOB_WORKERS = int(os.environ.get("ANALYSIS_WORKERS", 2))
+DEFAULT_MAX_QUEUED = int(os.environ.get("ANALYSIS_MAX_QUEUED", 50))
+# Finished jobs kept for their status and result
+DEFAULT_KEEP_FINISHED = 200
+# Events kept per job for subscribers that connect late or reconnect
+MAX_JOB_EVENTS = 10000
+
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED = (COMPLETED, FAILED, CANCELLED)
+# Event published when a job finishes with each status
+FINISH_EVENTS = {COMPLETED: 'done', FAILED: 'failed', CANCELLED: 'cancelled'}
+
+
+class JobCancelled(Exception):
+    """Raised inside a job that was cancelled while it ran."""
+
+
+class JobQueueFull(Exception):
+    """Raised when a job is submitted while too many are waiting."""
+
+
+class Job:
+    def __init__(self, job_id: str, description: str = ''):
+        """A unit of background work with its status, progress and result.
+
+        Everything that happens to the job is also published as a numbered
+        event (see ``publish`` and ``wait_events``): ``status`` when it
+        starts, whatever its target publishes, and ``done``, ``failed`` or
+        ``cancelled`` last.
+
+        Args:
+            job_id: Identifier of the job
+            description: What the job does, for listings
+        """
+        self.id = job_id
+        self.description = description
+        self.status = QUEUED
+        self.created = datetime.now().isoformat()
+        self.started: Optional[str] = None
+        self.finished: Optional[str] = None
+        self.progress: Dict[str, int] = {'files_total': 0, 'files_done': 0, 'chunks_done': 0, 'threats': 0}
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._events: List[Tuple[int, str, Any]] = []
+        self._next_event = 1
+        self._cancel = threading.Event()
+        self._future: Optional[concurrent.futures.Future] = None
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel.is_set()
+
+    def update(self, **progress: int) -> None:
+        """Set progress counters, e.g. ``files_total``."""
+        with self._lock:
+            self.progress.update(progress)
+
+    def advance(self, **progress: int) -> Dict[str, int]:
+        """Add to progress counters, e.g. ``chunks_done=1``, and return all of them."""
+        with self._lock:
+            for name, count in progress.items():
+                self.progress[name] = self.progress.get(name, 0) + count
+            return dict(self.progress)
+
+    def publish(self, event: str, data: Any) -> None:
+        """Add an event for subscribers; ``data`` must be JSON serializable."""
+        with self._changed:
+            self._publish(event, data)
+
+    def wait_events(self, after: int = 0, timeout: Optional[float] = None) -> List[Tuple[int, str, Any]]:
+        """Events numbered above ``after`` as ``(id, event, data)``.
+
+        Waits up to ``timeout`` seconds for one while the job has not
+        finished; an empty list means there was none.
+        """
+        with self._changed:
+            if self._next_event - 1 <= after and self.status not in FINISHED:
+                self._changed.wait(timeout)
+            if not self._events:
+                return []
+            first = self._events[0][0]
+            return self._events[max(0, after + 1 - first):]
+
+    def _publish(self, event: str, data: Any) -> None:
+        # Called with the lock held
+        self._events.append((self._next_event, event, data))
+        self._next_event += 1
+        if len(self._events) > MAX_JOB_EVENTS:
+            del self._events[:len(self._events) - MAX_JOB_EVENTS]
+        self._changed.notify_all()
+
+    def check_cancelled(self) -> None:
+        """Raise JobCancelled if the job was asked to stop."""
+        if self._cancel.is_set():
+            raise JobCancelled(self.id)
+
+    def run_coroutine(self, service, coro) -> Any:
+        """Run a coroutine on an InferenceService, cancelling it with the job.
+
+        Raises:
+            JobCancelled: The job was cancelled before the coroutine finished
+        """
+        self.check_cancelled()
+        future = service.submit(coro)
+        with self._lock:
+            self._future = future
+        try:
+            # Cancellation may have come in before the future was recorded
+            if self._cancel.is_set():
+                future.cancel()
+            return future.result()
+        except concurrent.futures.CancelledError:
+            raise JobCancelled(self.id)
+        finally:
+            with self._lock:
+                self._future = None
+
+    def cancel(self) -> bool:
+        """Ask the job to stop; returns False once it has finished.
+
+        A queued job is cancelled at once, a running one when its target
+        next checks for it.
+        """
+        with self._lock:
+            if self.status in FINISHED:
+                return False
+            self._cancel.set()
+            if self.status == QUEUED:
+                self.status = CANCELLED
+                self.finished = datetime.now().isoformat()
+                self._publish(FINISH_EVENTS[CANCELLED], {'job_id': self.id})
+            future = self._future
+        if future is not None:
+            future.cancel()
+        return True
+
+    def _start(self) -> bool:
+        """Mark the job running unless it was cancelled while queued."""
+        with self._lock:
+            if self.status != QUEUED:
+                return False
+            self.status = RUNNING
+            self.started = datetime.now().isoformat()
+            self._publish('status', {'job_id': self.id, 'status': RUNNING, 'progress': dict(self.progress)})
+            return True
+
+    def _finish(self, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+        with self._lock:
+            self.status = status
+            self.finished = datetime.now().isoformat()
+            self.result = result
+            self.error = error
+            if status == COMPLETED:
+                self._publish(FINISH_EVENTS[status], result)
+            else:
+                self._publish(FINISH_EVENTS[status], {'job_id': self.id, 'error': error})
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Status of the job without its result."""
+        with self._lock:
+            return {
+                'job_id': self.id,
+                'description': self.description,
+                'status': self.status,
+                'created': self.created,
+                'started': self.started,
+                'finished': self.finished,
+                'progress': dict(self.progress),
+                'error': self.error,
+            }
+
+
+class JobQueue:
+    def __init__(self, max_workers: int = DEFAULT_JOB_WORKERS, max_queued: int = DEFAULT_MAX_QUEUED,
+                 keep_finished: int = DEFAULT_KEEP_FINISHED):
+        """Bounded pool of worker threads running jobs in submission order.
+
+        Args:
+            max_workers: Jobs running at once
+            max_queued: Jobs allowed to wait for a worker before submissions are refused
+            keep_finished: Finished jobs remembered for their status and result
+        """
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.keep_finished = keep_finished
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers,
+                                                               thread_name_prefix='analysis-job')
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, target: Callable[[Job], Optional[Dict[str, Any]]], description: str = '') -> Job:
+        """Queue ``target(job)``; its return value becomes the job's result.
+
+        ``target`` reports progress through the job and should call
+        ``job.check_cancelled()`` between steps, or run its coroutines with
+        ``job.run_coroutine`` so that they can be cancelled.
+
+        Raises:
+            JobQueueFull: ``max_queued`` jobs are already waiting
+        """
+        with self._lock:
+            queued = sum(1 for job in self._jobs.values() if job.status == QUEUED)
+            if queued >= self.max_queued:
+                raise JobQueueFull(f"{queued} analysis jobs are already waiting")
+            job = Job(uuid.uuid4().hex, description)
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, target)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        """Known jobs, newest first."""
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda job: job.created, reverse=True)
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job; returns False if it is unknown or finished."""
+        job = self.get(job_id)
+        return job is not None and job.cancel()
+
+    def shutdown(self, wait: bool = True) -> None:
+        for job in self.list():
+            job.cancel()
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job: Job, target: Callable[[Job], Optional[Dict[str, Any]]]) -> None:
+        if not job._start():
+            return
+        try:
+            result = target(job)
+        except JobCancelled:
+            job._finish(CANCELLED)
+        except Exception as e:
+            print(f"Error in analysis job {job.id}: {str(e)}")
+            job._finish(FAILED, error=str(e))
+        else:
+            job._finish(COMPLETED, result)
+
+    def _prune(self) -> None:
+        """Forget the oldest finished jobs beyond ``keep_finished``."""
+        finished = [job for job in self._jobs.values() if job.status in FINISHED]
+        finished.sort(key=lambda job: job.finished or '')
+        for job in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job.id]
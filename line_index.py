@@ -0,0 +1,92 @@
+from array import array
+from bisect import bisect_right
+from typing import Callable, List, Optional
+from log_sources import open_log
+
+
+class LineIndex:
+    def __init__(self, first_line: int = 1):
+        """Byte offsets of line starts in a file, stored as a compact int array.
+
+        The index is filled while the file is read (see ``analyzer.iter_lines``)
+        and may cover only a range of the file, starting at ``first_line``.
+
+        Args:
+            first_line: Line number of the first offset added
+        """
+        self.first_line = first_line
+        self.offsets = array('q')
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    @classmethod
+    def build(cls, file_path: str, start: int = 0, end: Optional[int] = None, first_line: int = 1,
+              block_size: int = 1024 * 1024, on_block: Optional[Callable[[bytes], None]] = None) -> 'LineIndex':
+        """Index the lines of a file, or of a byte range of it that starts at a line.
+
+        ``on_block`` gets every block read, e.g. to hash the file in the same pass.
+        """
+        index = cls(first_line)
+        with open_log(file_path) as f:
+            f.seek(start)
+            offset = start
+            line_start = True
+            while end is None or offset < end:
+                size = block_size if end is None else min(block_size, end - offset)
+                block = f.read(size)
+                if not block:
+                    break
+                if on_block is not None:
+                    on_block(block)
+                if line_start:
+                    index.add(offset)
+                position = block.find(b'\n')
+                while position != -1 and position + 1 < len(block):
+                    index.add(offset + position + 1)
+                    position = block.find(b'\n', position + 1)
+                line_start = position != -1
+                offset += len(block)
+        return index
+
+    def add(self, offset: int) -> None:
+        """Record the offset of the next line."""
+        self.offsets.append(offset)
+
+    @property
+    def last_line(self) -> int:
+        """Number of the last indexed line."""
+        return self.first_line + len(self.offsets) - 1
+
+    def offset_of(self, line_num: int) -> Optional[int]:
+        """Byte offset where ``line_num`` starts, or None when it is not indexed."""
+        position = line_num - self.first_line
+        if 0 <= position < len(self.offsets):
+            return self.offsets[position]
+        return None
+
+    def line_at(self, offset: int) -> Optional[int]:
+        """Number of the line containing the byte ``offset``."""
+        position = bisect_right(self.offsets, offset) - 1
+        if position < 0:
+            return None
+        return self.first_line + position
+
+    def read_lines(self, file_path: str, first: int, last: int, max_line_length: int = 64 * 1024) -> List[str]:
+        """Read lines ``first`` to ``last`` (inclusive) with a single seek."""
+        first = max(first, self.first_line)
+        last = min(last, self.last_line)
+        offset = self.offset_of(first)
+        if offset is None or last < first:
+            return []
+
+        lines = []
+        with open_log(file_path) as f:
+            f.seek(offset)
+            for line_num in range(first, last + 1):
+                # Seek per line so overlong lines are only partially read
+                next_offset = self.offset_of(line_num)
+                if f.tell() != next_offset:
+                    f.seek(next_offset)
+                lines.append(f.readline(max_line_length).decode('utf-8', errors='replace').rstrip('\r\n'))
+        return lines
@@ -0,0 +1,171 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+DEFAULT_CACHE_DIR = os.environ.get("LLM_CACHE_DIR", ".llm_cache")
+DEFAULT_MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+
+class ResponseCache:
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        """Persistent, content-addressed cache of model responses.
+
+        Entries are stored one file per key and evicted least recently used
+        first once the total size exceeds ``max_bytes``.
+
+        Args:
+            cache_dir: Directory holding the cache entries
+            max_bytes: Upper bound for the total size of all entries
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # key -> entry size, ordered from least to most recently used
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def make_key(content: str, model: str, prompt_version: str, max_tokens: int) -> str:
+        """Build the cache key for a request.
+
+        Args:
+            content: Content sent to the model (the chunk, plus any question)
+            model: Model name
+            prompt_version: Version of the system prompt used
+            max_tokens: Completion token limit
+
+        Returns:
+            str: Hex SHA-256 digest identifying the request
+        """
+        digest = hashlib.sha256()
+        for part in (model, prompt_version, str(max_tokens)):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        digest.update(content.encode('utf-8', errors='replace'))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for ``key`` or None."""
+        path = self._path(key)
+        with self._lock:
+            if key not in self._index:
+                self.misses += 1
+                return None
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+                # Keep the file mtime as the recency marker across restarts
+                os.utime(path)
+            except (OSError, ValueError):
+                # Removed by another process or corrupt; forget about it
+                self._forget(key)
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+            self.hits += 1
+            return entry.get('response')
+
+    def set(self, key: str, response: str, **metadata: Any) -> None:
+        """Store ``response`` under ``key`` and evict old entries if needed."""
+        entry = dict(metadata, response=response, created=datetime.now().isoformat())
+        data = json.dumps(entry).encode('utf-8')
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"Error writing cache entry {key}: {e}")
+                return
+
+            if key in self._index:
+                self._total_bytes -= self._index[key]
+            self._index[key] = len(data)
+            self._index.move_to_end(key)
+            self._total_bytes += len(data)
+            self._evict()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the current cache size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._index),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+    def clear(self) -> None:
+        """Remove every entry from the cache."""
+        with self._lock:
+            for key in list(self._index):
+                self._forget(key)
+
+    def _path(self, key: str) -> str:
+        # Two-level fan-out keeps directories small
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _load_index(self) -> None:
+        """Rebuild the LRU index from the entries already on disk."""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith('.json'):
+                    continue
+                try:
+                    stats = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                entries.append((stats.st_mtime, name[:-5], stats.st_size))
+
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._total_bytes += size
+        with self._lock:
+            self._evict()
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until the size bound holds."""
+        while self._total_bytes > self.max_bytes and self._index:
+            key = next(iter(self._index))
+            self._forget(key)
+            self.evictions += 1
+
+    def _forget(self, key: str) -> None:
+        size = self._index.pop(key, 0)
+        self._total_bytes -= size
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+
+_default_cache: Optional[ResponseCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> ResponseCache:
+    """Return the process-wide response cache, creating it on first use."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache()
+        return _default_cache
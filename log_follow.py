@@ -0,0 +1,281 @@
+import os
+import time
+import ctypes
+import ctypes.util
+import select
+import struct
+import asyncio
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+from checkpoints import CheckpointStore
+from log_sources import find_logs, is_log_file, log_exists, log_stat, rotation_members, split_log_name
+from network_stats import NetworkStats
+
+# Events of inotify(7) that mean a log was appended to, rotated, created or removed
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# struct inotify_event without its variable-length name
+_EVENT = struct.Struct('iIII')
+EVENT_BUFFER_SIZE = 64 * 1024
+
+# Appended bytes, or age of the oldest change, that close an analysis window
+DEFAULT_WINDOW_BYTES = 64 * 1024
+DEFAULT_WINDOW_SECONDS = 2.0
+
+# Seconds between two looks at the files when inotify is not available
+DEFAULT_POLL_INTERVAL = 1.0
+
+
+class PollingWatcher:
+    def __init__(self, paths: Iterable[str], interval: float = DEFAULT_POLL_INTERVAL):
+        """Watch logs for changes by comparing the size and mtime of their files.
+
+        Args:
+            paths: Log files, directories (searched recursively) or glob patterns
+            interval: Seconds between two looks at the files
+        """
+        self.paths = list(paths)
+        self.interval = interval
+        self._states = {log: self._state(log) for log in self.logs()}
+
+    def logs(self) -> List[str]:
+        """Logical logs named by ``paths`` (see ``log_sources.find_logs``)."""
+        return find_logs(self.paths)
+
+    def wait(self, timeout: float) -> Set[str]:
+        """Return the logs that changed, waiting up to ``timeout`` seconds for one."""
+        deadline = time.monotonic() + timeout
+        while True:
+            states = {log: self._state(log) for log in self.logs()}
+            changed = {log for log, state in states.items() if state != self._states.get(log)}
+            self._states = states
+            remaining = deadline - time.monotonic()
+            if changed or remaining <= 0:
+                return changed
+            time.sleep(min(self.interval, remaining))
+
+    def close(self) -> None:
+        pass
+
+    @staticmethod
+    def _state(log: str) -> Tuple[Tuple[str, int, int, int], ...]:
+        state = []
+        for member in rotation_members(log):
+            try:
+                stats = os.stat(member)
+            except OSError:
+                continue
+            state.append((member, stats.st_ino, stats.st_size, stats.st_mtime_ns))
+        return tuple(state)
+
+
+class InotifyWatcher:
+    def __init__(self, paths: Iterable[str]):
+        """Watch logs for changes with Linux inotify.
+
+        The directories holding the logs are watched rather than the files,
+        so appends, rotations and newly created logs are all seen. Given
+        directories are watched recursively, including subdirectories created
+        later; glob patterns are expanded once, when watching starts.
+
+        Args:
+            paths: Log files, directories or glob patterns
+
+        Raises:
+            OSError: inotify is not available on this system
+        """
+        self.paths = list(paths)
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError("inotify is not available")
+        self._libc = libc
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # Watched directories by watch descriptor, and those whose every log is followed
+        self._directories: Dict[int, str] = {}
+        self._recursive: Set[str] = set()
+        # Logs named by a file path or pattern, by absolute path
+        self._files: Dict[str, str] = {}
+
+        for path in self.paths:
+            if os.path.isdir(path):
+                for directory, _, _ in os.walk(path):
+                    self._watch(directory, recursive=True)
+                continue
+            for log in find_logs([path]):
+                self._files[os.path.abspath(log)] = log
+                self._watch(os.path.dirname(log) or '.')
+
+    def logs(self) -> List[str]:
+        """Logical logs named by ``paths`` (see ``log_sources.find_logs``)."""
+        return find_logs(self.paths)
+
+    def wait(self, timeout: float) -> Set[str]:
+        """Return the logs that changed, waiting up to ``timeout`` seconds for one."""
+        readable, _, _ = select.select([self._fd], [], [], max(0.0, timeout))
+        if not readable:
+            return set()
+        try:
+            data = os.read(self._fd, EVENT_BUFFER_SIZE)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            name = os.fsdecode(data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b'\0'))
+            offset += _EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped, any log may have changed
+                changed.update(self.logs())
+                continue
+            directory = self._directories.get(wd)
+            if directory is None or not name:
+                continue
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and directory in self._recursive:
+                    self._watch(os.path.join(directory, name), recursive=True)
+                continue
+            log = self._log_of(directory, name)
+            if log is not None:
+                changed.add(log)
+        return changed
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def _watch(self, directory: str, recursive: bool = False) -> None:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            print(f"Cannot watch {directory}: {os.strerror(ctypes.get_errno())}")
+            return
+        self._directories[wd] = directory
+        if recursive:
+            self._recursive.add(directory)
+
+    def _log_of(self, directory: str, name: str) -> Optional[str]:
+        """The followed log that a file belongs to, or None."""
+        log = os.path.join(directory, split_log_name(name)[0])
+        if directory in self._recursive and is_log_file(name):
+            return log
+        return self._files.get(os.path.abspath(log))
+
+
+def open_watcher(paths: Iterable[str], poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 polling: bool = False) -> Union[InotifyWatcher, PollingWatcher]:
+    """Watch ``paths`` with inotify, falling back to polling where it is not available."""
+    paths = list(paths)
+    if not polling:
+        try:
+            return InotifyWatcher(paths)
+        except (OSError, AttributeError) as e:
+            print(f"inotify is not available ({str(e)}), polling every {poll_interval}s instead")
+    return PollingWatcher(paths, poll_interval)
+
+
+class LogFollower:
+    def __init__(self, analyzer, watcher: Union[InotifyWatcher, PollingWatcher], checkpoints: CheckpointStore,
+                 window_bytes: int = DEFAULT_WINDOW_BYTES, window_seconds: float = DEFAULT_WINDOW_SECONDS,
+                 on_findings: Optional[Callable[[str, List[Dict[str, Any]], float], None]] = None,
+                 network_stats: Optional[NetworkStats] = None):
+        """Analyze the lines appended to followed logs in windows.
+
+        Changes reported by ``watcher`` are collected per log until
+        ``window_bytes`` have been appended since its checkpoint or its oldest
+        change is ``window_seconds`` old. The appended lines are then analyzed
+        incrementally (see ``LogAnalyzer.analyze_file_incremental_async``),
+        every log whose window closed at the same time concurrently.
+
+        Args:
+            analyzer: LogAnalyzer that analyzes the windows
+            watcher: Watcher reporting changed logs (see ``open_watcher``)
+            checkpoints: Checkpoints recording how far each log was analyzed
+            window_bytes: Appended bytes that close a window early
+            window_seconds: Age of the oldest change that closes a window
+            on_findings: Called with a log, its new findings and the seconds
+                from its first change in the window until they were known
+            network_stats: Statistics the analyzed lines are added to
+        """
+        self.analyzer = analyzer
+        self.watcher = watcher
+        self.checkpoints = checkpoints
+        self.window_bytes = window_bytes
+        self.window_seconds = window_seconds
+        self.on_findings = on_findings
+        self.network_stats = network_stats
+        # Time of the first change of every log with an open window
+        self._pending: Dict[str, float] = {}
+
+    def start(self, from_start: bool = False) -> None:
+        """Skip what the followed logs contain already.
+
+        Logs with a checkpoint catch up from it in the first window, and
+        with ``from_start`` so do logs without one.
+        """
+        now = time.monotonic()
+        for log in self.watcher.logs():
+            if not log_exists(log):
+                continue
+            if from_start or self.checkpoints.get(log) is not None:
+                self._pending[log] = now
+                continue
+            try:
+                self.checkpoints.commit(log, self.checkpoints.plan(log))
+            except OSError as e:
+                print(f"Error reading {log}: {str(e)}")
+
+    def run(self, stop: Optional[threading.Event] = None) -> None:
+        """Follow the logs until ``stop`` is set (or forever)."""
+        while stop is None or not stop.is_set():
+            now = time.monotonic()
+            timeout = self.window_seconds
+            if self._pending:
+                timeout = min(self._pending.values()) + self.window_seconds - now
+            # Wake up at least once a second to notice ``stop``
+            for log in self.watcher.wait(max(0.0, min(timeout, 1.0))):
+                self._pending.setdefault(log, time.monotonic())
+
+            now = time.monotonic()
+            due = [log for log, first_change in self._pending.items()
+                   if now - first_change >= self.window_seconds or self._appended(log) >= self.window_bytes]
+            if due:
+                self.analyze(due)
+
+    def analyze(self, logs: List[str]) -> None:
+        """Close the windows of ``logs`` and analyze what was appended to them."""
+        first_changes = {log: self._pending.pop(log, time.monotonic()) for log in logs}
+
+        async def analyze_all():
+            return await asyncio.gather(*(
+                self.analyzer.analyze_file_incremental_async(log, self.checkpoints, network_stats=self.network_stats)
+                for log in logs
+            ))
+
+        results = self.analyzer.service.run(analyze_all())
+        # Callbacks may block (reports, webhooks), so they run here rather than on the service loop
+        for log, threats in zip(logs, results):
+            if self.on_findings is not None:
+                self.on_findings(log, threats, time.monotonic() - first_changes[log])
+
+    def _appended(self, log: str) -> int:
+        """Bytes appended to a log since its checkpoint."""
+        try:
+            size, _ = log_stat(log)
+        except OSError:
+            return 0
+        checkpoint = self.checkpoints.get(log)
+        if checkpoint is None or size < checkpoint['offset']:
+            return size
+        return size - checkpoint['offset']
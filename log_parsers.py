@@ -0,0 +1,453 @@
+import re
+import json
+from array import array
+from collections import Counter
+from datetime import datetime
+from itertools import accumulate, chain, islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from log_sources import open_log
+from timestamps import access_time, stamp_time, text_time
+
+# Formats told apart by LogParser; ``generic`` takes any line
+FORMATS = ('combined', 'syslog', 'auth', 'json', 'generic')
+_FORMAT_CODES = {name: code for code, name in enumerate(FORMATS)}
+
+# Value of ``RecordBatch.ts`` for lines without a timestamp
+NO_TIME = -1
+
+# Lines per RecordBatch, and lines looked at to detect the format of a file
+BATCH_SIZE = 4096
+DETECT_LINES = 64
+
+# Syslog programs whose lines make up auth.log
+AUTH_PROGRAMS = frozenset([b'sshd', b'sudo', b'su', b'login', b'systemd-logind', b'passwd', b'chpasswd',
+                           b'useradd', b'userdel', b'usermod', b'groupadd', b'vsftpd', b'dovecot', b'polkitd'])
+
+# Apache/Nginx combined and common log format
+_ACCESS_RE = re.compile(rb'^(\S+) \S+ (\S+) \[([^\]]+)\] "(?:([A-Z]+) )?(\S*)[^"]*" (\d{3})')
+# BSD syslog ("Oct 10 13:55:36") or ISO timestamp, host and program tag
+_SYSLOG_RE = re.compile(
+    rb'^(?:([A-Z][a-z]{2}) +(\d{1,2}) (\d{2}):(\d{2}):(\d{2})'
+    rb'|(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})\S*) \S+ ([^\s\[:]+)(?:\[\d+\])?: ?'
+)
+# ISO 8601 timestamp at the start of any other line
+_ISO_RE = re.compile(rb'^\[?(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2}):(\d{2})')
+_REQUEST_RE = re.compile(rb'\b(GET|POST|PUT|DELETE|HEAD|OPTIONS|PATCH|CONNECT|TRACE) (/[^\s"]*)')
+# Failed logins and firewall ports in free text are only looked for when one
+# of these literals occurs in the lowercased text, which is much cheaper than
+# a case-insensitive search.
+_EVENT_ANCHOR_RE = re.compile(rb'fail|invalid user|incorrect password|dpt|port')
+_EVENT_RE = re.compile(
+    rb'(?P<failed>failed password|authentication failure|invalid user|failed login|login failed'
+    rb'|incorrect password)|\b(?:dpt|dst_port|dest_port|dport)[=:](?P<port>\d+)',
+    re.IGNORECASE,
+)
+# A labelled source address wins over any other IPv4 address in the text
+_SOURCE_RE = re.compile(rb'(?:\bfrom |rhost=|SRC=|src=)([0-9a-fA-F.:]*[.:][0-9a-fA-F.:]*[0-9a-fA-F])')
+_ADDRESS_RE = re.compile(_SOURCE_RE.pattern + rb'|\b(\d{1,3}(?:\.\d{1,3}){3})\b')
+_USER_RE = re.compile(rb'(?:for (?:invalid user |user )?|invalid user |user=)([^\s;,]+)', re.IGNORECASE)
+
+# Keys looked up, in order, for every field of a JSON line
+_JSON_KEYS = {
+    'ts': ('timestamp', '@timestamp', 'time', 'ts', 'datetime', 'date'),
+    'ip': ('ip', 'client_ip', 'clientip', 'remote_addr', 'remote_ip', 'src_ip', 'source_ip', 'client'),
+    'method': ('method', 'http_method', 'request_method', 'verb'),
+    'path': ('path', 'uri', 'url', 'request_uri', 'request_path'),
+    'status': ('status', 'status_code', 'http_status', 'response'),
+    'user': ('user', 'username', 'user_name', 'remote_user', 'account'),
+    'message': ('message', 'msg', 'log'),
+}
+
+# Parsed fields of a line: format, ts, ip, method, path, status, user, port, failed login
+Fields = Tuple[str, Optional[int], Optional[bytes], Optional[bytes], Optional[bytes], Optional[int],
+               Optional[bytes], Optional[int], bool]
+
+
+def _message_fields(text: bytes, want_user: bool) -> Tuple[Optional[bytes], Optional[bytes], Optional[int], bool]:
+    """Source IP, user, destination port and failed login of free text."""
+    ip = None
+    address = _ADDRESS_RE.search(text)
+    if address is not None:
+        ip = address.group(1)
+        if ip is None:
+            source = _SOURCE_RE.search(text, address.end())
+            ip = source.group(1) if source else address.group(2)
+    failed = False
+    port = None
+    if _EVENT_ANCHOR_RE.search(text.lower()) is not None:
+        match = _EVENT_RE.search(text)
+        if match is not None:
+            failed = match.group('failed') is not None
+            port = match.group('port')
+            if failed and port is None:
+                port_match = _EVENT_RE.search(text, match.end())
+                port = port_match.group('port') if port_match else None
+    user = None
+    if failed or want_user:
+        user_match = _USER_RE.search(text)
+        user = user_match.group(1) if user_match else None
+    return ip, user, int(port) if port else None, failed
+
+
+def parse_combined(line: bytes, year: int) -> Optional[Fields]:
+    """Fields of an Apache/Nginx combined or common log line, or None."""
+    match = _ACCESS_RE.match(line)
+    if match is None:
+        return None
+    ip, user, stamp, method, path, status = match.groups()
+    status = int(status)
+    return ('combined', access_time(stamp), ip, method, path, status,
+            user if user != b'-' else None, None, status == 401)
+
+
+def parse_syslog(line: bytes, year: int) -> Optional[Fields]:
+    """Fields of a syslog line, or None; lines of auth programs are in the ``auth`` format."""
+    match = _SYSLOG_RE.match(line)
+    if match is None:
+        return None
+    groups = match.groups()
+    ts = stamp_time(groups[0:5], year) if groups[0] else stamp_time(groups[5:11], year)
+    is_auth = groups[11] in AUTH_PROGRAMS
+    ip, user, port, failed = _message_fields(line[match.end():], is_auth)
+    return ('auth' if is_auth else 'syslog', ts, ip, None, None, None, user, port, failed)
+
+
+def parse_json(line: bytes, year: int) -> Optional[Fields]:
+    """Fields of a JSON object line, or None."""
+    if not line.lstrip()[:1] == b'{':
+        return None
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(record, dict):
+        return None
+
+    def get(field):
+        for key in _JSON_KEYS[field]:
+            value = record.get(key)
+            if value is not None and value != '':
+                return value
+        return None
+
+    def text(value):
+        return str(value).encode('utf-8', errors='replace') if value is not None else None
+
+    ts = get('ts')
+    if isinstance(ts, (int, float)) and not isinstance(ts, bool):
+        # Epoch seconds, or milliseconds
+        ts = int(ts / 1000 if ts > 1e11 else ts)
+    elif ts is not None:
+        ts = text_time(str(ts))
+
+    method, path = get('method'), get('path')
+    request = record.get('request')
+    if isinstance(request, str) and (method is None or path is None):
+        parts = request.split()
+        if len(parts) >= 2:
+            method, path = method or parts[0], path or parts[1]
+
+    status = get('status')
+    try:
+        status = int(status) if status is not None else None
+    except (TypeError, ValueError):
+        status = None
+
+    ip, user = text(get('ip')), text(get('user'))
+    port = None
+    failed = status == 401
+    message = get('message')
+    if message is not None:
+        message_ip, message_user, port, message_failed = _message_fields(text(message), user is None)
+        ip = ip or message_ip
+        user = user or message_user
+        failed = failed or message_failed
+    return ('json', ts, ip, text(method), text(path), status, user, port, failed)
+
+
+def parse_generic(line: bytes, year: int) -> Fields:
+    """Whatever fields can be found in a line of any other format."""
+    match = _ISO_RE.match(line)
+    ts = stamp_time(match.groups(), year) if match else None
+    request = _REQUEST_RE.search(line)
+    method, path = request.groups() if request else (None, None)
+    ip, user, port, failed = _message_fields(line, False)
+    return ('generic', ts, ip, method, path, None, user, port, failed)
+
+
+_PARSERS: Dict[str, Callable[[bytes, int], Optional[Fields]]] = {
+    'combined': parse_combined,
+    'syslog': parse_syslog,
+    'auth': parse_syslog,
+    'json': parse_json,
+}
+
+
+class StringColumn:
+    def __init__(self):
+        """Dictionary-encoded string column.
+
+        Every distinct value is decoded once and stored in ``values``; rows
+        hold its index in ``codes``, or -1 when they have no value.
+        """
+        self.values: List[str] = []
+        self.codes = array('i')
+        self._codes: Dict[bytes, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, row: int) -> Optional[str]:
+        code = self.codes[row]
+        return self.values[code] if code >= 0 else None
+
+    def extend(self, values: Iterable[Optional[bytes]]) -> None:
+        values = list(values)
+        # New distinct values get the next codes, in order of appearance
+        new = dict.fromkeys(values)
+        new.pop(None, None)
+        for value in new:
+            if value not in self._codes:
+                self._codes[value] = len(self.values)
+                self.values.append(value.decode('utf-8', errors='replace'))
+        codes = self._codes
+        codes[None] = -1
+        try:
+            self.codes.extend(array('i', map(codes.__getitem__, values)))
+        finally:
+            del codes[None]
+
+    def code(self, value: Union[str, bytes]) -> int:
+        """Code of a value, or -1 when no row has it."""
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        return self._codes.get(value, -1)
+
+    def counts(self, rows: Optional[Iterable[int]] = None) -> Counter:
+        """Number of rows per value, over ``rows`` or all rows."""
+        codes = self.codes if rows is None else (self.codes[row] for row in rows)
+        counts = Counter(codes)
+        counts.pop(-1, None)
+        return Counter({self.values[code]: count for code, count in counts.items()})
+
+
+class RecordBatch:
+    # Typed columns; absent values are NO_TIME for ts and 0 for the other numbers
+    NUMERIC_COLUMNS = ('line_num', 'offset', 'format', 'ts', 'status', 'port', 'failed')
+    STRING_COLUMNS = ('ip', 'method', 'path', 'user')
+
+    def __init__(self):
+        """Parsed log lines stored column by column.
+
+        Numbers are kept in typed arrays and strings dictionary-encoded (see
+        ``StringColumn``), so filters and aggregates compare ints instead of
+        text. ``lines`` keeps the raw lines for showing matches.
+        """
+        self.lines: List[bytes] = []
+        self.line_num = array('q')
+        self.offset = array('q')
+        self.format = array('b')
+        self.ts = array('q')
+        self.status = array('h')
+        self.port = array('i')
+        self.failed = array('b')
+        self.ip = StringColumn()
+        self.method = StringColumn()
+        self.path = StringColumn()
+        self.user = StringColumn()
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    @classmethod
+    def from_rows(cls, lines: List[bytes], rows: List[Fields], first_line: int = 1,
+                  base_offset: int = 0) -> 'RecordBatch':
+        """Build a batch from consecutive lines and their parsed fields, a column at a time."""
+        batch = cls()
+        batch.lines = lines
+        batch.line_num = array('q', range(first_line, first_line + len(lines)))
+        batch.offset = array('q', accumulate(map(len, lines), initial=base_offset))
+        batch.offset.pop()
+        if not rows:
+            return batch
+        formats, ts, ip, method, path, status, user, port, failed = zip(*rows)
+        batch.format = array('b', map(_FORMAT_CODES.__getitem__, formats))
+        batch.ts = array('q', [NO_TIME if value is None else value for value in ts])
+        batch.status = array('h', [value or 0 for value in status])
+        batch.port = array('i', [value or 0 for value in port])
+        batch.failed = array('b', failed)
+        batch.ip.extend(ip)
+        batch.method.extend(method)
+        batch.path.extend(path)
+        batch.user.extend(user)
+        return batch
+
+    def row(self, row: int) -> Dict[str, Any]:
+        """One row as a dictionary, with None for absent values."""
+        ts = self.ts[row]
+        return {
+            'line': self.lines[row].rstrip(b'\r\n').decode('utf-8', errors='replace'),
+            'line_num': self.line_num[row],
+            'offset': self.offset[row],
+            'format': FORMATS[self.format[row]],
+            'ts': ts if ts != NO_TIME else None,
+            'status': self.status[row] or None,
+            'port': self.port[row] or None,
+            'failed': bool(self.failed[row]),
+            'ip': self.ip[row],
+            'method': self.method[row],
+            'path': self.path[row],
+            'user': self.user[row],
+        }
+
+    def getter(self, column: str) -> Callable[[int], Any]:
+        """Function returning a column's value of a row, None when absent."""
+        values = getattr(self, column)
+        if isinstance(values, StringColumn):
+            return values.__getitem__
+        if column == 'ts':
+            return lambda row: values[row] if values[row] != NO_TIME else None
+        return lambda row: values[row] or None
+
+    def where(self, rows: Optional[Iterable[int]] = None, since: Optional[int] = None,
+              until: Optional[int] = None, **filters: Any) -> List[int]:
+        """Rows whose columns equal the given values, e.g. ``where(ip='10.0.0.1', status=404)``.
+
+        ``since`` and ``until`` keep rows with a timestamp in that range
+        (epoch seconds, inclusive). String values are compared by their code,
+        so a value no row has selects nothing right away.
+        """
+        selected = list(range(len(self))) if rows is None else list(rows)
+        for column, value in filters.items():
+            if column == 'format':
+                value = _FORMAT_CODES.get(value, -1)
+            values = getattr(self, column)
+            if isinstance(values, StringColumn):
+                value = values.code(value)
+                if value == -1:
+                    return []
+                values = values.codes
+            selected = [row for row in selected if values[row] == value]
+        if since is not None or until is not None:
+            low = NO_TIME + 1 if since is None else since
+            high = until
+            ts = self.ts
+            selected = [row for row in selected
+                        if ts[row] != NO_TIME and low <= ts[row] and (high is None or ts[row] <= high)]
+        return selected
+
+    def present(self, column: str, rows: Optional[Iterable[int]] = None) -> List[int]:
+        """Rows that have a value in ``column``."""
+        values = getattr(self, column)
+        if isinstance(values, StringColumn):
+            values = values.codes
+            missing = -1
+        else:
+            missing = NO_TIME if column == 'ts' else 0
+        if rows is None:
+            return [row for row, value in enumerate(values) if value != missing]
+        return [row for row in rows if values[row] != missing]
+
+
+class LogParser:
+    def __init__(self, log_format: Optional[str] = None, year: Optional[int] = None,
+                 batch_size: int = BATCH_SIZE):
+        """Parse log lines of the common formats into ``RecordBatch`` columns.
+
+        The format of a stream is detected from its first ``DETECT_LINES``
+        lines unless given. Lines are parsed with that format's compiled
+        pattern first and fall back to the other formats, ending with
+        ``generic``, so mixed files still yield what fields they have.
+
+        Args:
+            log_format: One of FORMATS, or None to detect it
+            year: Year of syslog timestamps, which leave it out (default: this year)
+            batch_size: Lines per batch
+        """
+        if log_format is not None and log_format not in FORMATS:
+            raise ValueError(f"Unknown log format: {log_format}")
+        self.log_format = log_format
+        self.year = year if year is not None else datetime.now().year
+        self.batch_size = batch_size
+
+    @staticmethod
+    def detect(lines: Iterable[bytes], year: Optional[int] = None) -> str:
+        """Format most of ``lines`` parse as; ``generic`` when none fits."""
+        year = year if year is not None else datetime.now().year
+        counts: Counter = Counter()
+        for line in lines:
+            for parse in (parse_combined, parse_syslog, parse_json):
+                fields = parse(line, year)
+                if fields is not None:
+                    counts[fields[0]] += 1
+                    break
+        if not counts:
+            return 'generic'
+        if counts['auth'] and counts['auth'] >= counts['syslog']:
+            # auth.log is syslog written by authentication programs
+            counts['auth'] += counts.pop('syslog', 0)
+        return counts.most_common(1)[0][0]
+
+    def parse_line(self, line: bytes, log_format: str = 'generic') -> Fields:
+        """Fields of one line, trying ``log_format`` first."""
+        first = _PARSERS.get(log_format)
+        if first is not None:
+            fields = first(line, self.year)
+            if fields is not None:
+                return fields
+        for parse in (parse_combined, parse_syslog, parse_json):
+            if parse is not first:
+                fields = parse(line, self.year)
+                if fields is not None:
+                    return fields
+        return parse_generic(line, self.year)
+
+    def parse_lines(self, lines: Iterable[bytes], first_line: int = 1,
+                    base_offset: int = 0) -> Iterator[RecordBatch]:
+        """Parse lines (as bytes, with their line endings) into batches.
+
+        Args:
+            lines: Lines of the log
+            first_line: Line number of the first line
+            base_offset: Byte offset of the first line within the file
+        """
+        lines = iter(lines)
+        log_format = self.log_format
+        if log_format is None:
+            head = list(islice(lines, DETECT_LINES))
+            log_format = self.detect(head, self.year)
+            lines = chain(head, lines)
+
+        first = _PARSERS.get(log_format)
+        year = self.year
+        while True:
+            batch_lines = list(islice(lines, self.batch_size))
+            if not batch_lines:
+                return
+            rows = []
+            for line in batch_lines:
+                fields = first(line, year) if first is not None else None
+                rows.append(fields if fields is not None else self.parse_line(line, log_format))
+            batch = RecordBatch.from_rows(batch_lines, rows, first_line, base_offset)
+            first_line += len(batch_lines)
+            base_offset = batch.offset[-1] + len(batch_lines[-1])
+            yield batch
+
+    def parse_file(self, file_path: str, start: int = 0, end: Optional[int] = None,
+                   first_line: int = 1) -> Iterator[RecordBatch]:
+        """Parse a log, or a byte range of it that starts at a line, into batches."""
+        with open_log(file_path) as f:
+            f.seek(start)
+            lines: Iterable[bytes] = f if end is None else _until(f, end - start)
+            yield from self.parse_lines(lines, first_line, start)
+
+
+def _until(f, size: int) -> Iterator[bytes]:
+    """Lines of ``f`` within the next ``size`` bytes."""
+    for line in f:
+        if size <= 0:
+            return
+        if len(line) > size:
+            line = line[:size]
+        size -= len(line)
+        yield line
@@ -0,0 +1,346 @@
+import io
+import os
+import glob
+import re
+import bz2
+import gzip
+import lzma
+from functools import lru_cache
+from typing import BinaryIO, Iterable, List, Optional, TextIO, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Leading bytes of the compression formats rotated logs are kept in
+COMPRESSION_MAGIC = [
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+]
+MAGIC_LENGTH = max(len(magic) for magic, _ in COMPRESSION_MAGIC)
+
+# Rotated log names: "app.log", "app.log.1", "app.log.2.gz", "app.log.gz"
+_ROTATED_RE = re.compile(r'^(?P<base>.+?)(?:\.(?P<number>\d+))?(?P<suffix>\.(?:gz|bz2|xz|zst))?$')
+
+READ_BLOCK_SIZE = 1024 * 1024
+
+
+def detect_compression(path: str) -> Optional[str]:
+    """Name of the compression format of a file by its magic bytes, or None."""
+    with open(path, 'rb') as f:
+        head = f.read(MAGIC_LENGTH)
+    for magic, name in COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def split_log_name(name: str) -> Tuple[str, int, bool]:
+    """Split a file name into its series base, rotation number and whether it has a compression suffix.
+
+    ``app.log.2.gz`` gives ``('app.log', 2, True)``; the live file
+    ``app.log`` gives ``('app.log', 0, False)``.
+    """
+    match = _ROTATED_RE.match(name)
+    number = match.group('number')
+    return match.group('base'), int(number) if number else 0, bool(match.group('suffix'))
+
+
+def is_log_file(name: str) -> bool:
+    """Whether a file name is a log, a rotated log or a compressed log."""
+    return split_log_name(os.path.basename(name))[0].endswith('.log')
+
+
+def rotation_members(path: str) -> List[str]:
+    """Existing files of the rotated series named by ``path``, oldest first.
+
+    ``app.log`` names the series ``app.log.2.gz``, ``app.log.1`` and
+    ``app.log``; the live file does not have to exist. A path that is itself
+    a rotated or compressed member names only that file.
+    """
+    directory, name = os.path.split(path)
+    if split_log_name(name)[0] != name:
+        return [path] if os.path.isfile(path) else []
+
+    try:
+        names = os.listdir(directory or '.')
+    except OSError:
+        return []
+
+    members = []
+    prefix = name + '.'
+    for candidate in names:
+        if candidate != name and not candidate.startswith(prefix):
+            continue
+        base, number, compressed = split_log_name(candidate)
+        if base == name and os.path.isfile(os.path.join(directory, candidate)):
+            # Higher numbers are older; a compressed copy precedes the plain file
+            members.append((-number, not compressed, candidate))
+    return [os.path.join(directory, candidate) for _, _, candidate in sorted(members)]
+
+
+def log_exists(path: str) -> bool:
+    """Whether ``path`` names an existing log file or rotated series."""
+    return bool(rotation_members(path))
+
+
+def list_logs(directory: str) -> List[str]:
+    """Logical logs in a directory: one path per rotated series, sorted by name.
+
+    A series is named by its live file, e.g. ``uploads/app.log`` for
+    ``app.log``, ``app.log.1`` and ``app.log.2.gz``.
+    """
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    bases = {split_log_name(name)[0] for name in names if is_log_file(name)}
+    return [os.path.join(directory, base) for base in sorted(bases)]
+
+
+def find_logs(paths: Iterable[str]) -> List[str]:
+    """Logical logs named by files, directories and glob patterns.
+
+    Directories are searched recursively (see ``list_logs``) and patterns may
+    use ``**``. Plain file paths are kept as given, whether or not they
+    exist, and rotated members are collapsed as in ``logical_logs``.
+    """
+    found = []
+    for path in paths:
+        matches = sorted(glob.glob(path, recursive=True)) if glob.has_magic(path) else [path]
+        for match in matches:
+            if not os.path.isdir(match):
+                found.append(match)
+                continue
+            for directory, subdirectories, _ in os.walk(match):
+                subdirectories.sort()
+                found.extend(list_logs(directory))
+    return logical_logs(found)
+
+
+def logical_logs(paths: Iterable[str]) -> List[str]:
+    """Collapse the members of rotated series among ``paths`` into their series.
+
+    The order of first appearance is kept and every series is listed once.
+    """
+    logs = []
+    seen = set()
+    for path in paths:
+        directory, name = os.path.split(path)
+        base = split_log_name(name)[0]
+        series = os.path.join(directory, base)
+        if base != name and os.path.abspath(path) not in map(os.path.abspath, rotation_members(series)):
+            series = path
+        if series not in seen:
+            seen.add(series)
+            logs.append(series)
+    return logs
+
+
+def stored_size(path: str) -> int:
+    """Bytes a log or rotated series takes on disk (compressed members as stored)."""
+    return sum(os.path.getsize(member) for member in rotation_members(path))
+
+
+def log_stat(path: str) -> Tuple[int, Optional[int]]:
+    """Decompressed size and inode of a log.
+
+    A rotated series has no inode of its own: rotating renames its members
+    without changing the logical stream, so None is returned for it.
+    """
+    members = rotation_members(path)
+    if not members:
+        raise FileNotFoundError(f"No such log: {path}")
+    if len(members) == 1 and members[0] == path:
+        return member_size(path), os.stat(path).st_ino
+    return sum(member_size(member) for member in members), None
+
+
+def open_log(path: str, buffering: int = -1) -> BinaryIO:
+    """Open a log for reading as decompressed bytes.
+
+    Compression is detected by magic bytes, and a rotated series (see
+    ``rotation_members``) is read as a single stream, oldest member first.
+    The returned file supports ``seek`` and ``tell`` on the decompressed
+    offsets; seeking backwards in a compressed file decompresses it again
+    from the start.
+    """
+    members = rotation_members(path)
+    if not members or (len(members) == 1 and members[0] == path):
+        return open_member(path, buffering)
+    return io.BufferedReader(LogStream(members), buffering if buffering > 0 else READ_BLOCK_SIZE)
+
+
+def open_log_text(path: str, encoding: str = 'utf-8', errors: str = 'ignore') -> TextIO:
+    """Open a log like ``open_log``, decoding it as text."""
+    return io.TextIOWrapper(open_log(path), encoding=encoding, errors=errors)
+
+
+def open_member(path: str, buffering: int = -1) -> BinaryIO:
+    """Open one file of a log, e.g. one member of a rotated series, as decompressed bytes."""
+    compression = detect_compression(path) if os.path.isfile(path) else None
+    if compression is None:
+        return open(path, 'rb', buffering=buffering)
+    if compression == 'gzip':
+        return gzip.open(path, 'rb')
+    if compression == 'bz2':
+        return bz2.open(path, 'rb')
+    if compression == 'xz':
+        return lzma.open(path, 'rb')
+    return io.BufferedReader(_ZstdReader(path), buffering if buffering > 0 else READ_BLOCK_SIZE)
+
+
+def member_size(path: str) -> int:
+    """Decompressed size of one file of a log."""
+    stats = os.stat(path)
+    if detect_compression(path) is None:
+        return stats.st_size
+    return _decompressed_size(path, stats.st_size, stats.st_mtime_ns)
+
+
+@lru_cache(maxsize=1024)
+def _decompressed_size(path: str, size: int, mtime_ns: int) -> int:
+    """Decompressed size of a compressed file, cached while it is unchanged."""
+    total = 0
+    with open_member(path) as f:
+        while True:
+            block = f.read(READ_BLOCK_SIZE)
+            if not block:
+                return total
+            total += len(block)
+
+
+class _ZstdReader(io.RawIOBase):
+    def __init__(self, path: str):
+        """Seekable reader of a zstd file; seeking backwards starts over."""
+        if zstandard is None:
+            raise OSError(f"Reading {path} needs the zstandard package")
+        self.path = path
+        self._file = None
+        self._reader = None
+        self._position = 0
+        self._reopen()
+
+    def _reopen(self) -> None:
+        self._close_reader()
+        self._file = open(self.path, 'rb')
+        self._reader = zstandard.ZstdDecompressor().stream_reader(self._file, read_across_frames=True)
+        self._position = 0
+
+    def _close_reader(self) -> None:
+        if self._reader is not None:
+            self._reader.close()
+        if self._file is not None:
+            self._file.close()
+        self._reader = self._file = None
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self._reader.read(len(buffer))
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += member_size(self.path)
+        offset = max(0, offset)
+        if offset < self._position:
+            self._reopen()
+        while self._position < offset:
+            data = self._reader.read(min(READ_BLOCK_SIZE, offset - self._position))
+            if not data:
+                break
+            self._position += len(data)
+        return self._position
+
+    def close(self) -> None:
+        self._close_reader()
+        super().close()
+
+
+class LogStream(io.RawIOBase):
+    def __init__(self, paths: List[str]):
+        """The decompressed contents of several files read as one stream.
+
+        Used for rotated series, oldest member first. Members are opened one
+        at a time, when reading reaches them.
+
+        Args:
+            paths: Member files in reading order
+        """
+        self.paths = paths
+        self._member = -1
+        self._file: Optional[BinaryIO] = None
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while True:
+            if self._file is None:
+                if self._member + 1 >= len(self.paths):
+                    return 0
+                self._open(self._member + 1)
+            count = self._file.readinto(buffer)
+            if count:
+                self._position += count
+                return count
+            self._file.close()
+            self._file = None
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += sum(member_size(path) for path in self.paths)
+        offset = max(0, offset)
+
+        self._close_member()
+        self._member = -1
+        self._position = 0
+        if offset == 0:
+            return 0
+        member_start = 0
+        for member, path in enumerate(self.paths):
+            size = member_size(path)
+            if offset < member_start + size or member == len(self.paths) - 1:
+                self._open(member)
+                self._file.seek(offset - member_start)
+                self._position = offset
+                return offset
+            member_start += size
+        return 0
+
+    def _open(self, member: int) -> None:
+        self._member = member
+        self._file = open_member(self.paths[member])
+
+    def _close_member(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self) -> None:
+        self._close_member()
+        super().close()
@@ -0,0 +1,338 @@
+import re
+import math
+import hashlib
+import ipaddress
+import threading
+from array import array
+from functools import lru_cache
+from heapq import heappop, heappush, heapreplace
+from typing import Dict, Any, List, Optional, Tuple
+from log_sources import open_log
+
+# Application protocol by well-known destination port
+PORT_PROTOCOLS = {
+    20: 'FTP', 21: 'FTP', 22: 'SSH', 23: 'TELNET', 25: 'SMTP', 53: 'DNS', 67: 'DHCP', 68: 'DHCP',
+    80: 'HTTP', 110: 'POP3', 123: 'NTP', 143: 'IMAP', 161: 'SNMP', 389: 'LDAP', 443: 'HTTPS',
+    445: 'SMB', 465: 'SMTP', 587: 'SMTP', 636: 'LDAPS', 993: 'IMAPS', 995: 'POP3S', 1433: 'MSSQL',
+    3306: 'MYSQL', 3389: 'RDP', 5432: 'POSTGRES', 5900: 'VNC', 6379: 'REDIS', 8080: 'HTTP', 8443: 'HTTPS',
+}
+
+# Entries reported per top list
+TOP_K = 10
+
+# Apache/Nginx access log: client, request line and response size
+_ACCESS_RE = re.compile(rb'^(\S+) \S+ \S+ \[[^\]]*\] "[^"]*" \d{3} (\d+|-)')
+# key=value fields of firewall and flow logs (iptables, ufw, generic)
+_SOURCE_RE = re.compile(rb'\b(?:SRC|src|src_ip|srcip|rhost)=([0-9a-fA-F.:]+)')
+_DEST_RE = re.compile(rb'\b(?:DST|dst|dst_ip|dstip)=([0-9a-fA-F.:]+)')
+_PROTO_RE = re.compile(rb'\b(?:PROTO|proto)=(\w+)')
+_PORT_RE = re.compile(rb'\b(?:DPT|dpt|dst_port|dport)=(\d+)')
+_BYTES_RE = re.compile(rb'\b(?:LEN|bytes|sent_bytes)=(\d+)')
+# sshd and similar daemons name the client as "from <ip>"
+_FROM_RE = re.compile(rb'\bfrom ([0-9a-fA-F.:]*[.:][0-9a-fA-F.:]*[0-9a-fA-F])')
+_IPV4_RE = re.compile(rb'\b\d{1,3}(?:\.\d{1,3}){3}\b')
+
+
+def _hash(item: str) -> int:
+    """Stable 64-bit hash, so sketches agree across processes."""
+    return int.from_bytes(hashlib.blake2b(item.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def normalize_ip(raw: bytes) -> Optional[str]:
+    """Canonical text of an IPv4/IPv6 address, or None when ``raw`` is not one."""
+    parts = raw.split(b'.')
+    if len(parts) == 4 and all(part.isdigit() and len(part) <= 3 and int(part) < 256 for part in parts):
+        # Plain dotted quads are already canonical unless padded with zeros
+        if not any(len(part) > 1 and part[:1] == b'0' for part in parts):
+            return raw.decode('ascii')
+    try:
+        return str(ipaddress.ip_address(raw.decode('ascii')))
+    except (UnicodeDecodeError, ValueError):
+        return None
+
+
+@lru_cache(maxsize=65536)
+def _ip_key(raw: bytes) -> Optional[Tuple[str, int]]:
+    """Canonical address and its hash; addresses repeat, so this is memoized."""
+    ip = normalize_ip(raw)
+    return (ip, _hash(ip)) if ip is not None else None
+
+
+class SpaceSaving:
+    def __init__(self, capacity: int = 100):
+        """Space-Saving heavy hitters: approximate top items in ``capacity`` counters.
+
+        When a new item arrives and all counters are taken, the item with the
+        smallest count is replaced and the new item inherits that count as its
+        possible overestimate. Any item with more than total/capacity weight
+        is guaranteed to be kept.
+
+        Args:
+            capacity: Number of items tracked
+        """
+        self.capacity = capacity
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        # One (count, item) entry per tracked item; counts may lag behind
+        self._heap: List[Tuple[int, str]] = []
+
+    def add(self, item: str, weight: int = 1) -> None:
+        count = self.counts.get(item)
+        if count is not None:
+            self.counts[item] = count + weight
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[item] = weight
+            self.errors[item] = 0
+            heappush(self._heap, (weight, item))
+            return
+
+        # Bring the smallest heap entry up to date until it is the real minimum
+        while True:
+            low, victim = self._heap[0]
+            current = self.counts[victim]
+            if current == low:
+                break
+            heapreplace(self._heap, (current, victim))
+        heappop(self._heap)
+        del self.counts[victim]
+        del self.errors[victim]
+        self.counts[item] = low + weight
+        self.errors[item] = low
+        heappush(self._heap, (low + weight, item))
+
+    def merge(self, other: 'SpaceSaving') -> None:
+        for item, count in other.counts.items():
+            self.add(item, count)
+
+    def top(self, k: int) -> List[Tuple[str, int]]:
+        """The ``k`` items with the highest counts, highest first."""
+        return sorted(self.counts.items(), key=lambda entry: (-entry[1], entry[0]))[:k]
+
+
+class CountMinSketch:
+    def __init__(self, width: int = 2048, depth: int = 4):
+        """Count-Min sketch: frequency estimates that never undercount.
+
+        Args:
+            width: Counters per row; the error is about total * e / width
+            depth: Rows; the error bound holds with probability 1 - e^-depth
+        """
+        self.width = width
+        self.depth = depth
+        self.table = array('q', [0]) * (width * depth)
+
+    def _cells(self, hashed: int) -> List[int]:
+        # Kirsch-Mitzenmacher: rows use h1 + i * h2 from one 64-bit hash
+        h1, h2 = hashed & 0xFFFFFFFF, (hashed >> 32) | 1
+        width = self.width
+        cells = []
+        for row in range(self.depth):
+            cells.append(row * width + (h1 + row * h2) % width)
+        return cells
+
+    def add(self, hashed: int, weight: int = 1) -> None:
+        table = self.table
+        for cell in self._cells(hashed):
+            table[cell] += weight
+
+    def estimate(self, hashed: int) -> int:
+        table = self.table
+        return min([table[cell] for cell in self._cells(hashed)])
+
+    def merge(self, other: 'CountMinSketch') -> None:
+        for cell, value in enumerate(other.table):
+            if value:
+                self.table[cell] += value
+
+
+class HyperLogLog:
+    def __init__(self, precision: int = 12):
+        """HyperLogLog distinct count estimate in 2^precision one-byte registers.
+
+        Args:
+            precision: Bits of the hash used to pick a register; the standard
+                error is about 1.04 / sqrt(2^precision), 1.6% at 12
+        """
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(self.size)
+
+    def add(self, hashed: int) -> None:
+        index = hashed >> (64 - self.precision)
+        rest = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: 'HyperLogLog') -> None:
+        for index, rank in enumerate(other.registers):
+            if rank > self.registers[index]:
+                self.registers[index] = rank
+
+    def count(self) -> int:
+        size = self.size
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(2.0 ** -rank for rank in self.registers)
+        empty = self.registers.count(0)
+        if estimate <= 2.5 * size and empty:
+            # Linear counting is more accurate for small cardinalities
+            estimate = size * math.log(size / empty)
+        return int(round(estimate))
+
+
+class NetworkStats:
+    def __init__(self, capacity: int = 100):
+        """Traffic statistics of log files, gathered in one pass with fixed memory.
+
+        Lines are parsed for their source and destination IP, bytes and
+        protocol (access logs, firewall and flow logs, sshd-style "from"
+        lines, else the first two IPv4 addresses). Top talkers are tracked
+        with Space-Saving and refined with Count-Min estimates; unique
+        addresses are counted with HyperLogLog. Statistics of several files
+        can be merged, and ``scan_file`` may be called from several threads.
+
+        Args:
+            capacity: Items tracked per heavy hitter list
+        """
+        self.lines = 0
+        self.total_bytes = 0
+        self.sources = SpaceSaving(capacity)
+        self.destinations = SpaceSaving(capacity)
+        self.protocols: Dict[str, int] = {}
+        self.source_counts = CountMinSketch()
+        self.source_bytes = CountMinSketch()
+        self.destination_counts = CountMinSketch()
+        self.unique_sources = HyperLogLog()
+        self.unique_destinations = HyperLogLog()
+        self._lock = threading.Lock()
+
+    def scan_file(self, log_file: str, start: int = 0, end: Optional[int] = None) -> None:
+        """Add the lines of a file, or of a byte range of it, to the statistics."""
+        stats = NetworkStats(self.sources.capacity)
+        try:
+            with open_log(log_file) as f:
+                f.seek(start)
+                remaining = None if end is None else end - start
+                for line in f:
+                    if remaining is not None:
+                        if remaining <= 0:
+                            break
+                        remaining -= len(line)
+                    stats.add_line(line)
+        except Exception as e:
+            print(f"Error collecting network statistics for {log_file}: {str(e)}")
+        self.merge(stats)
+
+    def add_line(self, line: bytes) -> None:
+        """Parse one log line (as bytes) and count it."""
+        self.lines += 1
+        source = destination = protocol = None
+        size = 0
+
+        match = _ACCESS_RE.match(line)
+        if match:
+            source = match.group(1)
+            protocol = 'HTTP'
+            if match.group(2) != b'-':
+                size = int(match.group(2))
+        else:
+            match = _SOURCE_RE.search(line)
+            if match:
+                source = match.group(1)
+                match = _DEST_RE.search(line)
+                destination = match.group(1) if match else None
+                match = _PORT_RE.search(line)
+                if match:
+                    protocol = PORT_PROTOCOLS.get(int(match.group(1)))
+                if protocol is None:
+                    match = _PROTO_RE.search(line)
+                    protocol = match.group(1).decode('ascii').upper() if match else None
+                match = _BYTES_RE.search(line)
+                if match:
+                    size = int(match.group(1))
+            else:
+                match = _FROM_RE.search(line)
+                if match:
+                    source = match.group(1)
+                    if b'sshd' in line:
+                        protocol = 'SSH'
+                else:
+                    addresses = _IPV4_RE.findall(line)
+                    if addresses:
+                        source = addresses[0]
+                        destination = addresses[1] if len(addresses) > 1 else None
+
+        self.add(_ip_key(source) if source else None, _ip_key(destination) if destination else None,
+                 size, protocol)
+
+    def add(self, source: Optional[Tuple[str, int]], destination: Optional[Tuple[str, int]], size: int = 0,
+            protocol: Optional[str] = None) -> None:
+        """Count one connection or request between ``(address, hash)`` pairs."""
+        self.total_bytes += size
+        if source is not None:
+            source, hashed = source
+            self.sources.add(source)
+            self.source_counts.add(hashed)
+            if size:
+                self.source_bytes.add(hashed, size)
+            self.unique_sources.add(hashed)
+        if destination is not None:
+            destination, hashed = destination
+            # Destinations are ranked by volume, or by count when sizes are unknown
+            self.destinations.add(destination, size or 1)
+            self.destination_counts.add(hashed)
+            self.unique_destinations.add(hashed)
+        if protocol is not None:
+            self.protocols[protocol] = self.protocols.get(protocol, 0) + 1
+
+    def merge(self, other: 'NetworkStats') -> None:
+        with self._lock:
+            self.lines += other.lines
+            self.total_bytes += other.total_bytes
+            self.sources.merge(other.sources)
+            self.destinations.merge(other.destinations)
+            for protocol, count in other.protocols.items():
+                self.protocols[protocol] = self.protocols.get(protocol, 0) + count
+            self.source_counts.merge(other.source_counts)
+            self.source_bytes.merge(other.source_bytes)
+            self.destination_counts.merge(other.destination_counts)
+            self.unique_sources.merge(other.unique_sources)
+            self.unique_destinations.merge(other.unique_destinations)
+
+    def to_dict(self, k: int = TOP_K) -> Dict[str, Any]:
+        """Statistics in the ``network_stats`` format of JSON reports.
+
+        Counts of the top lists are estimates: the smaller of the Space-Saving
+        and Count-Min counts, both of which can only overestimate.
+        """
+        with self._lock:
+            source_ips = []
+            for ip, count in self.sources.top(k):
+                hashed = _hash(ip)
+                source_ips.append({
+                    'ip': ip,
+                    'count': min(count, self.source_counts.estimate(hashed)),
+                    'bytes': self.source_bytes.estimate(hashed),
+                    'private': ipaddress.ip_address(ip).is_private,
+                })
+            dest_ips = []
+            for ip, volume in self.destinations.top(k):
+                count = self.destination_counts.estimate(_hash(ip))
+                dest_ips.append({
+                    'ip': ip,
+                    'volume': volume if self.total_bytes else count,
+                    'count': count,
+                    'private': ipaddress.ip_address(ip).is_private,
+                })
+            protocols = [{'protocol': protocol, 'count': count} for protocol, count in
+                         sorted(self.protocols.items(), key=lambda entry: -entry[1])[:k]]
+            return {
+                'lines': self.lines,
+                'total_bytes': self.total_bytes,
+                'unique_source_ips': self.unique_sources.count(),
+                'unique_dest_ips': self.unique_destinations.count(),
+                'source_ips': source_ips,
+                'dest_ips': dest_ips,
+                'protocols': protocols,
+            }
@@ -1,53 +1,82 @@
 import json
 from datetime import datetime
 import hashlib
-import os
+from line_index import LineIndex
+from log_sources import log_exists
 
-def generate_report(threats, output_file, format_type):
-    """Generate a report of identified threats."""
+# Lines of context shown around a threat
+CONTEXT_LINES = 2
+
+def generate_report(threats, output_file, format_type, network_stats=None):
+    """Generate a report of identified threats.
+    
+    ``network_stats`` (see ``NetworkStats.to_dict``) is included in JSON
+    reports, where the dashboard reads it.
+    """
     # Enrich threats with additional information
     enriched_threats = _enrich_threats(threats)
     
     if format_type == 'txt':
         _generate_txt_report(enriched_threats, output_file)
     elif format_type == 'json':
-        _generate_json_report(enriched_threats, output_file)
+        _generate_json_report(enriched_threats, output_file, network_stats)
     elif format_type == 'html':
         _generate_html_report(enriched_threats, output_file)
     else:
         print(f"Unsupported report format: {format_type}")
 
+def _index_log(file_path):
+    """Index the lines of a log and compute the MD5 and SHA256 of its decompressed content, in one pass."""
+    md5 = hashlib.md5()
+    sha256 = hashlib.sha256()
+    
+    def update(block):
+        md5.update(block)
+        sha256.update(block)
+    
+    index = LineIndex.build(file_path, on_block=update)
+    return {'md5': md5.hexdigest(), 'sha256': sha256.hexdigest()}, index
+
+def _read_context(file_path, index, byte_offset, line_num):
+    """Return the lines before and after a threat's line, read with a single seek through the line index.
+    
+    The line is found by its byte offset when the threat has one.
+    """
+    if byte_offset is not None:
+        line_num = index.line_at(byte_offset)
+    if line_num is None or not index.first_line <= line_num <= index.last_line:
+        return [], []
+    first = max(line_num - CONTEXT_LINES, index.first_line)
+    lines = index.read_lines(file_path, first, line_num + CONTEXT_LINES)
+    return lines[:line_num - first], lines[line_num - first + 1:]
+
 def _enrich_threats(threats):
     """Add additional information to threats before reporting."""
     enriched = []
+    # Hash and index each file once, however many threats it has
+    logs = {}
     for threat in threats:
         # Create a copy to avoid modifying the original
         t = threat.copy()
         
         # Add file hash if file exists
-        if os.path.exists(t.get('file', '')):
+        if log_exists(t.get('file', '')):
             try:
-                with open(t['file'], 'rb') as f:
-                    content = f.read()
-                    t['file_hash'] = {
-                        'md5': hashlib.md5(content).hexdigest(),
-                        'sha256': hashlib.sha256(content).hexdigest()
-                    }
+                if t['file'] not in logs:
+                    logs[t['file']] = _index_log(t['file'])
+                t['file_hash'] = logs[t['file']][0]
             except:
                 pass
         
         # Add context lines if not already present
-        if 'context_before' not in t and 'context_after' not in t and os.path.exists(t.get('file', '')):
-            try:
-                with open(t['file'], 'r') as f:
-                    lines = f.readlines()
-                    line_num = t.get('line_num', 0)
-                    context_before = max(0, line_num - 3)
-                    context_after = min(len(lines), line_num + 2)
-                    t['context_before'] = [lines[i].rstrip() for i in range(context_before, line_num - 1)]
-                    t['context_after'] = [lines[i].rstrip() for i in range(line_num, context_after)]
-            except:
-                pass
+        if 'context_before' not in t and 'context_after' not in t and t.get('file') in logs:
+            line_num = t.get('line_num', 0)
+            if isinstance(line_num, int) and (line_num > 0 or t.get('byte_offset') is not None):
+                try:
+                    t['context_before'], t['context_after'] = _read_context(t['file'], logs[t['file']][1],
+                                                                            t.get('byte_offset'), line_num)
+                except:
+                    pass
         
         # Add risk score if not present
         if 'risk_score' not in t:
@@ -149,7 +178,7 @@ def _generate_txt_report(threats, output_file):
                     
                     f.write("\n")
 
-def _generate_json_report(threats, output_file):
+def _generate_json_report(threats, output_file, network_stats=None):
     """Generate a JSON report."""
     # Calculate summary metrics
     severity_count = {"critical": 0, "high": 0, "medium": 0, "low": 0, "info": 0}
@@ -166,6 +195,8 @@ def _generate_json_report(threats, output_file):
         },
         'threats': threats
     }
+    if network_stats is not None:
+        report['network_stats'] = network_stats
     
     with open(output_file, 'w') as f:
         json.dump(report, f, indent=2)
@@ -0,0 +1,391 @@
+import re
+import bisect
+import itertools
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+from log_sources import open_log
+
+# Hyperscan is optional; without it the engine falls back to anchor search + re
+try:
+    import hyperscan
+except ImportError:
+    hyperscan = None
+
+# Rule pack in the spirit of YARA rules: every rule has a set of named byte
+# patterns and matches a line when any of them is found. Patterns are matched
+# case-insensitively and must not use named groups or backreferences, since all
+# of them are compiled into one alternation.
+#
+# ``anchors`` are lowercase literals of which at least one occurs in every match
+# of the rule. They are located with plain substring search, and only lines
+# containing an anchor are handed to the regex, which keeps the scan fast on
+# mostly benign logs. Rules without anchors are matched against every line.
+DEFAULT_RULES = [
+    {
+        'id': 'AUTH-001',
+        'name': 'Failed Login Attempt',
+        'severity': 'medium',
+        'category': 'authentication',
+        'description': 'A login attempt failed or was rejected by the authentication system',
+        'remediation': 'Check whether the source is expected and consider rate limiting or blocking repeated failures',
+        'anchors': [b'failed password', b'authentication failure', b'invalid user', b'failed login', b'login failed'],
+        'strings': {
+            '$failed_password': rb'failed password for',
+            '$auth_failure': rb'authentication failure',
+            '$invalid_user': rb'invalid user \S+',
+            '$login_failed': rb'(?:failed login|login failed)',
+        },
+    },
+    {
+        'id': 'SQLI-001',
+        'name': 'SQL Injection Attempt',
+        'severity': 'high',
+        'category': 'sql_injection',
+        'description': 'The request contains SQL syntax commonly used to inject queries',
+        'remediation': 'Use parameterized queries and validate input; block the source if the attempt is repeated',
+        # A bare quote is in too many benign lines to be an anchor, so quote
+        # patterns allow one separator at most and list every spelling
+        'anchors': [b'union', b"'or", b"' or", b"'+or", b"'%20or", b'%27or', b'%27 or', b'%27+or', b'%27%20or',
+                    b"'--", b'%27--', b'sleep(', b'benchmark(', b'waitfor', b'information_schema', b'drop'],
+        'strings': {
+            '$union_select': rb'union(?:\s|%20|\+|/\*.*?\*/)+(?:all(?:\s|%20|\+)+)?select',
+            '$or_true': rb"(?:'|%27)(?: |%20|\+)?or(?:\s|%20|\+)+(?:'|%27)?\d+(?:'|%27)?(?:\s|%20|\+)*=",
+            '$quote_comment': rb"(?:'|%27)--",
+            '$time_based': rb'(?:sleep\(\d+\)|benchmark\(\d+|waitfor(?:\s|%20|\+)+delay)',
+            '$schema_probe': rb'information_schema',
+            '$drop_table': rb';(?:\s|%20|\+)*drop(?:\s|%20|\+)+table',
+        },
+    },
+    {
+        'id': 'XSS-001',
+        'name': 'Cross-Site Scripting Attempt',
+        'severity': 'high',
+        'category': 'xss',
+        'description': 'The request contains script content that could be reflected into a page',
+        'remediation': 'Encode output and validate input; review the affected endpoint for reflected content',
+        'anchors': [b'script', b'onerror', b'onload', b'onmouseover', b'onfocus', b'document.cookie'],
+        'strings': {
+            '$script_tag': rb'(?:<|%3c)script',
+            '$js_scheme': rb'javascript:',
+            '$event_handler': rb'\bon(?:error|load|mouseover|focus)(?:\s|%20)*(?:=|%3d)',
+            '$cookie_access': rb'document\.cookie',
+        },
+    },
+    {
+        'id': 'FILE-001',
+        'name': 'Sensitive File Access',
+        'severity': 'high',
+        'category': 'sensitive_file_access',
+        'description': 'A request tried to read a sensitive file or traverse outside the web root',
+        'remediation': 'Verify the file was not served and restrict access to sensitive paths',
+        'anchors': [b'/etc/', b'../', b'..%2f', b'%2e%2e', b'/.env', b'/.git/', b'/.htpasswd', b'/.aws/',
+                    b'wp-config', b'web.config', b'id_rsa'],
+        'strings': {
+            '$passwd': rb'/etc/(?:passwd|shadow)',
+            '$traversal': rb'(?:\.\./|\.\.%2f|%2e%2e(?:/|%2f))',
+            '$dotfiles': rb'/\.(?:env|git/|htpasswd|aws/)',
+            '$config': rb'(?:wp-config\.php|web\.config|id_rsa)',
+        },
+    },
+    {
+        'id': 'CMD-001',
+        'name': 'Command Injection Attempt',
+        'severity': 'critical',
+        'category': 'command_injection',
+        'description': 'The input contains shell metacharacters followed by a system command',
+        'remediation': 'Never pass user input to a shell; audit the affected endpoint and host',
+        'anchors': [b'whoami', b'uname', b'wget', b'curl', b'chmod', b'bash', b'cat', b'$(', b'/bin/', b'cmd.exe',
+                    b'powershell'],
+        'strings': {
+            '$chained_cmd': rb'(?:;|\||&&|%3b|%7c|%26%26)(?:\s|%20|\+)*(?:whoami|uname|wget|curl|chmod|bash|cat(?:\s|%20|\+)+/)',
+            '$subshell': rb'\$\((?:[^)\n]{1,100})\)',
+            '$shell_path': rb'/bin/(?:ba)?sh\b',
+            '$win_shell': rb'(?:cmd\.exe|powershell(?:\.exe)?\s+-)',
+        },
+    },
+    {
+        'id': 'SCAN-001',
+        'name': 'Scanner Activity',
+        'severity': 'medium',
+        'category': 'scanning',
+        'description': 'The request was made by a known vulnerability or port scanning tool',
+        'remediation': 'Block the scanning source and review exposed services',
+        'anchors': [b'nmap', b'nikto', b'sqlmap', b'masscan', b'zgrab', b'dirbuster', b'gobuster', b'wpscan',
+                    b'port scan', b'portscan'],
+        'strings': {
+            '$tool_agent': rb'\b(?:nmap|nikto|sqlmap|masscan|zgrab|dirbuster|gobuster|wpscan)\b',
+            '$port_scan': rb'port ?scan',
+        },
+    },
+    {
+        'id': 'ADMIN-001',
+        'name': 'Privileged Access',
+        'severity': 'low',
+        'category': 'admin_access',
+        'description': 'An administrative interface or privileged account was accessed',
+        'remediation': 'Confirm the access was authorized',
+        'anchors': [b'/wp-admin', b'/phpmyadmin', b'/administrator', b' for root', b'root login', b'sudo:'],
+        'strings': {
+            '$admin_panel': rb'/(?:wp-admin|phpmyadmin|administrator)\b',
+            '$root_login': rb'(?:accepted \w+ for root|root login)',
+            '$sudo': rb'sudo:\s+\S+\s+:.*command=',
+        },
+    },
+]
+
+
+class SignatureEngine:
+    def __init__(self, rules: Optional[List[Dict[str, Any]]] = None,
+                 block_size: int = 8 * 1024 * 1024, max_threats: int = 10000,
+                 use_hyperscan: bool = True, max_line_length: int = 1024 * 1024):
+        """Compile a rule pack into a single-pass matcher.
+
+        Args:
+            rules: Rule dictionaries in the format of DEFAULT_RULES
+            block_size: Number of bytes read from the file at a time
+            max_threats: Stop reporting after this many threats per file
+            use_hyperscan: Use Hyperscan when it is installed
+            max_line_length: Bytes of a line that are scanned; the rest of a longer line is skipped
+        """
+        self.rules = rules if rules is not None else DEFAULT_RULES
+        self.block_size = block_size
+        self.max_threats = max_threats
+        self.max_line_length = max_line_length
+
+        # Flatten every (rule, string) pair; its index is the pattern id
+        self._strings: List[Tuple[Dict[str, Any], str]] = []
+        patterns = []
+        for rule in self.rules:
+            for string_id, pattern in rule['strings'].items():
+                self._strings.append((rule, string_id))
+                patterns.append(pattern)
+
+        self._database = None
+        # Per-thread Hyperscan scratch, so files can be scanned concurrently
+        self._scratch = threading.local()
+        if use_hyperscan and hyperscan is not None and patterns:
+            self._database = hyperscan.Database()
+            self._database.compile(
+                expressions=patterns,
+                ids=list(range(len(patterns))),
+                elements=len(patterns),
+                flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SOM_LEFTMOST] * len(patterns),
+            )
+
+        # Fallback: one alternation with a named group per string, only run on
+        # lines that contain one of the rule anchors
+        self._regex = None
+        if patterns:
+            self._regex = re.compile(
+                b'|'.join(b'(?P<s%d>%s)' % (index, pattern) for index, pattern in enumerate(patterns)),
+                re.IGNORECASE,
+            )
+        anchors = {anchor for rule in self.rules for anchor in rule.get('anchors', [])}
+        # An anchor containing another one adds no candidate lines
+        self._anchors = sorted(anchor for anchor in anchors
+                               if not any(other != anchor and other in anchor for other in anchors))
+        self._scan_all_lines = any(not rule.get('anchors') for rule in self.rules)
+
+    @property
+    def backend(self) -> str:
+        """Name of the matching backend in use."""
+        return 'hyperscan' if self._database is not None else 're'
+
+    def scan_file(self, log_file: str, start: int = 0, end: Optional[int] = None,
+                  first_line: int = 1) -> List[Dict[str, Any]]:
+        """Scan a file as bytes and return one threat per matching line and rule.
+
+        Only the bytes from ``start`` up to ``end`` are scanned; ``first_line``
+        is the line number of the line starting at ``start``. Like
+        ``analyzer.iter_lines``, only the first ``max_line_length`` bytes of a
+        longer line are scanned, so memory stays bounded.
+        """
+        threats: List[Dict[str, Any]] = []
+        if not self._strings:
+            return threats
+
+        try:
+            with open_log(log_file) as f:
+                f.seek(start)
+                offset = start
+                line_num = first_line
+                carry = b''
+                # Within the skipped rest of an overlong line
+                skipping = False
+                while len(threats) < self.max_threats:
+                    size = self.block_size
+                    if end is not None:
+                        size = max(0, min(size, end - offset - len(carry)))
+                    block = f.read(size) if size else b''
+                    data = carry + block if carry else block
+                    if not data:
+                        break
+
+                    if skipping:
+                        newline = data.find(b'\n')
+                        if newline == -1:
+                            offset += len(data)
+                            continue
+                        offset += newline + 1
+                        line_num += 1
+                        data = data[newline + 1:]
+                        skipping = False
+
+                    # Only scan whole lines; the tail is carried into the next block
+                    cut = data.rfind(b'\n') + 1 if block else len(data)
+                    if cut == 0:
+                        if len(data) < self.max_line_length:
+                            carry = data
+                            continue
+                        threats.extend(self.scan_bytes(data[:self.max_line_length], log_file, offset, line_num))
+                        offset += len(data)
+                        carry = b''
+                        skipping = True
+                        continue
+
+                    threats.extend(self.scan_bytes(data[:cut], log_file, offset, line_num))
+                    line_num += data.count(b'\n', 0, cut)
+                    offset += cut
+                    carry = data[cut:]
+        except Exception as e:
+            print(f"Error scanning file {log_file}: {str(e)}")
+
+        return threats[:self.max_threats]
+
+    def scan_bytes(self, data: bytes, log_file: str, base_offset: int = 0,
+                   base_line: int = 1) -> List[Dict[str, Any]]:
+        """Scan a buffer of whole lines.
+
+        Args:
+            data: Bytes to scan
+            log_file: File name recorded in the threats
+            base_offset: Byte offset of ``data`` within the file
+            base_line: Line number of the first line in ``data``
+
+        Returns:
+            list: Threat dictionaries with ``matched_strings`` as
+            ``(string_id, offset, data)`` tuples using file byte offsets
+        """
+        threats: Dict[Tuple[int, str], Dict[str, Any]] = {}
+        if not self._strings:
+            return []
+
+        if self._database is not None:
+            matches = self._match_hyperscan(data)
+        else:
+            matches = self._match_regex(data)
+
+        line_num = base_line
+        last_pos = 0
+        detection_time = datetime.now().isoformat()
+
+        for start, end, index in matches:
+            line_num += data.count(b'\n', last_pos, start)
+            last_pos = start
+
+            rule, string_id = self._strings[index]
+            line_start = data.rfind(b'\n', 0, start) + 1
+            matched = data[start:end].decode('utf-8', errors='replace')
+
+            key = (line_start, rule['id'])
+            threat = threats.get(key)
+            if threat is None:
+                line_end = data.find(b'\n', start)
+                if line_end == -1:
+                    line_end = len(data)
+                line_text = data[line_start:line_end].rstrip(b'\r').decode('utf-8', errors='replace')
+                threat = {
+                    'rule_id': rule['id'],
+                    'rule_name': rule['name'],
+                    'severity': rule['severity'],
+                    'category': rule.get('category', ''),
+                    'line': line_text,
+                    'line_num': line_num,
+                    'byte_offset': base_offset + line_start,
+                    'file': log_file,
+                    'matched': matched,
+                    'matched_strings': [],
+                    'timestamp': detection_time,
+                    'description': rule.get('description', ''),
+                    'remediation': rule.get('remediation', ''),
+                }
+                threats[key] = threat
+            threat['matched_strings'].append((string_id, base_offset + start, matched))
+
+        return list(threats.values())
+
+    def match_lines(self, lines: List[str]) -> List[bool]:
+        """Return for each of ``lines`` whether any rule matches it.
+
+        The lines are matched together as one buffer, so every anchor is
+        searched for once rather than once per line.
+        """
+        matched = [False] * len(lines)
+        if not self._strings or not lines:
+            return matched
+
+        encoded = [line.encode('utf-8', errors='replace') for line in lines]
+        starts = list(itertools.accumulate((len(line) + 1 for line in encoded), initial=0))
+        data = b'\n'.join(encoded)
+        if self._database is not None:
+            matches = self._match_hyperscan(data)
+        else:
+            matches = self._match_regex(data)
+        for start, _, _ in matches:
+            matched[bisect.bisect_right(starts, start) - 1] = True
+        return matched
+
+    def _match_hyperscan(self, data: bytes) -> List[Tuple[int, int, int]]:
+        """Return ``(start, end, pattern_index)`` matches found by Hyperscan."""
+        # Hyperscan reports every end offset of a match; keep the longest one
+        longest: Dict[Tuple[int, int], int] = {}
+
+        def on_match(index, start, end, flags, context):
+            key = (start, index)
+            if end > longest.get(key, -1):
+                longest[key] = end
+
+        # A scratch space may only be used by one scan at a time
+        scratch = getattr(self._scratch, 'value', None)
+        if scratch is None:
+            scratch = self._scratch.value = hyperscan.Scratch(self._database)
+        self._database.scan(data, match_event_handler=on_match, scratch=scratch)
+        return sorted((start, end, index) for (start, index), end in longest.items())
+
+    def _match_regex(self, data: bytes) -> List[Tuple[int, int, int]]:
+        """Return ``(start, end, pattern_index)`` matches found by the re fallback."""
+        matches = []
+        if self._scan_all_lines:
+            spans = [(0, len(data))]
+        else:
+            spans = self._candidate_lines(data)
+
+        for line_start, line_end in spans:
+            # Restart right after each match start so overlapping strings are
+            # reported as well, like Hyperscan does
+            match = self._regex.search(data, line_start, line_end)
+            while match:
+                matches.append((match.start(), match.end(), int(match.lastgroup[1:])))
+                match = self._regex.search(data, match.start() + 1, line_end)
+        return matches
+
+    def _candidate_lines(self, data: bytes) -> List[Tuple[int, int]]:
+        """Return sorted ``(start, end)`` spans of lines containing an anchor."""
+        lowered = data.lower()
+        starts = set()
+        for anchor in self._anchors:
+            pos = lowered.find(anchor)
+            while pos != -1:
+                starts.add(lowered.rfind(b'\n', 0, pos) + 1)
+                # Continue after this line, it is already a candidate
+                line_end = lowered.find(b'\n', pos)
+                if line_end == -1:
+                    break
+                pos = lowered.find(anchor, line_end + 1)
+
+        spans = []
+        for line_start in sorted(starts):
+            line_end = data.find(b'\n', line_start)
+            spans.append((line_start, len(data) if line_end == -1 else line_end))
+        return spans
@@ -18,6 +18,9 @@ document.addEventListener('DOMContentLoaded', function() {
     // Setup upload modal functionality
     setupUploadModal();
     
+    // Follow analyses that are still running
+    watchActiveAnalyses();
+    
     // Add event listener for refresh button
     const refreshBtn = document.getElementById('refreshDashboardBtn');
     if (refreshBtn) {
@@ -39,6 +42,90 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 });
 
+/**
+ * Subscribe to the progress of the analyses that are queued or running.
+ * Threats are added to the statistics as they are found, and a finished
+ * analysis updates the report count and last analysis time itself instead
+ * of the statistics being fetched again.
+ */
+function watchActiveAnalyses() {
+    fetch('/jobs')
+        .then(response => response.json())
+        .then(data => {
+            (data.jobs || [])
+                .filter(job => job.status === 'queued' || job.status === 'running')
+                .forEach(job => watchAnalysis(job));
+        })
+        .catch(error => console.error('Error loading analysis jobs:', error));
+}
+
+/**
+ * Render one analysis in the running analyses panel and follow its events
+ */
+function watchAnalysis(job) {
+    const container = document.getElementById('activeAnalysesContainer');
+    const list = document.getElementById('activeAnalysesList');
+    if (!container || !list || document.getElementById(`analysis-${job.job_id}`)) return;
+    
+    const item = document.createElement('li');
+    item.id = `analysis-${job.job_id}`;
+    item.className = 'list-group-item d-flex justify-content-between align-items-center';
+    item.innerHTML = `
+        <div>
+            <div class="analysis-description"></div>
+            <small class="text-muted analysis-progress">${formatJobProgress(job)}</small>
+        </div>
+        <div class="spinner-border spinner-border-sm text-primary" role="status">
+            <span class="visually-hidden">Analyzing...</span>
+        </div>
+    `;
+    item.querySelector('.analysis-description').textContent = job.description || 'Log analysis';
+    list.appendChild(item);
+    container.classList.remove('d-none');
+    
+    const progressText = item.querySelector('.analysis-progress');
+    const threatsCount = document.getElementById('threatsCount');
+    // Threats counted live, replaced by the summary once the analysis is done
+    let liveThreats = 0;
+    const remove = () => {
+        item.remove();
+        if (!list.children.length) container.classList.add('d-none');
+    };
+    const progress = data => {
+        progressText.textContent = formatJobProgress(Object.assign({}, job, { status: 'running', progress: data.progress }));
+    };
+    
+    subscribeToAnalysisJob(job.job_id, {
+        status: data => {
+            job = data;
+            progressText.textContent = formatJobProgress(job);
+        },
+        chunk: progress,
+        file: progress,
+        threat: () => {
+            liveThreats++;
+            threatsCount.textContent = (parseInt(threatsCount.textContent) || 0) + 1;
+        },
+        done: summary => {
+            const total = parseInt(threatsCount.textContent) || 0;
+            threatsCount.textContent = Math.max(0, total - liveThreats) + (summary.new_threats ?? summary.total_threats ?? 0);
+            const reportsCount = document.getElementById('reportsCount');
+            reportsCount.textContent = (parseInt(reportsCount.textContent) || 0) + 1;
+            document.getElementById('lastAnalysis').textContent = new Date().toLocaleString();
+            remove();
+        },
+        failed: data => {
+            console.error(`Analysis ${job.job_id} failed:`, data.error);
+            remove();
+        },
+        cancelled: remove,
+        error: error => {
+            console.error(`Error following analysis ${job.job_id}:`, error);
+            remove();
+        }
+    });
+}
+
 /**
  * Load dashboard statistics
  */
@@ -330,6 +417,18 @@ function updateChartData(data) {
         window.destIpsChart.update();
     }
     
+    // Unique address estimates of the analysis
+    const uniqueSourceIps = document.getElementById('uniqueSourceIps');
+    if (uniqueSourceIps) {
+        uniqueSourceIps.textContent = data.unique_source_ips != null
+            ? `(~${data.unique_source_ips.toLocaleString()} unique)` : '';
+    }
+    const uniqueDestIps = document.getElementById('uniqueDestIps');
+    if (uniqueDestIps) {
+        uniqueDestIps.textContent = data.unique_dest_ips != null
+            ? `(~${data.unique_dest_ips.toLocaleString()} unique)` : '';
+    }
+    
     // Update Protocols chart
     if (window.protocolsChart && data.protocols && data.protocols.length > 0) {
         window.protocolsChart.data.labels = data.protocols.map(item => item.protocol);
@@ -426,7 +525,6 @@ function setupUploadModal() {
     });
     
     submitUploadBtn.addEventListener('click', function() {
-        const formData = new FormData(uploadForm);
         const uploadStatus = document.getElementById('uploadStatus');
         
         // Validate files
@@ -436,15 +534,29 @@ function setupUploadModal() {
             return;
         }
         
-        // Submit form
+        // Upload the files one after another in chunks
         submitUploadBtn.disabled = true;
         uploadStatus.innerHTML = '<div class="alert alert-info">Uploading files...</div>';
         
-        fetch('/upload_logs', {
-            method: 'POST',
-            body: formData
-        })
-        .then(response => response.json())
+        const files = Array.from(logFiles);
+        const totalBytes = files.reduce((total, file) => total + file.size, 0);
+        let doneBytes = 0;
+        const uploadAll = files.reduce((previous, file) => previous.then(() => {
+            return uploadFileInChunks(file, received => {
+                const percent = totalBytes ? Math.floor((doneBytes + received) * 100 / totalBytes) : 100;
+                uploadStatus.innerHTML = `
+                    <div class="alert alert-info">
+                        Uploading ${file.name} (${formatFileSize(doneBytes + received)} of ${formatFileSize(totalBytes)})...
+                        <div class="progress mt-2"><div class="progress-bar" style="width: ${percent}%"></div></div>
+                    </div>
+                `;
+            }).then(() => {
+                doneBytes += file.size;
+            });
+        }), Promise.resolve());
+        
+        uploadAll
+        .then(() => ({}), error => ({ error: error.message }))
         .then(data => {
             if (data.error) {
                 uploadStatus.innerHTML = `<div class="alert alert-danger">${data.error}</div>`;
@@ -483,11 +595,76 @@ function setupUploadModal() {
     });
 }
 
+/**
+ * Upload a file through the chunked upload endpoints (/uploads).
+ * The file is sent in byte ranges; after a dropped connection the upload
+ * resumes from the bytes the server has received, also when the same file
+ * is chosen again after a page reload. Calls onProgress with the bytes of
+ * the file received so far and resolves with the stored file.
+ */
+function uploadFileInChunks(file, onProgress) {
+    const resumeKey = `upload:${file.name}:${file.size}:${file.lastModified}`;
+    const maxRetries = 5;
+    const json = response => response.json().then(data => {
+        if (!response.ok && response.status !== 409) {
+            const error = new Error(data.error || `HTTP error! Status: ${response.status}`);
+            // Requests that were refused are not retried
+            error.refused = true;
+            throw error;
+        }
+        return data;
+    });
+    const status = uploadId => fetch(`/uploads/${uploadId}`).then(response => response.ok ? response.json() : null);
+    const begin = () => fetch('/uploads', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ filename: file.name, size: file.size })
+    }).then(json);
+    
+    const send = (upload, received, failures) => {
+        if (onProgress) onProgress(received);
+        if (received >= file.size) {
+            return fetch(`/uploads/${upload.upload_id}/finalize`, { method: 'POST' })
+                .then(json)
+                .then(saved => {
+                    localStorage.removeItem(resumeKey);
+                    return saved;
+                });
+        }
+        const end = Math.min(file.size, received + upload.chunk_size);
+        return fetch(`/uploads/${upload.upload_id}`, {
+            method: 'PUT',
+            headers: { 'Content-Range': `bytes ${received}-${end - 1}/${file.size}` },
+            body: file.slice(received, end)
+        })
+        .then(json)
+        // A 409 answer also says where to continue
+        .then(data => send(upload, data.received, 0))
+        .catch(error => {
+            if (error.refused || failures >= maxRetries) throw error;
+            // Wait a little longer after every failure, then ask where to resume
+            return new Promise(resolve => setTimeout(resolve, 1000 * (failures + 1)))
+                .then(() => status(upload.upload_id))
+                .catch(() => null)
+                .then(current => send(upload, current ? current.received : received, failures + 1));
+        });
+    };
+    
+    const savedId = localStorage.getItem(resumeKey);
+    return (savedId ? status(savedId).catch(() => null) : Promise.resolve(null))
+        .then(upload => upload || begin())
+        .then(upload => {
+            localStorage.setItem(resumeKey, upload.upload_id);
+            return send(upload, upload.received, 0);
+        });
+}
+
 /**
  * Format file size in KB, MB etc.
  */
 function formatFileSize(bytes) {
     if (bytes < 1024) return bytes + ' B';
     else if (bytes < 1048576) return (bytes / 1024).toFixed(1) + ' KB';
-    else return (bytes / 1048576).toFixed(1) + ' MB';
+    else if (bytes < 1073741824) return (bytes / 1048576).toFixed(1) + ' MB';
+    else return (bytes / 1073741824).toFixed(1) + ' GB';
 }
@@ -314,7 +314,7 @@ function setupUploadModal() {
             } else {
                 uploadStatus.innerHTML = `
                     <div class="alert alert-success">
-                        ${logFiles.length} file(s) uploaded successfully!
+                        ${logFiles.length} file(s) uploaded successfully! They are being analyzed in the background.
                     </div>
                 `;
                 
@@ -382,9 +382,37 @@ function setupAnalysisModal() {
                     body: formData
                 })
                 .then(response => response.json())
+                .then(job => {
+                    if (job.error) return job;
+                    // The analysis runs in the background; render its progress and threats as they arrive
+                    let progressText = 'Waiting for a free analysis worker...';
+                    const threats = [];
+                    const render = () => {
+                        const latest = threats.slice(-5).reverse().map(threat => `
+                            <li><span class="badge bg-${getSeverityBadgeColor(threat.severity || 'low')}">${threat.severity || 'low'}</span>
+                                ${escapeHtml(threat.rule_name || 'Unknown threat')}
+                                ${threat.line_num ? `<small class="text-muted">line ${threat.line_num}</small>` : ''}</li>
+                        `).join('');
+                        analysisStatus.innerHTML = `
+                            <div class="alert alert-info">
+                                ${progressText}
+                                ${latest ? `<ul class="mb-0 mt-2 list-unstyled">${latest}</ul>` : ''}
+                            </div>
+                        `;
+                    };
+                    render();
+                    return waitForAnalysisJob(job.job_id, status => {
+                        progressText = formatJobProgress(status);
+                        render();
+                    }, threat => {
+                        threats.push(threat);
+                        render();
+                    }).catch(error => ({ error: error.message }));
+                })
                 .then(data => {
                     if (data.error) {
                         analysisStatus.innerHTML = `<div class="alert alert-danger">${data.error}</div>`;
+                        startAnalysisBtn.disabled = false;
                     } else {
                         analysisStatus.innerHTML = `
                             <div class="alert alert-success">
@@ -447,6 +475,20 @@ function checkUrlParams() {
     }
 }
 
+/**
+ * Get badge color based on severity level
+ */
+function getSeverityBadgeColor(severity) {
+    switch (severity.toLowerCase()) {
+        case 'critical': return 'danger';
+        case 'high': return 'warning';
+        case 'medium': return 'info';
+        case 'low': return 'secondary';
+        case 'info': return 'primary';
+        default: return 'secondary';
+    }
+}
+
 /**
  * Escape HTML special characters
  */
@@ -487,6 +487,76 @@ function formatFileSize(bytes) {
     else return (bytes / 1048576).toFixed(1) + ' MB';
 }
 
+/**
+ * Subscribe to the event stream of a background analysis job.
+ * handlers may have status, chunk, file, threat, done, failed, cancelled and
+ * error callbacks; each gets the parsed event data. The stream is closed
+ * after done, failed or cancelled.
+ */
+function subscribeToAnalysisJob(jobId, handlers = {}) {
+    const source = new EventSource(`/jobs/${encodeURIComponent(jobId)}/events`);
+    
+    ['status', 'chunk', 'file', 'threat'].forEach(name => {
+        source.addEventListener(name, event => {
+            if (handlers[name]) handlers[name](JSON.parse(event.data));
+        });
+    });
+    ['done', 'failed', 'cancelled'].forEach(name => {
+        source.addEventListener(name, event => {
+            source.close();
+            if (handlers[name]) handlers[name](JSON.parse(event.data));
+        });
+    });
+    // The browser reconnects by itself unless the job is unknown
+    source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED && handlers.error) {
+            handlers.error(new Error('Lost the connection to the analysis'));
+        }
+    };
+    return source;
+}
+
+/**
+ * Wait for a background analysis job started by /analyze.
+ * Calls onProgress with the job status as chunks and files complete, and
+ * onThreat with every threat as it is found. Resolves with the analysis
+ * summary, or rejects with the error of a failed or cancelled job.
+ */
+function waitForAnalysisJob(jobId, onProgress, onThreat) {
+    return new Promise((resolve, reject) => {
+        let job = { job_id: jobId, status: 'queued', progress: {} };
+        const progress = data => {
+            job = Object.assign({}, job, { status: 'running', progress: data.progress });
+            if (onProgress) onProgress(job);
+        };
+        subscribeToAnalysisJob(jobId, {
+            status: data => {
+                job = data;
+                if (onProgress) onProgress(job);
+            },
+            chunk: progress,
+            file: progress,
+            threat: threat => {
+                if (onThreat) onThreat(threat);
+            },
+            done: resolve,
+            failed: data => reject(new Error(`Analysis failed: ${data.error}`)),
+            cancelled: () => reject(new Error('Analysis was cancelled')),
+            error: reject
+        });
+    });
+}
+
+/**
+ * Describe the progress of an analysis job for status messages
+ */
+function formatJobProgress(job) {
+    if (job.status === 'queued') return 'Waiting for a free analysis worker...';
+    const progress = job.progress || {};
+    return `Analyzed ${progress.files_done || 0} of ${progress.files_total || 0} file(s), ` +
+        `${progress.chunks_done || 0} chunk(s), ${progress.threats || 0} potential threats so far...`;
+}
+
 /**
  * Log activity to be stored in activity logs
  */
@@ -0,0 +1,187 @@
+import re
+from array import array
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+WILDCARD = '<*>'
+
+# Variable parts masked inside a token before it is compared to templates
+_TOKEN_MASKS = [
+    (re.compile(r'\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b'), '<IP>'),
+    (re.compile(r'\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b'), '<UUID>'),
+    (re.compile(r'\b(?:0x[0-9a-fA-F]+|[0-9a-fA-F]{16,})\b'), '<HEX>'),
+    (re.compile(r'\d+(?:\.\d+)?'), '<NUM>'),
+]
+
+
+def mask_tokens(line: str) -> List[str]:
+    """Split a line into whitespace tokens with their variable parts masked."""
+    tokens = []
+    for token in line.split():
+        if any(ch.isdigit() for ch in token):
+            for pattern, replacement in _TOKEN_MASKS:
+                token = pattern.sub(replacement, token)
+        tokens.append(token)
+    return tokens
+
+
+class LogTemplate:
+    __slots__ = ('id', 'tokens', 'count', 'first_line', 'last_line', 'line_nums', 'samples', 'leaf')
+
+    def __init__(self, template_id: int, tokens: List[str], line_num: int, leaf: List[int]):
+        self.id = template_id
+        self.tokens = tokens
+        self.count = 0
+        self.first_line = line_num
+        self.last_line = line_num
+        # Numbers of the lines assigned to this template, up to the miner's max_line_nums
+        self.line_nums = array('q')
+        # First few raw lines as (line_num, tokens) for examples and variable values
+        self.samples: List[Tuple[int, List[str]]] = []
+        # Tree leaf holding this template's id, so eviction can unlink it
+        self.leaf = leaf
+
+    @property
+    def template(self) -> str:
+        return ' '.join(self.tokens)
+
+
+class TemplateMiner:
+    def __init__(self, depth: int = 4, similarity: float = 0.4, max_children: int = 100,
+                 max_templates: int = 5000, max_samples: int = 5, max_line_nums: int = 1000):
+        """Streaming log template miner based on the Drain parse tree.
+
+        Lines are routed by token count and their first ``depth - 2`` tokens
+        to a small list of candidate templates; the line joins the most similar
+        one or starts a new template. The numbers of the lines assigned to a
+        template are kept, so findings on it can point at every line it stands
+        for. Memory is bounded by ``max_templates`` (least recently matched
+        templates are evicted), ``max_samples`` and ``max_line_nums``.
+
+        Args:
+            depth: Depth of the parse tree, including the root and length levels
+            similarity: Fraction of equal tokens needed to join a template
+            max_children: Maximum children per tree node before using a wildcard
+            max_templates: Maximum number of templates kept
+            max_samples: Raw lines kept per template
+            max_line_nums: Line numbers kept per template; ``count`` goes on counting past them
+        """
+        self.depth = max(depth, 3)
+        self.similarity = similarity
+        self.max_children = max_children
+        self.max_templates = max_templates
+        self.max_samples = max_samples
+        self.max_line_nums = max_line_nums
+        self.lines_seen = 0
+        self.evicted = 0
+        self._root: Dict[int, Dict[str, Any]] = {}
+        # Template id -> template, least recently matched first
+        self._templates: "OrderedDict[int, LogTemplate]" = OrderedDict()
+        self._next_id = 1
+
+    def add_line(self, line: str, line_num: Optional[int] = None) -> Optional[int]:
+        """Add a line and return the id of the template it was assigned to."""
+        self.lines_seen += 1
+        if line_num is None:
+            line_num = self.lines_seen
+        raw_tokens = line.split()
+        tokens = mask_tokens(line)
+        if not tokens:
+            return None
+
+        leaf = self._leaf(tokens)
+        template = self._best_match(leaf, tokens)
+        if template is None:
+            template = LogTemplate(self._next_id, tokens, line_num, leaf)
+            self._next_id += 1
+            self._templates[template.id] = template
+            leaf.append(template.id)
+            if len(self._templates) > self.max_templates:
+                self._evict()
+        else:
+            # Positions that differ become variables
+            template.tokens = [t if t == token else WILDCARD for t, token in zip(template.tokens, tokens)]
+            self._templates.move_to_end(template.id)
+
+        template.count += 1
+        template.last_line = line_num
+        if len(template.line_nums) < self.max_line_nums:
+            template.line_nums.append(line_num)
+        if len(template.samples) < self.max_samples:
+            template.samples.append((line_num, raw_tokens))
+        return template.id
+
+    def get(self, template_id: int) -> Optional[LogTemplate]:
+        return self._templates.get(template_id)
+
+    def templates(self) -> List[LogTemplate]:
+        """Templates ordered by the line they first appeared on."""
+        return sorted(self._templates.values(), key=lambda t: t.first_line)
+
+    def summarize(self, max_values: int = 5) -> List[Dict[str, Any]]:
+        """Describe every template with its count, line range, example and variable values."""
+        summary = []
+        for template in self.templates():
+            values: Dict[int, List[str]] = {}
+            for _, raw_tokens in template.samples:
+                if len(raw_tokens) != len(template.tokens):
+                    continue
+                for position, (t, raw) in enumerate(zip(template.tokens, raw_tokens)):
+                    if t == raw:
+                        continue
+                    seen = values.setdefault(position, [])
+                    if raw not in seen and len(seen) < max_values:
+                        seen.append(raw)
+            example_line, example_tokens = template.samples[0]
+            summary.append({
+                'template_id': f"T{template.id}",
+                'template': template.template,
+                'count': template.count,
+                'first_line': template.first_line,
+                'last_line': template.last_line,
+                'example_line_num': example_line,
+                'example': ' '.join(example_tokens),
+                'values': [values[position] for position in sorted(values)],
+            })
+        return summary
+
+    def _leaf(self, tokens: List[str]) -> List[int]:
+        node = self._root.get(len(tokens))
+        if node is None:
+            node = self._root[len(tokens)] = {'children': {}, 'templates': []}
+
+        for token in tokens[:self.depth - 2]:
+            # Tokens with variable parts would explode the tree
+            key = WILDCARD if '<' in token or any(ch.isdigit() for ch in token) else token
+            children = node['children']
+            if key not in children and len(children) >= self.max_children:
+                key = WILDCARD
+            child = children.get(key)
+            if child is None:
+                child = children[key] = {'children': {}, 'templates': []}
+            node = child
+        return node['templates']
+
+    def _best_match(self, leaf: List[int], tokens: List[str]) -> Optional[LogTemplate]:
+        best = None
+        best_score = (-1.0, -1)
+        for template_id in leaf:
+            template = self._templates[template_id]
+            same = 0
+            wildcards = 0
+            for t, token in zip(template.tokens, tokens):
+                if t == WILDCARD:
+                    wildcards += 1
+                elif t == token:
+                    same += 1
+            score = (same / len(tokens), wildcards)
+            if score > best_score:
+                best, best_score = template, score
+        if best is not None and best_score[0] >= self.similarity:
+            return best
+        return None
+
+    def _evict(self) -> None:
+        template_id, template = self._templates.popitem(last=False)
+        template.leaf.remove(template_id)
+        self.evicted += 1
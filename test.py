@@ -2,6 +2,8 @@ import os
 import glob
 from typing import Dict, Any, List, Optional
 from huggingface_hub import InferenceClient
+from llm_cache import ResponseCache, get_default_cache
+from token_budget import DEFAULT_CONTEXT_TOKENS, prompt_budget, truncate_lines
 
 class LogAnalyzer:
     def __init__(self, api_key: str):
@@ -9,6 +11,30 @@ class LogAnalyzer:
         self.client = InferenceClient(provider="nebius", api_key=api_key)
         self.model = "deepseek-ai/DeepSeek-R1"
         self.max_tokens = 500
+        self.context_tokens = DEFAULT_CONTEXT_TOKENS
+        self.cache = get_default_cache()
+
+    def _fit(self, log_content: str, *prompt_texts: str) -> str:
+        """Keep the leading whole lines of the log that fit next to the other prompt texts."""
+        budget = prompt_budget(self.context_tokens, self.max_tokens, *prompt_texts)
+        return truncate_lines(log_content, budget)
+
+    def _complete(self, messages: List[Dict[str, str]], prompt_version: str) -> str:
+        """Return the model response for messages, using the response cache."""
+        key = ResponseCache.make_key(messages[-1]["content"], self.model, prompt_version, self.max_tokens)
+        response = self.cache.get(key)
+        if response is not None:
+            return response
+
+        completion = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=self.max_tokens,
+        )
+        response = completion.choices[0].message.content
+        if response is not None:
+            self.cache.set(key, response, model=self.model, prompt_version=prompt_version)
+        return response
 
     def read_log_file(self, file_path: str) -> str:
         """Read a log file and return its contents as a string."""
@@ -31,24 +57,19 @@ class LogAnalyzer:
     def ask_question(self, log_content: str, question: str) -> Dict[str, Any]:
         """Ask a question about the log content using the model."""
         try:
+            system_prompt = "You are a log analysis assistant. Answer questions about the log content provided, extracting specific information when asked."
             messages = [
                 {
                     "role": "system",
-                    "content": "You are a log analysis assistant. Answer questions about the log content provided, extracting specific information when asked."
+                    "content": system_prompt
                 },
                 {
                     "role": "user",
-                    "content": f"Log content: {log_content[:8000]}\n\nQuestion: {question}"
+                    "content": f"Log content: {self._fit(log_content, system_prompt, question)}\n\nQuestion: {question}"
                 }
             ]
             
-            completion = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                max_tokens=self.max_tokens,
-            )
-            
-            answer = completion.choices[0].message.content
+            answer = self._complete(messages, "question-1")
             return {"answer": answer, "score": 1.0}  # Score not applicable with this API
         except Exception as e:
             return {"error": str(e), "answer": "Failed to process question", "score": 0}
@@ -56,38 +77,35 @@ class LogAnalyzer:
     def summarize_log(self, log_content: str, max_length: int = 150) -> str:
         """Generate a summary of the log file."""
         try:
+            system_prompt = f"You are a log summarization assistant. Provide a concise summary of the log content in about {max_length} words."
             messages = [
                 {
                     "role": "system",
-                    "content": f"You are a log summarization assistant. Provide a concise summary of the log content in about {max_length} words."
+                    "content": system_prompt
                 },
                 {
                     "role": "user",
-                    "content": f"Log content: {log_content[:5000]}"
+                    "content": f"Log content: {self._fit(log_content, system_prompt)}"
                 }
             ]
             
-            completion = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                max_tokens=self.max_tokens,
-            )
-            
-            return completion.choices[0].message.content
+            # The requested length is part of the system prompt
+            return self._complete(messages, f"summary-1-{max_length}")
         except Exception as e:
             return f"Could not generate summary: {str(e)}"
     
     def analyze_sentiment(self, text: str) -> Dict[str, Any]:
         """Analyze sentiment of log entries to detect issues."""
         try:
+            system_prompt = "You are a log analysis assistant that detects issues and sentiment in log files. Classify the log content as POSITIVE if it shows normal operation or NEGATIVE if it contains errors, warnings or issues."
             messages = [
                 {
                     "role": "system",
-                    "content": "You are a log analysis assistant that detects issues and sentiment in log files. Classify the log content as POSITIVE if it shows normal operation or NEGATIVE if it contains errors, warnings or issues."
+                    "content": system_prompt
                 },
                 {
                     "role": "user",
-                    "content": f"Log content: {text[:5000]}"
+                    "content": f"Log content: {self._fit(text, system_prompt)}"
                 }
             ]
             
@@ -1,18 +1,107 @@
 #!/usr/bin/env python3
 import argparse
+import asyncio
+import json
 import os
+import time
 from dotenv import load_dotenv
+from alert import send_discord_threat_details
 from analyzer import LogAnalyzer
+from checkpoints import DEFAULT_CHECKPOINT_DIR, CheckpointStore
+from log_follow import (DEFAULT_POLL_INTERVAL, DEFAULT_WINDOW_BYTES, DEFAULT_WINDOW_SECONDS, LogFollower,
+                        open_watcher)
+from log_sources import find_logs, log_exists, stored_size
+from network_stats import NetworkStats
 from report_generator import generate_report
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Analyze log files for security threats using AI')
-    parser.add_argument('log_files', nargs='+', help='Path to log files to analyze')
+    parser.add_argument('log_files', nargs='+',
+                        help='Log files, directories (searched recursively) or glob patterns to analyze')
     parser.add_argument('--output', default='threat_report.txt', help='Output file for the report')
     parser.add_argument('--format', choices=['txt', 'json', 'html'], default='txt', help='Output format')
     parser.add_argument('--api-key', help='HuggingFace API key (overrides environment variable)')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Files analyzed at once, and chunks analyzed at once within each file')
+    parser.add_argument('--mine-templates', action='store_true',
+                        help='Collapse repetitive lines into templates before they are sent to the model')
+    parser.add_argument('--findings',
+                        help='JSON lines file findings are written to as each file completes '
+                             '(default: the output file with a .jsonl extension)')
+    parser.add_argument('--follow', action='store_true',
+                        help='Keep watching the inputs and analyze lines as they are appended')
+    parser.add_argument('--window-bytes', type=int, default=DEFAULT_WINDOW_BYTES,
+                        help='With --follow, appended bytes that start an analysis early')
+    parser.add_argument('--window-seconds', type=float, default=DEFAULT_WINDOW_SECONDS,
+                        help='With --follow, seconds appended lines wait for more before they are analyzed')
+    parser.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL,
+                        help='With --follow, seconds between checks when inotify is not available')
+    parser.add_argument('--polling', action='store_true', help='With --follow, poll the files instead of using inotify')
+    parser.add_argument('--from-start', action='store_true',
+                        help='With --follow, also analyze what logs without a checkpoint contain already')
+    parser.add_argument('--checkpoint-dir', default=DEFAULT_CHECKPOINT_DIR,
+                        help='With --follow, directory of the checkpoints recording how far logs were analyzed')
     return parser.parse_args()
 
+async def analyze_logs(analyzer, log_files, workers, findings, network_stats):
+    """Analyze ``workers`` files at a time, writing each file's findings to ``findings`` once it completes.
+    
+    Returns the threats of all files in the order of ``log_files``.
+    """
+    semaphore = asyncio.Semaphore(workers)
+    file_results = {}
+    
+    async def analyze(log_file):
+        async with semaphore:
+            threats = await analyzer.analyze_file_async(log_file, network_stats=network_stats)
+        for threat in threats:
+            findings.write(json.dumps(threat, default=str) + '\n')
+        findings.flush()
+        file_results[log_file] = threats
+        print(f"[{len(file_results)}/{len(log_files)}] {log_file}: {len(threats)} potential threats")
+    
+    await asyncio.gather(*(analyze(log_file) for log_file in log_files))
+    return [threat for log_file in log_files for threat in file_results[log_file]]
+
+def follow_logs(args, analyzer, findings_file):
+    """Watch the inputs and analyze appended lines until interrupted.
+    
+    Every window's findings are appended to ``findings_file``, the report is
+    rewritten with all findings of the followed logs, and new findings are
+    sent to the Discord webhook when one is configured.
+    """
+    network_stats = NetworkStats()
+    checkpoints = CheckpointStore(args.checkpoint_dir)
+    watcher = open_watcher(args.log_files, args.poll_interval, args.polling)
+    webhook = os.environ.get("DISCORD_WEBHOOK", "")
+    
+    with open(findings_file, 'a') as findings:
+        def on_findings(log_file, threats, latency):
+            if not threats:
+                return
+            for threat in threats:
+                findings.write(json.dumps(threat, default=str) + '\n')
+            findings.flush()
+            # The report covers everything found in the followed logs so far
+            results = [threat for log in watcher.logs() for threat in checkpoints.load_findings(log)]
+            generate_report(results, args.output, args.format, network_stats.to_dict())
+            if webhook:
+                send_discord_threat_details(webhook, threats)
+            print(f"{log_file}: {len(threats)} new potential threats, "
+                  f"{latency:.1f}s after the lines were written")
+        
+        follower = LogFollower(analyzer, watcher, checkpoints, args.window_bytes, args.window_seconds,
+                               on_findings, network_stats)
+        follower.start(args.from_start)
+        print(f"Following {len(watcher.logs())} logs, writing findings to {findings_file} "
+              f"and the report to {args.output}. Press Ctrl+C to stop.")
+        try:
+            follower.run()
+        except KeyboardInterrupt:
+            print("\nStopped following.")
+        finally:
+            watcher.close()
+
 def main():
     # Load environment variables
     load_dotenv()
@@ -27,25 +116,44 @@ def main():
         return
     
     try:
+        workers = max(1, args.workers)
         # Initialize analyzer with API key
-        analyzer = LogAnalyzer(api_key)
+        analyzer = LogAnalyzer(api_key, max_workers=workers, mine_templates=args.mine_templates)
         
-        # Process each log file
-        results = []
-        for log_file in args.log_files:
-            if not os.path.exists(log_file):
+        # Rotated files given together (app.log app.log.1 app.log.2.gz) are read as one log
+        log_files = []
+        for log_file in find_logs(args.log_files):
+            if not log_exists(log_file):
                 print(f"Warning: Log file '{log_file}' does not exist.")
                 continue
-            
-            print(f"Analyzing {log_file}...")
-            file_results = analyzer.analyze_file(log_file)
-            results.extend(file_results)
+            log_files.append(log_file)
+        
+        findings_file = args.findings or os.path.splitext(args.output)[0] + '.jsonl'
+        if args.follow:
+            follow_logs(args, analyzer, findings_file)
+            return
+        
+        print(f"Analyzing {len(log_files)} log files with {workers} workers, "
+              f"writing findings to {findings_file}...")
+        
+        network_stats = NetworkStats()
+        started = time.perf_counter()
+        with open(findings_file, 'w') as findings:
+            results = analyzer.service.run(analyze_logs(analyzer, log_files, workers, findings, network_stats))
+        elapsed = max(time.perf_counter() - started, 1e-9)
         
         # Generate report
-        generate_report(results, args.output, args.format)
+        generate_report(results, args.output, args.format, network_stats.to_dict())
         print(f"\nAnalysis complete. Found {len(results)} potential threats.")
         print(f"Report saved to {args.output}")
         
+        # Throughput summary
+        megabytes = sum(stored_size(log_file) for log_file in log_files) / (1024 * 1024)
+        service_stats = analyzer.service.stats()
+        print(f"Analyzed {len(log_files)} files ({megabytes:.1f} MB on disk) in {elapsed:.1f}s: "
+              f"{len(log_files) / elapsed:.2f} files/s, {megabytes / elapsed:.2f} MB/s")
+        print(f"Model requests retried: {service_stats['retries']}, throttled: {service_stats['throttled']}")
+        
     except Exception as e:
         print(f"Error: {str(e)}")
 
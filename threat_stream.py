@@ -0,0 +1,147 @@
+import json
+from typing import Dict, Any, List, Optional
+
+THINK_OPEN = '<think>'
+THINK_CLOSE = '</think>'
+FENCE = '```'
+THREATS_KEY = '"threats"'
+
+
+class ThreatStreamParser:
+    def __init__(self):
+        """Incremental parser for threat JSON arriving as a token stream.
+
+        Text is fed as it arrives. A leading ``<think>`` section is skipped,
+        then the JSON is tracked character by character. Brackets in prose are
+        not taken for it: the root must open a ```json fence, or be an array of
+        objects or an object starting with the ``threats`` key. Every object that closes inside the threat list (the root array, or the
+        array under the root object's ``threats`` key) is returned from
+        ``feed`` right away. ``complete`` turns true once the root value has
+        closed, so the rest of the generation can be dropped.
+        """
+        self.text = ''
+        self.complete = False
+        self.threat_count = 0
+        self._position = 0
+        self._in_think = False
+        self._think_checked = False
+        # Containers opened so far: [type, start offset, key the value belongs to]
+        self._stack: List[List[Any]] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._pending_key: Optional[str] = None
+        self._root: Optional[str] = None
+
+    @property
+    def json_started(self) -> bool:
+        return self._root is not None
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """Add streamed text and return the threat objects completed by it."""
+        self.text += text
+        threats: List[Dict[str, Any]] = []
+        if self.complete:
+            return threats
+
+        if not self._skip_think():
+            return threats
+
+        data = self.text
+        position = self._position
+        while position < len(data) and not self.complete:
+            char = data[position]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last_string = data[self._string_start + 1:position]
+            elif self._root is None:
+                # Skip prose and code fences until the JSON starts
+                if char in '[{':
+                    accepted = self._is_root(data, position)
+                    if accepted is None:
+                        # Not enough text yet to tell
+                        break
+                    if accepted:
+                        self._root = char
+                        self._stack.append([char, position, None])
+            elif char == '"':
+                self._in_string = True
+                self._string_start = position
+            elif char == ':':
+                self._pending_key = self._last_string
+            elif char == ',':
+                self._pending_key = None
+            elif char in '[{':
+                self._stack.append([char, position, self._pending_key])
+                self._pending_key = None
+            elif char in ']}':
+                kind, start, key = self._stack.pop()
+                if char == '}' and self._in_threat_list():
+                    threat = self._load(data[start:position + 1])
+                    if threat is not None:
+                        threats.append(threat)
+                if not self._stack:
+                    self.complete = True
+                    if char == '}' and not self.threat_count and not threats:
+                        # A lone object is a single threat unless it wraps a list
+                        root = self._load(data[start:position + 1])
+                        if root is not None and 'threats' not in root:
+                            threats.append(root)
+            position += 1
+
+        self._position = position
+        self.threat_count += len(threats)
+        return threats
+
+    def _skip_think(self) -> bool:
+        """Advance past a leading <think> section; False while still inside it."""
+        if not self._think_checked:
+            stripped = self.text.lstrip()
+            if len(stripped) < len(THINK_OPEN) and THINK_OPEN.startswith(stripped):
+                # Not enough text yet to tell
+                return False
+            self._think_checked = True
+            self._in_think = stripped.startswith(THINK_OPEN)
+        if self._in_think:
+            end = self.text.find(THINK_CLOSE)
+            if end == -1:
+                return False
+            self._in_think = False
+            self._position = max(self._position, end + len(THINK_CLOSE))
+        return True
+
+    @staticmethod
+    def _is_root(data: str, position: int) -> Optional[bool]:
+        """Whether the bracket at ``position`` opens the threat JSON; None if undecided yet."""
+        fence = data.rfind(FENCE, 0, position)
+        if (fence != -1 and data.count(FENCE, 0, position) % 2
+                and data[fence + len(FENCE):position].strip().lower() == 'json'):
+            return True
+        rest = data[position + 1:].lstrip()
+        if data[position] == '[':
+            return rest[0] in '{]' if rest else None
+        if len(rest) < len(THREATS_KEY) and THREATS_KEY.startswith(rest):
+            return None
+        return rest.startswith(THREATS_KEY)
+
+    def _in_threat_list(self) -> bool:
+        """Whether the object that just closed sits directly in the threat list."""
+        if not self._stack or self._stack[-1][0] != '[':
+            return False
+        if len(self._stack) == 1:
+            return True
+        return len(self._stack) == 2 and self._stack[0][0] == '{' and self._stack[-1][2] == 'threats'
+
+    @staticmethod
+    def _load(text: str) -> Optional[Dict[str, Any]]:
+        try:
+            value = json.loads(text)
+        except ValueError:
+            return None
+        return value if isinstance(value, dict) else None
@@ -0,0 +1,191 @@
+import re
+from datetime import date, datetime, timezone
+from functools import lru_cache
+from typing import Dict, Optional, Tuple, Union
+
+_MONTHS = {name: number for number, name in enumerate(
+    [b'Jan', b'Feb', b'Mar', b'Apr', b'May', b'Jun', b'Jul', b'Aug', b'Sep', b'Oct', b'Nov', b'Dec'], 1)}
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# Timestamp layouts a TimestampParser can learn. The first group of each is
+# the part up to the seconds; ISO timestamps may carry a fraction and a zone.
+_LAYOUT_RE = re.compile(
+    rb'(?P<iso>\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2})(?P<fraction>[.,]\d+)?(?P<zone>Z|[+-]\d{2}:?\d{2})?'
+    rb'|(?P<slash>\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2})'
+    rb'|\[(?P<access>\d{2}/[A-Z][a-z]{2}/\d{4}:\d{2}:\d{2}:\d{2} [+-]\d{4})\]'
+    rb'|(?P<syslog>[A-Z][a-z]{2} [ \d]\d \d{2}:\d{2}:\d{2})'
+)
+
+# Length of the seconds-resolution part of every layout, and the separators
+# it must have at fixed positions
+_LENGTHS = {'iso': 19, 'slash': 19, 'access': 26, 'syslog': 15}
+_SEPARATORS = {
+    'iso': ((4, b'-'), (7, b'-'), (13, b':'), (16, b':')),
+    'slash': ((4, b'/'), (7, b'/'), (13, b':'), (16, b':')),
+    'access': ((2, b'/'), (6, b'/'), (11, b':'), (14, b':'), (20, b' ')),
+    'syslog': ((3, b' '), (6, b' '), (9, b':'), (12, b':')),
+}
+
+# Seconds-resolution prefixes remembered by each TimestampParser
+DEFAULT_CACHE_SIZE = 65536
+
+
+@lru_cache(maxsize=4096)
+def _day_seconds(year: int, month: int, day: int) -> int:
+    """Epoch seconds at midnight UTC of a day."""
+    return (date(year, month, day).toordinal() - _EPOCH_ORDINAL) * 86400
+
+
+# Log lines share timestamps, so converted timestamps are memoized
+@lru_cache(maxsize=65536)
+def access_time(stamp: bytes) -> Optional[int]:
+    """Epoch seconds of an access log time such as ``10/Oct/2023:13:55:36 +0000``."""
+    try:
+        seconds = (_day_seconds(int(stamp[7:11]), _MONTHS[stamp[3:6]], int(stamp[0:2]))
+                   + int(stamp[12:14]) * 3600 + int(stamp[15:17]) * 60 + int(stamp[18:20]))
+        zone = stamp[21:26]
+        if len(zone) == 5:
+            offset = int(zone[1:3]) * 3600 + int(zone[3:5]) * 60
+            seconds += -offset if zone[:1] == b'+' else offset
+        return seconds
+    except (KeyError, ValueError):
+        return None
+
+
+@lru_cache(maxsize=65536)
+def stamp_time(fields: Tuple[bytes, ...], year: int) -> Optional[int]:
+    """Epoch seconds of ISO ``(y, mo, d, h, mi, s)`` or syslog ``(month, d, h, mi, s)`` fields."""
+    try:
+        if len(fields) == 6:
+            y, mo, d, h, mi, s = map(int, fields)
+            return _day_seconds(y, mo, d) + h * 3600 + mi * 60 + s
+        month, d, h, mi, s = fields
+        # Syslog leaves out the year
+        return _day_seconds(year, _MONTHS[month], int(d)) + int(h) * 3600 + int(mi) * 60 + int(s)
+    except (KeyError, ValueError):
+        return None
+
+
+@lru_cache(maxsize=65536)
+def text_time(value: str) -> Optional[int]:
+    """Epoch seconds of an ISO 8601 or access log time string (UTC unless it has an offset)."""
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return access_time(value.encode('utf-8', errors='replace'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def isoformat(ts: int) -> str:
+    """ISO 8601 string (UTC) of epoch seconds."""
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+
+def _zone_seconds(zone: bytes) -> int:
+    """Offset of a ``Z``, ``+HH:MM`` or ``+HHMM`` zone to subtract from local time."""
+    if not zone or zone == b'Z':
+        return 0
+    digits = zone[1:].replace(b':', b'')
+    offset = int(digits[0:2]) * 3600 + int(digits[2:4]) * 60
+    return offset if zone[:1] == b'+' else -offset
+
+
+class TimestampParser:
+    def __init__(self, year: Optional[int] = None, cache_size: int = DEFAULT_CACHE_SIZE):
+        """Epoch seconds of the first timestamp in log lines, for one file at a time.
+
+        The layout of the first timestamp found (ISO 8601, ``YYYY/MM/DD``,
+        access log or syslog), its column and the width of any fraction and
+        zone are learned with a regex once. Later lines are sliced at those
+        fixed positions; a line that does not fit is searched again and its
+        layout learned instead. The seconds-resolution prefix (with the zone)
+        of every timestamp is cached once its separators have been checked,
+        so repeated timestamps cost a slice and a dict lookup.
+
+        Args:
+            year: Year of syslog timestamps, which leave it out (default: this year)
+            cache_size: Most prefixes remembered before the cache starts over
+        """
+        self.year = year if year is not None else datetime.now().year
+        self.cache_size = cache_size
+        # (layout, start column, seconds prefix width, fraction width, zone width)
+        self.layout: Optional[Tuple[str, int, int, int, int]] = None
+        self._cache: Dict[Union[str, bytes], int] = {}
+
+    def parse(self, line: Union[str, bytes]) -> Optional[int]:
+        """Epoch seconds of the first timestamp in ``line``, or None."""
+        if self.layout is not None:
+            ts = self._parse_at(line, self.layout)
+            if ts is not None:
+                return ts
+        return self._learn(line)
+
+    def _parse_at(self, line: Union[str, bytes], layout: Tuple[str, int, int, int, int]) -> Optional[int]:
+        name, start, length, fraction, zone = layout
+        if name == 'access':
+            # Client addresses differ in length, the bracket marks the time
+            start = line.find('[' if isinstance(line, str) else b'[', 0, start + 48) + 1
+        key = line[start:start + length]
+        if name == 'iso':
+            # The zone, or the character after the seconds that must not start one
+            tail = start + length + fraction
+            key += line[tail:tail + (zone or 1)]
+        # Only prefixes that passed the checks are cached
+        ts = self._cache.get(key)
+        if ts is not None:
+            return ts
+
+        raw = key.encode('utf-8', errors='replace') if isinstance(key, str) else key
+        if len(raw) != len(key) or len(raw) < length:
+            return None
+        for position, separator in _SEPARATORS[name]:
+            if raw[position:position + 1] != separator:
+                return None
+        if zone:
+            if len(raw) != length + zone or raw[length:length + 1] not in (b'Z', b'+', b'-'):
+                return None
+        elif raw[length:length + 1] in (b'Z', b'+', b'-', b'.', b',') or raw[length:length + 1].isdigit():
+            return None
+
+        ts = self._convert(name, raw[:length + zone])
+        if ts is not None:
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            self._cache[key] = ts
+        return ts
+
+    def _learn(self, line: Union[str, bytes]) -> Optional[int]:
+        match = _LAYOUT_RE.search(line.encode('utf-8', errors='replace') if isinstance(line, str) else line)
+        if match is None:
+            return None
+        for name in _LENGTHS:
+            if match.group(name) is not None:
+                break
+        fraction = zone = 0
+        if name == 'iso':
+            fraction = len(match.group('fraction') or b'')
+            zone = len(match.group('zone') or b'')
+        start = match.start(name)
+        if isinstance(line, str):
+            # Column in the text rather than in its encoding
+            start = len(match.string[:start].decode('utf-8', errors='replace'))
+        layout = (name, start, _LENGTHS[name], fraction, zone)
+        ts = self._parse_at(line, layout)
+        if ts is not None:
+            self.layout = layout
+        return ts
+
+    def _convert(self, name: str, key: bytes) -> Optional[int]:
+        try:
+            if name == 'access':
+                return access_time(key)
+            if name == 'syslog':
+                return stamp_time((key[0:3], key[4:6].strip(), key[7:9], key[10:12], key[13:15]), self.year)
+            seconds = stamp_time((key[0:4], key[5:7], key[8:10], key[11:13], key[14:16], key[17:19]), self.year)
+            if seconds is None:
+                return None
+            return seconds - _zone_seconds(key[19:])
+        except (KeyError, ValueError):
+            return None
@@ -0,0 +1,128 @@
+import os
+import re
+from typing import Iterable, Iterator, List, Tuple
+
+# Context window of the model, in tokens
+DEFAULT_CONTEXT_TOKENS = int(os.environ.get("LLM_CONTEXT_TOKENS", 8192))
+
+# Tokens kept free on top of the estimates, for chat formatting and estimation error
+SAFETY_MARGIN = 128
+MESSAGE_OVERHEAD = 4
+
+# Letters and digits merge into tokens of roughly this many characters; every
+# other printable character tends to be a token of its own
+CHARS_PER_TOKEN = 4
+
+_PUNCTUATION_RE = re.compile(r'[^\w\s]')
+_WHITESPACE_RE = re.compile(r'\s')
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap upper-bound estimate of the number of tokens in ``text``.
+
+    Runs of letters and digits count one token per ``CHARS_PER_TOKEN``
+    characters and punctuation counts one token per character, which is
+    close to how BPE tokenizers treat URLs, paths and query strings.
+    """
+    if not text:
+        return 0
+    punctuation = len(_PUNCTUATION_RE.findall(text))
+    whitespace = len(_WHITESPACE_RE.findall(text))
+    word_chars = len(text) - punctuation - whitespace
+    return -(-word_chars // CHARS_PER_TOKEN) + punctuation + text.count('\n')
+
+
+def prompt_budget(context_tokens: int, max_tokens: int, *fixed_texts: str) -> int:
+    """Tokens left for log content once the fixed prompt parts and the answer fit.
+
+    Args:
+        context_tokens: Context window of the model
+        max_tokens: Tokens reserved for the completion
+        fixed_texts: Prompt text sent with every request (system prompt, intro)
+
+    Returns:
+        int: Token budget for the log content of one request
+    """
+    fixed = sum(estimate_tokens(text) + MESSAGE_OVERHEAD for text in fixed_texts)
+    return max(1, context_tokens - max_tokens - fixed - SAFETY_MARGIN)
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """Cut ``text`` so that its estimate fits ``budget``."""
+    tokens = estimate_tokens(text)
+    while tokens > budget and text:
+        text = text[:max(0, len(text) * budget // tokens - 1)]
+        tokens = estimate_tokens(text)
+    return text
+
+
+def is_continuation(line: str) -> bool:
+    """Whether a line continues the previous record (stack traces, wrapped messages)."""
+    return line[:1] in (' ', '\t') and bool(line.strip())
+
+
+def iter_records(lines: Iterable[str]) -> Iterator[List[str]]:
+    """Group lines into log records: a line plus its continuation lines."""
+    record: List[str] = []
+    for line in lines:
+        if record and not is_continuation(line):
+            yield record
+            record = []
+        record.append(line)
+    if record:
+        yield record
+
+
+def iter_token_chunks(lines: Iterable[str], budget: int, line_offset: int = 0,
+                      max_chars: int = 0) -> Iterator[Tuple[int, str]]:
+    """Pack whole log records into chunks whose estimate fits ``budget`` tokens.
+
+    Yields ``(line_offset, chunk)`` tuples where ``line_offset`` is the number
+    of lines preceding the chunk, counting from the given ``line_offset``. A
+    record larger than the budget is split at line boundaries, and a single
+    line larger than the budget is truncated. ``max_chars`` optionally caps
+    the characters per chunk as well.
+    """
+    buffer: List[str] = []
+    buffer_tokens = 0
+    buffer_chars = 0
+    buffer_start = line_offset
+
+    def fits(tokens, chars):
+        return (buffer_tokens + tokens <= budget
+                and (not max_chars or buffer_chars + chars <= max_chars))
+
+    for record in iter_records(lines):
+        record_tokens = [estimate_tokens(line) for line in record]
+        record_chars = sum(len(line) for line in record)
+        if buffer and not fits(sum(record_tokens), record_chars):
+            yield buffer_start, ''.join(buffer)
+            buffer_start += len(buffer)
+            buffer, buffer_tokens, buffer_chars = [], 0, 0
+
+        for line, tokens in zip(record, record_tokens):
+            if buffer and not fits(tokens, len(line)):
+                # Only records larger than a whole chunk get here
+                yield buffer_start, ''.join(buffer)
+                buffer_start += len(buffer)
+                buffer, buffer_tokens, buffer_chars = [], 0, 0
+            if tokens > budget or (max_chars and len(line) > max_chars):
+                line = truncate_to_tokens(line, budget)
+                if max_chars:
+                    line = line[:max_chars]
+                if not line.endswith('\n'):
+                    line += '\n'
+                tokens = estimate_tokens(line)
+            buffer.append(line)
+            buffer_tokens += tokens
+            buffer_chars += len(line)
+
+    if buffer:
+        yield buffer_start, ''.join(buffer)
+
+
+def truncate_lines(text: str, budget: int) -> str:
+    """Keep the leading whole lines of ``text`` that fit ``budget`` tokens."""
+    for _, chunk in iter_token_chunks(text.splitlines(keepends=True), budget):
+        return chunk
+    return ''
@@ -0,0 +1,388 @@
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+from log_sources import rotation_members
+
+DEFAULT_STORE_DIR = os.environ.get("UPLOAD_STORE_DIR", ".upload_store")
+
+# Uploads are copied and hashed in blocks of this size
+COPY_BLOCK_SIZE = 1024 * 1024
+
+# Largest byte range clients are asked to send per request of a chunked upload
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+# Seconds an unfinished chunked upload is kept after its last byte arrived
+UPLOAD_EXPIRY_SECONDS = int(os.environ.get("UPLOAD_EXPIRY_SECONDS", 24 * 3600))
+
+_UPLOAD_ID_RE = re.compile(r'[0-9a-f]{32}')
+
+
+class UploadNotFound(Exception):
+    """Raised for a chunked upload that is unknown, finished or expired."""
+
+
+class UploadOutOfOrder(Exception):
+    def __init__(self, received: int):
+        """Raised when a byte range starts after the bytes received so far."""
+        super().__init__(f"Expected bytes from offset {received}")
+        self.received = received
+
+
+def hash_file(path: str) -> str:
+    """Hex SHA-256 digest of a file's bytes, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(COPY_BLOCK_SIZE)
+            if not block:
+                return digest.hexdigest()
+            digest.update(block)
+
+
+class UploadStore:
+    def __init__(self, upload_dir: str, store_dir: str = DEFAULT_STORE_DIR):
+        """Content-addressed store behind the upload directory.
+
+        Uploads are hashed while they are written and kept once per content
+        under their SHA-256 digest. The upload directory holds a link to the
+        stored content under the uploaded name (a copy where links are not
+        supported), and a name-to-hash map records which content each name
+        has. Uploading new content under a known name points the name at it;
+        the earlier content stays in the store. Stored content is read-only
+        so that writing through a name cannot change what a hash refers to.
+
+        Large files can be uploaded in byte ranges instead (see
+        ``begin_upload``); they are appended to a partial file and hashed as
+        they arrive, so an interrupted upload resumes where it stopped.
+
+        Findings of analyses are kept per content hash and analysis version
+        (see ``LogAnalyzer.results_version``), so identical content is not
+        analyzed again.
+
+        Args:
+            upload_dir: Directory the uploaded names are linked into
+            store_dir: Directory holding the contents, names and findings
+        """
+        self.upload_dir = upload_dir
+        self.store_dir = store_dir
+        self.path = os.path.join(store_dir, 'names.json')
+        self._lock = threading.Lock()
+        for directory in ('objects', 'analyses', 'tmp'):
+            os.makedirs(os.path.join(store_dir, directory), exist_ok=True)
+        self._names: Dict[str, Dict[str, Any]] = self._load()
+        # Per chunked upload: a lock, and the hash of its partial file so far with the bytes it covers
+        self._upload_locks: Dict[str, threading.Lock] = {}
+        self._upload_hashes: Dict[str, Tuple[int, Any]] = {}
+
+    def save(self, name: str, stream: BinaryIO) -> Dict[str, Any]:
+        """Store an upload read from ``stream`` and link it into the upload directory as ``name``.
+
+        Returns:
+            dict: ``filename``, ``path``, ``hash`` and ``size`` of the upload,
+            whether its content was stored already (``duplicate``) and the
+            ``previous_hash`` of the name if it had other content before
+        """
+        name = os.path.basename(name)
+        tmp_path = os.path.join(self.store_dir, 'tmp', f"{threading.get_ident()}.{os.getpid()}.upload")
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp_path, 'wb') as f:
+                while True:
+                    block = stream.read(COPY_BLOCK_SIZE)
+                    if not block:
+                        break
+                    digest.update(block)
+                    f.write(block)
+                    size += len(block)
+            return self.add(name, tmp_path, digest.hexdigest(), size)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def add(self, name: str, file_path: str, content_hash: str, size: int) -> Dict[str, Any]:
+        """Move a file whose hash is known into the store and link it as ``name``.
+
+        ``file_path`` is consumed (removed if its content is already stored).
+        Returns the same details as ``save``.
+        """
+        name = os.path.basename(name)
+        object_path = self._object_path(content_hash)
+        duplicate = os.path.exists(object_path)
+        if duplicate:
+            os.remove(file_path)
+        else:
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            os.chmod(file_path, 0o444)
+            os.replace(file_path, object_path)
+
+        path = os.path.join(self.upload_dir, name)
+        self._link(object_path, path)
+        with self._lock:
+            previous = self._names.get(name, {}).get('hash')
+            self._names[name] = dict(self._stat(path), hash=content_hash, stored=datetime.now().isoformat())
+            self._save()
+        return {
+            'filename': name,
+            'path': path,
+            'hash': content_hash,
+            'size': size,
+            'duplicate': duplicate,
+            'previous_hash': previous if previous != content_hash else None,
+        }
+
+    def begin_upload(self, name: str, size: int) -> Dict[str, Any]:
+        """Start a chunked upload of ``size`` bytes to be stored as ``name``.
+
+        Returns:
+            dict: ``upload_id``, ``filename``, ``size``, bytes ``received``
+            so far and the ``chunk_size`` to send per request
+        """
+        if size < 0:
+            raise ValueError("The upload size cannot be negative")
+        self._expire_uploads()
+        upload_id = uuid.uuid4().hex
+        upload = {'filename': os.path.basename(name), 'size': size, 'created': datetime.now().isoformat()}
+        open(self._part_path(upload_id), 'wb').close()
+        with open(self._upload_path(upload_id), 'w', encoding='utf-8') as f:
+            json.dump(upload, f)
+        return self.upload_status(upload_id)
+
+    def upload_status(self, upload_id: str) -> Dict[str, Any]:
+        """Details of a chunked upload as in ``begin_upload``; ``received`` says where to resume.
+
+        Raises:
+            UploadNotFound: The upload is unknown, finished or expired
+        """
+        upload = self._load_upload(upload_id)
+        return dict(upload, upload_id=upload_id, received=os.path.getsize(self._part_path(upload_id)),
+                    chunk_size=UPLOAD_CHUNK_SIZE)
+
+    def write_range(self, upload_id: str, start: int, stream: BinaryIO) -> int:
+        """Append the bytes of ``stream``, which start at offset ``start``, to a chunked upload.
+
+        Bytes before what was received already are skipped, so a range can
+        be sent again when its response was lost. The stream is read in
+        blocks and never held in memory.
+
+        Returns:
+            int: Bytes received so far
+
+        Raises:
+            UploadNotFound: The upload is unknown, finished or expired
+            UploadOutOfOrder: ``start`` lies beyond the bytes received so far
+            ValueError: The range runs past the size given to ``begin_upload``
+        """
+        with self._upload_lock(upload_id):
+            upload = self._load_upload(upload_id)
+            part_path = self._part_path(upload_id)
+            received = os.path.getsize(part_path)
+            if start > received:
+                raise UploadOutOfOrder(received)
+            _, digest = self._upload_digest(upload_id, received)
+            skip = received - start
+            with open(part_path, 'ab') as f:
+                while True:
+                    block = stream.read(COPY_BLOCK_SIZE)
+                    if not block:
+                        break
+                    if skip:
+                        skipped = min(skip, len(block))
+                        block = block[skipped:]
+                        skip -= skipped
+                    if received + len(block) > upload['size']:
+                        raise ValueError(f"The upload is larger than the announced {upload['size']} bytes")
+                    f.write(block)
+                    digest.update(block)
+                    received += len(block)
+                    self._upload_hashes[upload_id] = (received, digest)
+            return received
+
+    def finish_upload(self, upload_id: str, expected_hash: Optional[str] = None) -> Dict[str, Any]:
+        """Store a completely received chunked upload and link it in (see ``save``).
+
+        Raises:
+            UploadNotFound: The upload is unknown, finished or expired
+            ValueError: Bytes are missing, or the content does not have ``expected_hash``
+        """
+        with self._upload_lock(upload_id):
+            upload = self._load_upload(upload_id)
+            part_path = self._part_path(upload_id)
+            received = os.path.getsize(part_path)
+            if received != upload['size']:
+                raise ValueError(f"Received {received} of {upload['size']} bytes")
+            _, digest = self._upload_digest(upload_id, received)
+            content_hash = digest.hexdigest()
+            if expected_hash and expected_hash.lower() != content_hash:
+                raise ValueError(f"The uploaded content has hash {content_hash}, not {expected_hash}")
+            saved = self.add(upload['filename'], part_path, content_hash, received)
+            self._forget_upload(upload_id)
+            return saved
+
+    def abort_upload(self, upload_id: str) -> None:
+        """Discard a chunked upload and what was received of it."""
+        with self._upload_lock(upload_id):
+            self._load_upload(upload_id)
+            self._forget_upload(upload_id)
+
+    def file_hash(self, path: str) -> str:
+        """Hash of a file in the upload directory, from the name map while the file is unchanged."""
+        name = os.path.basename(path)
+        stats = self._stat(path)
+        with self._lock:
+            entry = self._names.get(name)
+            if entry is not None and all(entry.get(field) == value for field, value in stats.items()):
+                return entry['hash']
+        # Not uploaded through the store, or changed since
+        content_hash = hash_file(path)
+        with self._lock:
+            self._names[name] = dict(stats, hash=content_hash, stored=datetime.now().isoformat())
+            self._save()
+        return content_hash
+
+    def log_hash(self, log_file: str) -> str:
+        """Hash of a log; a rotated series is identified by the names and hashes of its members."""
+        members = rotation_members(log_file)
+        if members == [log_file]:
+            return self.file_hash(log_file)
+        digest = hashlib.sha256()
+        for member in members:
+            digest.update(f"{os.path.basename(member)}:{self.file_hash(member)}\n".encode('utf-8'))
+        return digest.hexdigest()
+
+    def get_findings(self, content_hash: str, version: str) -> Optional[List[Dict[str, Any]]]:
+        """Findings of an earlier analysis of the content with the same version, or None."""
+        try:
+            with open(self._findings_path(content_hash, version), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_findings(self, content_hash: str, version: str, threats: List[Dict[str, Any]]) -> None:
+        """Remember the findings of an analysis of the content."""
+        path = self._findings_path(content_hash, version)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(threats, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error saving findings for {content_hash}: {e}")
+
+    def _upload_lock(self, upload_id: str) -> threading.Lock:
+        if not _UPLOAD_ID_RE.fullmatch(upload_id):
+            raise UploadNotFound(upload_id)
+        with self._lock:
+            return self._upload_locks.setdefault(upload_id, threading.Lock())
+
+    def _load_upload(self, upload_id: str) -> Dict[str, Any]:
+        if not _UPLOAD_ID_RE.fullmatch(upload_id):
+            raise UploadNotFound(upload_id)
+        try:
+            with open(self._upload_path(upload_id), 'r', encoding='utf-8') as f:
+                upload = json.load(f)
+            os.stat(self._part_path(upload_id))
+        except (OSError, ValueError):
+            raise UploadNotFound(upload_id)
+        return upload
+
+    def _upload_digest(self, upload_id: str, received: int) -> Tuple[int, Any]:
+        """Hash of the first ``received`` bytes of an upload's partial file.
+
+        Kept in memory as the bytes arrive; after a restart the partial file
+        is hashed again once.
+        """
+        hashed, digest = self._upload_hashes.get(upload_id, (0, None))
+        if digest is None or hashed != received:
+            digest = hashlib.sha256()
+            with open(self._part_path(upload_id), 'rb') as f:
+                remaining = received
+                while remaining > 0:
+                    block = f.read(min(COPY_BLOCK_SIZE, remaining))
+                    if not block:
+                        break
+                    digest.update(block)
+                    remaining -= len(block)
+            self._upload_hashes[upload_id] = (received, digest)
+        return received, digest
+
+    def _forget_upload(self, upload_id: str) -> None:
+        for path in (self._part_path(upload_id), self._upload_path(upload_id)):
+            if os.path.exists(path):
+                os.remove(path)
+        self._upload_hashes.pop(upload_id, None)
+        with self._lock:
+            self._upload_locks.pop(upload_id, None)
+
+    def _expire_uploads(self) -> None:
+        """Remove chunked uploads that have not received bytes for ``UPLOAD_EXPIRY_SECONDS``."""
+        cutoff = time.time() - UPLOAD_EXPIRY_SECONDS
+        directory = os.path.join(self.store_dir, 'tmp')
+        for name in os.listdir(directory):
+            upload_id, extension = os.path.splitext(name)
+            if extension != '.part':
+                continue
+            try:
+                expired = os.path.getmtime(os.path.join(directory, name)) < cutoff
+            except OSError:
+                continue
+            if expired:
+                with self._upload_lock(upload_id):
+                    self._forget_upload(upload_id)
+
+    def _link(self, object_path: str, path: str) -> None:
+        """Point ``path`` at stored content, replacing whatever it was."""
+        try:
+            # Renaming a link over another link to the same content would do nothing
+            if os.path.samefile(object_path, path):
+                return
+        except OSError:
+            pass
+        tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{threading.get_ident()}.tmp")
+        try:
+            os.link(object_path, tmp_path)
+        except OSError:
+            # Another file system, or links are not supported
+            shutil.copyfile(object_path, tmp_path)
+        os.replace(tmp_path, path)
+
+    def _upload_path(self, upload_id: str) -> str:
+        return os.path.join(self.store_dir, 'tmp', f"{upload_id}.json")
+
+    def _part_path(self, upload_id: str) -> str:
+        return os.path.join(self.store_dir, 'tmp', f"{upload_id}.part")
+
+    def _object_path(self, content_hash: str) -> str:
+        # Two-level fan-out keeps directories small
+        return os.path.join(self.store_dir, 'objects', content_hash[:2], content_hash)
+
+    def _findings_path(self, content_hash: str, version: str) -> str:
+        return os.path.join(self.store_dir, 'analyses', content_hash[:2], f"{content_hash}-{version}.json")
+
+    @staticmethod
+    def _stat(path: str) -> Dict[str, int]:
+        stats = os.stat(path)
+        return {'size': stats.st_size, 'mtime_ns': stats.st_mtime_ns, 'inode': stats.st_ino}
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self) -> None:
+        tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._names, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Error saving upload names: {e}")
@@ -0,0 +1,367 @@
+from array import array
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+from log_parsers import NO_TIME, LogParser, RecordBatch
+
+# Rate-based rules that no single line can show. Every detector counts the
+# lines of one ``event`` per ``key`` (a field of the parsed line) and fires
+# when ``threshold`` of them fall within ``window`` seconds. With ``distinct``
+# it counts different values of that field instead, e.g. distinct ports per
+# source IP. Events are:
+#   failed_login - failed authentication (sshd/PAM messages, HTTP 401)
+#   request      - any HTTP request in an access log
+#   not_found    - HTTP request answered with 404
+#   connection   - firewall line with a destination port
+DEFAULT_DETECTORS = [
+    {
+        'id': 'RATE-001',
+        'name': 'Brute Force Login',
+        'severity': 'high',
+        'category': 'authentication',
+        'event': 'failed_login',
+        'key': 'ip',
+        'threshold': 10,
+        'window': 60,
+        'description': 'Many failed logins from one source within a short time',
+        'remediation': 'Block or rate limit the source and check whether any login from it succeeded',
+    },
+    {
+        'id': 'RATE-002',
+        'name': 'Password Spraying',
+        'severity': 'high',
+        'category': 'authentication',
+        'event': 'failed_login',
+        'key': 'ip',
+        'distinct': 'user',
+        'threshold': 5,
+        'window': 300,
+        'description': 'Failed logins for many different accounts from one source',
+        'remediation': 'Block the source and enforce lockout or MFA on the targeted accounts',
+    },
+    {
+        'id': 'RATE-003',
+        'name': 'Distributed Brute Force',
+        'severity': 'high',
+        'category': 'authentication',
+        'event': 'failed_login',
+        'key': 'user',
+        'distinct': 'ip',
+        'threshold': 5,
+        'window': 300,
+        'description': 'Failed logins for one account from many different sources',
+        'remediation': 'Lock or protect the account with MFA and review the sources involved',
+    },
+    {
+        'id': 'RATE-004',
+        'name': 'Port Scan',
+        'severity': 'medium',
+        'category': 'reconnaissance',
+        'event': 'connection',
+        'key': 'ip',
+        'distinct': 'port',
+        'threshold': 15,
+        'window': 60,
+        'description': 'Connections from one source to many different ports',
+        'remediation': 'Block the source at the firewall and check for exposed services',
+    },
+    {
+        'id': 'RATE-005',
+        'name': 'Web Path Scanning',
+        'severity': 'medium',
+        'category': 'reconnaissance',
+        'event': 'not_found',
+        'key': 'ip',
+        'distinct': 'path',
+        'threshold': 20,
+        'window': 60,
+        'description': 'Requests from one source for many different missing paths',
+        'remediation': 'Block the source or put the site behind a WAF rule for content discovery tools',
+    },
+    {
+        'id': 'RATE-006',
+        'name': 'Request Flood',
+        'severity': 'high',
+        'category': 'availability',
+        'event': 'request',
+        'key': 'ip',
+        'threshold': 600,
+        'window': 60,
+        'description': 'Unusually many requests from one source, possibly part of a DoS attack',
+        'remediation': 'Rate limit the source and check the service for degraded availability',
+    },
+]
+
+# Rows of a RecordBatch that are events of each kind
+_EVENTS = {
+    'failed_login': lambda batch: batch.where(failed=True),
+    'request': lambda batch: batch.present('path'),
+    'not_found': lambda batch: batch.where(status=404),
+    'connection': lambda batch: batch.present('port'),
+}
+
+
+class SlidingWindow:
+    def __init__(self, detector: Dict[str, Any], max_keys: int = 10000):
+        """Per-key sliding window counts for one detector, in bounded memory.
+
+        Keys are kept in order of their last event so that idle keys expire
+        from the front, and the least recently seen key is dropped once
+        ``max_keys`` are tracked. A key holds at most ``threshold`` times
+        (or distinct values) however busy it is.
+
+        Args:
+            detector: Detector dictionary in the format of DEFAULT_DETECTORS
+            max_keys: Most keys tracked at once
+        """
+        self.detector = detector
+        self.window = detector['window']
+        self.threshold = detector['threshold']
+        self.distinct = detector.get('distinct')
+        self.max_keys = max_keys
+        # key -> [last time, times or {value: last time}, open alert, alert expiry]
+        self.keys: 'OrderedDict[Any, List[Any]]' = OrderedDict()
+        self._expired_at = None
+
+    def add(self, key: Any, value: Any, timestamp: int) -> Tuple[bool, List[Any]]:
+        """Count one event; returns whether it crossed the threshold, and the key state."""
+        if timestamp != self._expired_at:
+            self._expire(timestamp)
+        state = self.keys.get(key)
+        if state is None:
+            if len(self.keys) >= self.max_keys:
+                self.keys.popitem(last=False)
+            state = [timestamp, OrderedDict() if self.distinct else deque(maxlen=self.threshold), None, 0]
+            self.keys[key] = state
+        else:
+            self.keys.move_to_end(key)
+            state[0] = max(state[0], timestamp)
+
+        seen = state[1]
+        horizon = timestamp - self.window
+        if self.distinct:
+            seen[value] = timestamp
+            seen.move_to_end(value)
+            while seen and next(iter(seen.values())) < horizon:
+                seen.popitem(last=False)
+            if len(seen) > self.threshold:
+                seen.popitem(last=False)
+            crossed = len(seen) >= self.threshold
+        else:
+            seen.append(timestamp)
+            crossed = len(seen) >= self.threshold and seen[0] >= horizon
+        return crossed, state
+
+    def _expire(self, timestamp: int) -> None:
+        """Drop keys without events in the last window."""
+        self._expired_at = timestamp
+        horizon = timestamp - self.window
+        while self.keys:
+            state = next(iter(self.keys.values()))
+            if state[0] >= horizon:
+                break
+            self.keys.popitem(last=False)
+
+
+class SlidingWindowEngine:
+    def __init__(self, detectors: Optional[List[Dict[str, Any]]] = None,
+                 max_keys: int = 10000, max_threats: int = 1000):
+        """Stateful detectors for rate-based threats over a stream of log lines.
+
+        Lines are parsed for their timestamp, source IP, user and request
+        fields, and counted per key in sliding windows. One threat is raised
+        per burst: while the key stays above the threshold its ``count`` and
+        ``last_seen`` keep growing instead of raising more threats.
+
+        Args:
+            detectors: Detector dictionaries in the format of DEFAULT_DETECTORS
+            max_keys: Most keys each detector tracks at once
+            max_threats: Stop reporting after this many threats per file
+        """
+        self.detectors = detectors if detectors is not None else DEFAULT_DETECTORS
+        self.max_keys = max_keys
+        self.max_threats = max_threats
+
+    def scan_file(self, log_file: str, start: int = 0, end: Optional[int] = None,
+                  first_line: int = 1) -> List[Dict[str, Any]]:
+        """Run the detectors over a file, or over a byte range of it that starts at a line."""
+        try:
+            return self.scan_batches(LogParser().parse_file(log_file, start, end, first_line), log_file)
+        except Exception as e:
+            print(f"Error running window detectors on {log_file}: {str(e)}")
+            return []
+
+    def scan_lines(self, lines: Iterable[bytes], log_file: str, base_offset: int = 0,
+                   first_line: int = 1) -> List[Dict[str, Any]]:
+        """Run the detectors over lines (as bytes, with their line endings)."""
+        return self.scan_batches(LogParser().parse_lines(lines, first_line, base_offset), log_file)
+
+    def scan_batches(self, batches: Iterable[RecordBatch], log_file: str) -> List[Dict[str, Any]]:
+        """Run the detectors over parsed lines and return their threats.
+
+        Every detector works through the rows of its event in a batch, found
+        on the columns, and reads its key and distinct values by row. A line
+        without a timestamp takes that of the line before it.
+
+        Args:
+            batches: Parsed lines of the log, in order (see ``LogParser``)
+            log_file: File name recorded in the threats
+
+        Returns:
+            list: Threat dictionaries with the ``key`` that crossed the
+            threshold, ``count`` of events and ``first_seen``/``last_seen``
+        """
+        scan = self.start_scan(log_file)
+        for batch in batches:
+            scan.add(batch)
+        return scan.finish()
+
+    def start_scan(self, log_file: str, state: Optional[Dict[str, Any]] = None) -> 'WindowScan':
+        """Start a scan that is fed parsed lines one batch at a time, e.g. while they are read for another use.
+
+        With ``state`` (see ``WindowScan.state``) the scan continues an
+        earlier one over the lines before, e.g. those of the last window.
+        """
+        return WindowScan(self, log_file, state)
+
+    @staticmethod
+    def _fill_times(ts: array, last_time: int) -> Tuple[array, int]:
+        """Timestamps with gaps filled from the line before; also returns the last one."""
+        times = array('q', ts)
+        for row, timestamp in enumerate(times):
+            if timestamp == NO_TIME:
+                times[row] = last_time
+            else:
+                last_time = timestamp
+        return times, last_time
+
+    @staticmethod
+    def _make_threat(window: SlidingWindow, key: Any, state: List[Any], line: bytes, line_num: int,
+                     byte_offset: int, log_file: str) -> Dict[str, Any]:
+        detector = window.detector
+        seen = state[1]
+        times = list(seen.values()) if window.distinct else list(seen)
+        line_text = line.rstrip(b'\r\n').decode('utf-8', errors='replace')
+        return {
+            'rule_id': detector['id'],
+            'rule_name': detector['name'],
+            'severity': detector['severity'],
+            'category': detector.get('category', ''),
+            'line': line_text,
+            'line_num': line_num,
+            'byte_offset': byte_offset,
+            'file': log_file,
+            'matched': line_text,
+            'key_field': detector['key'],
+            'key': str(key),
+            'count': len(times),
+            'window_seconds': window.window,
+            'first_seen': min(times),
+            'last_seen': max(times),
+            'timestamp': datetime.now().isoformat(),
+            'description': detector.get('description', ''),
+            'remediation': detector.get('remediation', ''),
+        }
+
+
+class WindowScan:
+    def __init__(self, engine: SlidingWindowEngine, log_file: str, state: Optional[Dict[str, Any]] = None):
+        """State of the detectors of ``engine`` over one log (see ``SlidingWindowEngine.scan_batches``).
+
+        Args:
+            engine: Engine whose detectors and limits are used
+            log_file: File name recorded in the threats
+            state: State of an earlier scan of the log to continue, as returned by ``state``
+        """
+        self.engine = engine
+        self.log_file = log_file
+        self.windows = [SlidingWindow(detector, engine.max_keys) for detector in engine.detectors]
+        self.threats: List[Dict[str, Any]] = []
+        self.last_time = NO_TIME
+        if state is not None:
+            self._restore(state)
+
+    def add(self, batch: RecordBatch) -> None:
+        """Run the detectors over the next batch of parsed lines."""
+        engine = self.engine
+        threats = self.threats
+        times, self.last_time = engine._fill_times(batch.ts, self.last_time)
+        for window in self.windows:
+            detector = window.detector
+            key_of = batch.getter(detector['key'])
+            value_of = batch.getter(window.distinct) if window.distinct else None
+            for row in _EVENTS[detector['event']](batch):
+                timestamp = times[row]
+                key = key_of(row)
+                if timestamp == NO_TIME or key is None:
+                    continue
+                value = None
+                if value_of is not None:
+                    value = value_of(row)
+                    if value is None:
+                        continue
+                crossed, state = window.add(key, value, timestamp)
+                alert = state[2]
+                if alert is not None and timestamp <= state[3]:
+                    # Still the same burst
+                    alert['count'] += 1
+                    alert['last_seen'] = max(alert['last_seen'], timestamp)
+                    state[3] = timestamp + window.window
+                elif crossed and len(threats) < engine.max_threats:
+                    alert = engine._make_threat(window, key, state, batch.lines[row], batch.line_num[row],
+                                                batch.offset[row], self.log_file)
+                    threats.append(alert)
+                    state[2] = alert
+                    state[3] = timestamp + window.window
+
+    def finish(self) -> List[Dict[str, Any]]:
+        """Threats of the scan, once all lines were added."""
+        # Copies, since the open bursts keep counting in the originals (see ``state``)
+        threats = [dict(threat) for threat in sorted(self.threats, key=lambda threat: threat['line_num'])]
+        for threat in threats:
+            threat['first_seen'] = datetime.fromtimestamp(threat['first_seen'], timezone.utc).isoformat()
+            threat['last_seen'] = datetime.fromtimestamp(threat['last_seen'], timezone.utc).isoformat()
+            threat['description'] = (f"{threat['description']}: {threat['count']} events from "
+                                     f"{threat['key_field']} {threat['key']} between {threat['first_seen']} "
+                                     f"and {threat['last_seen']}")
+        return threats
+
+    def state(self) -> Dict[str, Any]:
+        """JSON-serializable state of the detectors, to continue the scan on lines added later.
+
+        Keys without events in the last window of their detector are left
+        out. An open burst keeps its count and end, so a later scan that
+        continues it does not report the threat again.
+        """
+        windows = {}
+        for window in self.windows:
+            if self.last_time != NO_TIME:
+                window._expire(self.last_time)
+            horizon = self.last_time - window.window
+            keys = []
+            for key, (last_time, seen, alert, burst_end) in window.keys.items():
+                if window.distinct:
+                    seen = [[value, timestamp] for value, timestamp in seen.items()]
+                else:
+                    seen = [timestamp for timestamp in seen if timestamp >= horizon]
+                burst = None if alert is None else [alert['count'], alert['last_seen'], burst_end]
+                keys.append([key, last_time, seen, burst])
+            windows[window.detector['id']] = keys
+        return {'last_time': self.last_time, 'windows': windows}
+
+    def _restore(self, state: Dict[str, Any]) -> None:
+        """Load the key states saved by ``state``."""
+        self.last_time = state.get('last_time', NO_TIME)
+        saved = state.get('windows', {})
+        for window in self.windows:
+            for key, last_time, seen, burst in saved.get(window.detector['id'], []):
+                if window.distinct:
+                    seen = OrderedDict((value, timestamp) for value, timestamp in seen)
+                else:
+                    seen = deque(seen, maxlen=window.threshold)
+                alert, burst_end = None, 0
+                if burst is not None:
+                    # Its threat was reported by the earlier scan
+                    count, last_seen, burst_end = burst
+                    alert = {'count': count, 'last_seen': last_seen}
+                window.keys[key] = [last_time, seen, alert, burst_end]